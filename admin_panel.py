@@ -7,9 +7,12 @@ import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, simpledialog, filedialog
 import threading
 import json
-from datetime import datetime
+import time
 import keyboard
 from pynput import mouse
+from exam_sessions import format_report
+from log_export import ExportCancelled
+from log_severity import HIGH
 
 class AdminPanel:
     def __init__(self, db_manager, security_manager, parent_window):
@@ -22,6 +25,9 @@ class AdminPanel:
         self.detecting_mouse = False
         self.detected_key = None
         self.mouse_listener = None
+        self._feed_cursor = None
+        self._feed_update_pending = False
+        self._export_job = None
 
         self.window = tk.Toplevel()
         self.window.title("Exam Shield Premium - Admin Panel v2.0")
@@ -38,6 +44,8 @@ class AdminPanel:
         self.setup_window()
         self.setup_ui()
         self.start_auto_refresh()
+        self.update_activity_feed()
+        self.db_manager.subscribe(self._on_logs_committed)
 
     def setup_window(self):
         self.window.update_idletasks()
@@ -203,24 +211,44 @@ class AdminPanel:
         sb = ttk.Scrollbar(content, orient=tk.VERTICAL, command=self.activity_tree.yview); self.activity_tree.configure(yscrollcommand=sb.set)
         self.activity_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=20, pady=20); sb.pack(side=tk.RIGHT, fill=tk.Y, padx=(0,20), pady=20)
 
+    FEED_MAX_ROWS = 200
+    # Feed labels for the severity stored with each event (log_severity LOW, MEDIUM, HIGH)
+    SEVERITY_LABELS = ("🟢 LOW", "🟡 MED", "🔴 HIGH")
+
     def update_activity_feed(self):
+        self._feed_update_pending = False
         try:
-            for item in self.activity_tree.get_children():
-                self.activity_tree.delete(item)
-            logs = self.db_manager.get_activity_logs(20)
-            for log in logs:
-                action, details, timestamp, blocked = log
+            if self._feed_cursor is None:
+                # First fill: newest 20 events, then stream everything after them
+                rows, _ = self.db_manager.query_activity_logs(20)
+                rows = [row[:5] + (row[6], row[7], row[9]) for row in reversed(rows)]
+                self._feed_cursor = rows[-1][0] if rows else self.db_manager.latest_log_id()
+            else:
+                rows = []
+                while True:
+                    batch, self._feed_cursor = self.db_manager.tail_activity_logs(self._feed_cursor, self.FEED_MAX_ROWS)
+                    rows = (rows + batch)[-self.FEED_MAX_ROWS:]
+                    if len(batch) < self.FEED_MAX_ROWS: break
+            for log_id, action, details, timestamp, blocked, count, severity, epoch in rows:
                 status = "🚫 BLOCKED" if blocked else "✅ ALLOWED"
-                if blocked or "SUSPICIOUS" in action: severity = "🔴 HIGH"
-                elif "BLOCKED" in action: severity = "🟡 MED"
-                else: severity = "🟢 LOW"
-                try:
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    time_str = dt.strftime("%H:%M:%S")
-                except: time_str = timestamp
-                self.activity_tree.insert("", 0, values=(time_str, severity, action, details or "No details", status))
+                if count > 1: status += f" ×{count}"
+                time_str = time.strftime("%H:%M:%S", time.localtime(epoch)) if epoch is not None else timestamp
+                self.activity_tree.insert("", 0, values=(time_str, self.SEVERITY_LABELS[severity], action, details or "No details", status))
+            children = self.activity_tree.get_children()
+            if len(children) > self.FEED_MAX_ROWS:
+                self.activity_tree.delete(*children[self.FEED_MAX_ROWS:])
         except Exception: pass
 
+    def _on_logs_committed(self, last_id):
+        # Runs on the log writer thread: hand off to Tk and collapse bursts into one refresh
+        if self._feed_update_pending:
+            return
+        self._feed_update_pending = True
+        try:
+            self.window.after(0, self.update_activity_feed)
+        except Exception:
+            self._feed_update_pending = False
+
     # ===== SETTINGS TAB =====
     def create_settings_tab(self):
         frame = ttk.Frame(self.notebook)
@@ -238,22 +266,75 @@ class AdminPanel:
         tk.Label(header, text="🔧 Advanced Settings", font=("Segoe UI", 12, "bold"), bg=self.colors['success'], fg=self.colors['card']).pack(pady=10)
         content = tk.Frame(settings_card, bg=self.colors['card']); content.pack(fill=tk.X, padx=15, pady=15)
         
-        self.auto_start_var = tk.BooleanVar()
+        selective = self.security_manager.selective_blocking
+        self.auto_start_var = tk.BooleanVar(value=bool(self.db_manager.get_setting('auto_start_lockdown', False)))
         tk.Checkbutton(content, text="Auto-start lockdown mode on login", variable=self.auto_start_var, font=("Segoe UI", 10), bg=self.colors['card'], fg=self.colors['text_primary'], selectcolor=self.colors['card'], activebackground=self.colors['card']).pack(anchor=tk.W)
-        self.window_protection_var = tk.BooleanVar(value=True)
+        self.window_protection_var = tk.BooleanVar(value=selective.get('windows', True))
         tk.Checkbutton(content, text="Enable aggressive window protection", variable=self.window_protection_var, font=("Segoe UI", 10), bg=self.colors['card'], fg=self.colors['text_primary'], selectcolor=self.colors['card'], activebackground=self.colors['card']).pack(anchor=tk.W)
-        self.process_monitoring_var = tk.BooleanVar(value=True)
+        self.process_monitoring_var = tk.BooleanVar(value=selective.get('processes', True))
         tk.Checkbutton(content, text="Enable unauthorized process termination", variable=self.process_monitoring_var, font=("Segoe UI", 10), bg=self.colors['card'], fg=self.colors['text_primary'], selectcolor=self.colors['card'], activebackground=self.colors['card']).pack(anchor=tk.W)
         tk.Button(content, text="💾 Save All Settings", command=self.save_settings, bg=self.colors['primary'], fg=self.colors['card'], font=("Segoe UI", 11, "bold"), relief=tk.FLAT, cursor='hand2', padx=20, pady=10).pack(pady=(15,0))
+
+        # Database storage
+        storage_card = tk.Frame(inner, bg=self.colors['card']); storage_card.pack(fill=tk.X, padx=10, pady=10)
+        header = tk.Frame(storage_card, bg=self.colors['info'], height=40); header.pack(fill=tk.X); header.pack_propagate(False)
+        tk.Label(header, text="🗄️ Database Storage", font=("Segoe UI", 12, "bold"), bg=self.colors['info'], fg=self.colors['card']).pack(pady=10)
+        content = tk.Frame(storage_card, bg=self.colors['card']); content.pack(fill=tk.X, padx=15, pady=15)
+        self.storage_var = tk.StringVar()
+        tk.Label(content, textvariable=self.storage_var, justify=tk.LEFT, font=("Consolas", 9), bg=self.colors['card'], fg=self.colors['text_primary']).pack(anchor=tk.W)
+        row = tk.Frame(content, bg=self.colors['card']); row.pack(anchor=tk.W, pady=(10,0))
+        tk.Button(row, text="🔄 Refresh", command=self.refresh_storage_stats, bg=self.colors['info'], fg=self.colors['card'], font=("Segoe UI", 9, "bold"), relief=tk.FLAT, cursor='hand2', padx=10, pady=5).pack(side=tk.LEFT, padx=(0,10))
+        tk.Button(row, text="📊 Analyze Fragmentation", command=lambda: self.refresh_storage_stats(detail=True), bg=self.colors['primary'], fg=self.colors['card'], font=("Segoe UI", 9, "bold"), relief=tk.FLAT, cursor='hand2', padx=10, pady=5).pack(side=tk.LEFT, padx=(0,10))
+        tk.Button(row, text="🧹 Reclaim Space Now", command=self.reclaim_space, bg=self.colors['success'], fg=self.colors['card'], font=("Segoe UI", 9, "bold"), relief=tk.FLAT, cursor='hand2', padx=10, pady=5).pack(side=tk.LEFT)
+        self.refresh_storage_stats()
         
         canvas.pack(side="left", fill="both", expand=True, padx=15, pady=15); scrollbar.pack(side="right", fill="y", padx=(0,15), pady=15)
 
     def save_settings(self):
         try:
+            selective = dict(self.security_manager.selective_blocking, windows=self.window_protection_var.get(), processes=self.process_monitoring_var.get())
+            self.db_manager.save_settings({'auto_start_lockdown': self.auto_start_var.get(), 'selective_blocking': selective})
             messagebox.showinfo("✅ Success", "Settings saved successfully!")
         except Exception as e:
             messagebox.showerror("❌ Error", f"Failed to save settings: {e}")
 
+    def refresh_storage_stats(self, detail=False):
+        """Show storage statistics; the fragmentation analysis reads the whole file, so it runs off the UI thread"""
+        if not detail:
+            self.storage_var.set(self._format_storage(self.db_manager.get_storage_stats()))
+            return
+        self.storage_var.set("Analyzing database pages...")
+        def run():
+            stats = self.db_manager.get_storage_stats(detail=True)
+            try:
+                self.window.after(0, lambda: self.storage_var.set(self._format_storage(stats)))
+            except Exception:
+                pass
+        threading.Thread(target=run, daemon=True).start()
+
+    @staticmethod
+    def _format_storage(stats):
+        if not stats:
+            return "Storage statistics unavailable"
+        lines = [f"File size:        {stats['file_bytes'] / 1e6:.1f} MB (+ {stats['wal_bytes'] / 1e6:.1f} MB write-ahead log)",
+                 f"Free pages:       {stats['freelist_pages']} of {stats['page_count']} ({stats['free_ratio']:.1%}, {stats['free_bytes'] / 1e6:.1f} MB reclaimable)",
+                 f"Auto-vacuum:      {stats['auto_vacuum']}"]
+        if "fragmentation" in stats:
+            lines.append(f"Fragmentation:    {stats['fragmentation']:.1%} of leaf pages out of order, {stats['unused_bytes'] / 1e6:.1f} MB unused inside pages")
+        last = stats.get("maintenance")
+        if stats.get("maintenance_held"):
+            lines.append("Maintenance:      paused while exam mode is active")
+        elif last:
+            lines.append(f"Last maintenance: {last['started']} UTC, {len(last['dropped_days'])} day(s) expired, {last['reclaimed_pages']} pages reclaimed")
+        return "\n".join(lines)
+
+    def reclaim_space(self):
+        if self.security_manager.is_exam_mode:
+            messagebox.showwarning("⚠️ Exam In Progress", "Database maintenance does not run while exam mode is active.")
+            return
+        self.db_manager.start_maintenance().run_now()
+        messagebox.showinfo("🧹 Maintenance Started", "Expired logs are being removed and free space returned to the disk in the background.")
+
     # ===== LOGS TAB =====
     def create_logs_tab(self):
         frame = ttk.Frame(self.notebook)
@@ -264,12 +345,21 @@ class AdminPanel:
         tk.Button(row, text="🔄 Refresh", command=self.refresh_logs, bg=self.colors['info'], fg=self.colors['card'], font=("Segoe UI", 9, "bold"), relief=tk.FLAT, cursor='hand2', padx=10, pady=5).pack(side=tk.LEFT, padx=(0,10))
         tk.Button(row, text="🗑️ Clear All", command=self.clear_logs, bg=self.colors['warning'], fg=self.colors['card'], font=("Segoe UI", 9, "bold"), relief=tk.FLAT, cursor='hand2', padx=10, pady=5).pack(side=tk.LEFT, padx=(0,10))
         tk.Button(row, text="💾 Export", command=self.export_logs, bg=self.colors['success'], fg=self.colors['card'], font=("Segoe UI", 9, "bold"), relief=tk.FLAT, cursor='hand2', padx=10, pady=5).pack(side=tk.LEFT, padx=(0,10))
+        tk.Button(row, text="📑 Session Report", command=self.show_session_report, bg=self.colors['info'], fg=self.colors['card'], font=("Segoe UI", 9, "bold"), relief=tk.FLAT, cursor='hand2', padx=10, pady=5).pack(side=tk.LEFT, padx=(0,10))
         
         self.log_filter_var = tk.StringVar()
         tk.Label(row, text="Filter:", font=("Segoe UI", 9, "bold"), bg=self.colors['card'], fg=self.colors['text_primary']).pack(side=tk.LEFT, padx=(20,5))
-        filter_combo = ttk.Combobox(row, textvariable=self.log_filter_var, values=["All", "Blocked Only", "Security Events"], font=("Segoe UI", 9))
+        filter_combo = ttk.Combobox(row, textvariable=self.log_filter_var, values=["All", "Blocked Only", "High Severity", "Security Events"], font=("Segoe UI", 9))
         filter_combo.set("All"); filter_combo.pack(side=tk.LEFT, padx=(0,10))
         filter_combo.bind("<<ComboboxSelected>>", lambda e: self.refresh_logs())
+
+        self.log_search_var = tk.StringVar()
+        tk.Label(row, text="Search:", font=("Segoe UI", 9, "bold"), bg=self.colors['card'], fg=self.colors['text_primary']).pack(side=tk.LEFT, padx=(10,5))
+        search_entry = tk.Entry(row, textvariable=self.log_search_var, font=("Segoe UI", 9), width=28); search_entry.pack(side=tk.LEFT, padx=(0,5))
+        search_entry.bind("<Return>", lambda e: self.refresh_logs())
+        tk.Button(row, text="🔍", command=self.refresh_logs, bg=self.colors['info'], fg=self.colors['card'], font=("Segoe UI", 9, "bold"), relief=tk.FLAT, cursor='hand2', padx=8, pady=5).pack(side=tk.LEFT)
+        self.export_status_var = tk.StringVar()
+        tk.Label(row, textvariable=self.export_status_var, font=("Segoe UI", 9), bg=self.colors['card'], fg=self.colors['text_secondary']).pack(side=tk.LEFT, padx=(10,0))
         
         logs_card = tk.Frame(container, bg=self.colors['card']); logs_card.pack(fill=tk.BOTH, expand=True)
         header = tk.Frame(logs_card, bg=self.colors['danger'], height=40); header.pack(fill=tk.X); header.pack_propagate(False)
@@ -278,34 +368,75 @@ class AdminPanel:
         self.logs_text = scrolledtext.ScrolledText(content, wrap=tk.WORD, height=25, font=("Consolas", 9), bg=self.colors['surface'], fg=self.colors['text_primary'])
         self.logs_text.pack(fill=tk.BOTH, expand=True)
 
+    # Actions shown under the "Security Events" filter
+    SECURITY_EVENT_PREFIXES = ("BLOCKED_", "SUSPICIOUS_", "MOUSE_BLOCKED", "WINDOW_", "HOOK_", "INTERNET_BLOCKING")
+
     def refresh_logs(self):
+        filters = self._log_filters()
+        query = self.log_search_var.get().strip()
         try:
-            logs = self.db_manager.get_activity_logs(100)
+            if query:
+                logs = [row[1:5] + (row[6],) for row in self.db_manager.search_activity_logs(query, limit=100, **filters)]
+            else:
+                logs = [row[1:5] + (row[6],) for row in self.db_manager.query_activity_logs(100, **filters)[0]]
         except Exception:
             logs = []
         self.logs_text.delete(1.0, tk.END)
         for log in logs:
             try:
-                action, details, timestamp, blocked = log
+                action, details, timestamp, blocked, count = log
                 status = "BLOCKED" if blocked else "ALLOWED"
+                if count > 1: status += f" x{count}"
                 self.logs_text.insert(tk.END, f"[{timestamp}] {action}: {details or 'N/A'} - {status}\n")
             except Exception:
                 continue
+        if query and not logs:
+            self.logs_text.insert(tk.END, f"No log entries match: {query}\n")
         self.logs_text.see(tk.END)
 
+    def show_session_report(self):
+        report = self.db_manager.get_session_report()
+        self.logs_text.delete(1.0, tk.END)
+        self.logs_text.insert(tk.END, format_report(report) + "\n" if report else "No exam sessions recorded yet.\n")
+
     def clear_logs(self):
         self.logs_text.delete(1.0, tk.END)
         messagebox.showinfo("✅ Success", "Logs cleared!")
 
+    def _log_filters(self):
+        selected = self.log_filter_var.get()
+        if selected == "Blocked Only": return {'blocked': True}
+        if selected == "High Severity": return {'min_severity': HIGH}
+        if selected == "Security Events": return {'action_prefix': self.SECURITY_EVENT_PREFIXES}
+        return {}
+
     def export_logs(self):
-        filename = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
-        if filename:
-            try:
-                with open(filename, 'w') as f:
-                    f.write(self.logs_text.get(1.0, tk.END))
-                messagebox.showinfo("✅ Success", f"Logs exported to:\n{filename}")
-            except Exception as e:
-                messagebox.showerror("❌ Error", f"Export failed: {e}")
+        if self._export_job and not self._export_job.done:
+            if messagebox.askyesno("Export Running", "An export is still running.\n\nCancel it?"): self._export_job.cancel()
+            return
+        filename = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Compressed CSV", "*.csv.gz"), ("Compressed JSON Lines", "*.jsonl.gz"), ("Zstandard JSON Lines", "*.jsonl.zst"), ("All files", "*.*")])
+        if not filename: return
+        total = self.db_manager.estimate_export_rows()
+        self.export_status_var.set("Exporting...")
+
+        def progress(count):
+            text = f"Exported {count:,} rows" + (f" (~{min(100, count * 100 // total)}%)" if total else "")
+            self.window.after(0, self.export_status_var.set, text)
+
+        def done(job):
+            self.window.after(0, self._export_finished, job)
+
+        self._export_job = self.db_manager.export_activity_logs(filename, progress=progress, on_done=done, **self._log_filters())
+
+    def _export_finished(self, job):
+        if job.error is None:
+            self.export_status_var.set(f"Exported {job.result:,} rows in {job.elapsed:.1f}s")
+            messagebox.showinfo("✅ Success", f"{job.result:,} log entries exported to:\n{job.path}")
+        elif isinstance(job.error, ExportCancelled):
+            self.export_status_var.set("Export cancelled")
+        else:
+            self.export_status_var.set("Export failed")
+            messagebox.showerror("❌ Error", f"Export failed: {job.error}")
 
     # ===== MOUSE CONTROLS =====
     def show_mouse_controls(self):
@@ -437,7 +568,10 @@ class AdminPanel:
         if not pwd: return
         import hashlib; h = hashlib.sha256(pwd.encode()).hexdigest()
         if self.db_manager.verify_admin("admin", h):
-            self.security_manager.stop_exam_mode(); self.start_btn.config(state=tk.NORMAL); self.stop_btn.config(state=tk.DISABLED); self.refresh_status(); messagebox.showinfo("🔓 LOCKDOWN DISABLED", "All security restrictions have been removed.")
+            self.security_manager.stop_exam_mode(); self.start_btn.config(state=tk.NORMAL); self.stop_btn.config(state=tk.DISABLED); self.refresh_status()
+            report = self.security_manager.last_session_report
+            summary = f"\n\nSession: {report['events']:,} events, {report['blocked_events']:,} blocked." if report else ""
+            messagebox.showinfo("🔓 LOCKDOWN DISABLED", "All security restrictions have been removed." + summary)
         else:
             messagebox.showerror("❌ ACCESS DENIED", "Invalid admin password!")
 
@@ -86,8 +86,4 @@ def _clear_logs(self):
 
 _AP.clear_logs = _clear_logs
 
-
-def _export_logs(self):
-    pass
-
-_AP.export_logs = _export_logs
+# export_logs is left to AdminPanel, which streams the full log history via DatabaseManager.export_activity_logs
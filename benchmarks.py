@@ -0,0 +1,1197 @@
+"""
+Benchmarks for Exam Shield
+Run against throwaway databases, never the live exam_shield.db
+
+    python benchmarks.py database [--calls N]
+    python benchmarks.py writer [--events N]
+    python benchmarks.py logger [--events N]
+    python benchmarks.py coalesce [--events N]
+    python benchmarks.py segments [--records N] [--segment-kb N]
+    python benchmarks.py journal [--events N]
+    python benchmarks.py processes [--processes N] [--seconds N]   (Linux)
+    python benchmarks.py rules [--rules N] [--processes N]
+    python benchmarks.py terminate [--trees N]   (Linux)
+    python benchmarks.py allowlist [--processes N] [--launches N]   (Linux)
+    python benchmarks.py queries [--rows N]
+    python benchmarks.py search [--rows N]
+    python benchmarks.py storage [--events N]
+    python benchmarks.py export [--rows N]
+    python benchmarks.py sessions [--rows N] [--session-events N]
+    python benchmarks.py merge [--sources N] [--events N]
+    python benchmarks.py backup [--rows N] [--pages N]
+    python benchmarks.py migrate [--rows N]
+    python benchmarks.py vacuum [--rows N] [--slice-pages N]
+"""
+
+import argparse
+import collections
+import hashlib
+import logging
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import psutil
+from config import Config
+from database_manager import DatabaseManager
+from db_backup import BackupScheduler, verify_snapshot
+from db_maintenance import MaintenanceScheduler
+from db_merge import DatabaseMerger
+from event_journal import FLAG_BLOCKED, EventJournal, JournalReader
+from log_coalescer import EventCoalescer
+from log_partitions import LogPartitions
+from log_segments import JsonlSegmentHandler, read_entries, read_logs
+from log_severity import classify
+from log_writer import LogEvent
+from logger import ExamShieldLogger, shutdown_logging
+from process_allowlist import ProcessAllowlist
+from process_backends import NetlinkBackend, ProcfsBackend, PsutilBackend
+from process_monitor import ProcessMonitor
+from process_rules import ExecutableHashes, ProcessRules
+from process_terminator import ProcessTerminator
+from schema_migrations import SchemaMigrator
+
+def _rate(func, calls):
+    """Return calls per second for func() invoked `calls` times"""
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    elapsed = time.perf_counter() - start
+    return calls / elapsed if elapsed else float("inf")
+
+def _create_legacy_schema(db_path):
+    """The original single-table schema, in the default rollback journal mode"""
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript('''
+            CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+                                password_hash TEXT NOT NULL, role TEXT NOT NULL DEFAULT 'admin',
+                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_login TIMESTAMP);
+            CREATE TABLE activity_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, action TEXT NOT NULL,
+                                        details TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                                        blocked BOOLEAN DEFAULT FALSE, ip_address TEXT);
+            CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                                   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        ''')
+        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                     (Config.DEFAULT_ADMIN_USERNAME, hashlib.sha256(Config.DEFAULT_ADMIN_PASSWORD.encode()).hexdigest()))
+
+def _legacy_methods(db_path):
+    """Connection-per-call implementations matching the original DatabaseManager"""
+    password_hash = hashlib.sha256(Config.DEFAULT_ADMIN_PASSWORD.encode()).hexdigest()
+
+    def log_activity(i):
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("INSERT INTO activity_logs (user_id, action, details, blocked) VALUES (?, ?, ?, ?)",
+                         (None, "BENCH_EVENT", f"legacy event {i}", False))
+            conn.commit()
+
+    def get_setting(i):
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("SELECT value FROM settings WHERE key=?", ("bench_key",)).fetchone()
+
+    def save_setting(i):
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                         ("bench_key", str(i)))
+            conn.commit()
+
+    def verify_admin(i):
+        with sqlite3.connect(db_path) as conn:
+            row = conn.execute("SELECT id FROM users WHERE username=? AND password_hash=? AND role='admin'",
+                               (Config.DEFAULT_ADMIN_USERNAME, password_hash)).fetchone()
+            conn.execute("UPDATE users SET last_login=CURRENT_TIMESTAMP WHERE id=?", (row[0],))
+            conn.commit()
+
+    def get_activity_logs(i):
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("SELECT action, details, timestamp, blocked FROM activity_logs ORDER BY timestamp DESC LIMIT ?",
+                         (20,)).fetchall()
+
+    return {"log_activity": log_activity, "get_setting": get_setting, "save_setting": save_setting,
+            "verify_admin": verify_admin, "get_activity_logs": get_activity_logs}
+
+def _pooled_methods(db):
+    password_hash = hashlib.sha256(Config.DEFAULT_ADMIN_PASSWORD.encode()).hexdigest()
+    return {
+        "log_activity": lambda i: db.log_activity("BENCH_EVENT", f"pooled event {i}"),
+        "get_setting": lambda i: db.get_setting("bench_key"),
+        "save_setting": lambda i: db.save_setting("bench_key", str(i)),
+        "verify_admin": lambda i: db.verify_admin(Config.DEFAULT_ADMIN_USERNAME, password_hash),
+        "get_activity_logs": lambda i: db.get_activity_logs(20),
+    }
+
+def bench_database(calls):
+    """Calls per second for each public DatabaseManager method, before and after pooling"""
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        _create_legacy_schema(legacy_path)
+        legacy = _legacy_methods(legacy_path)
+
+        db = DatabaseManager(os.path.join(tmp, "pooled.db"))
+        pooled = _pooled_methods(db)
+
+        print(f"{'method':<20}{'before/s':>12}{'after/s':>12}{'speedup':>10}")
+        for name in legacy:
+            before = _rate(legacy[name], calls)
+            after = _rate(pooled[name], calls)
+            print(f"{name:<20}{before:>12.0f}{after:>12.0f}{after / before:>9.1f}x")
+        db.close()
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def bench_writer(events):
+    """Caller-side latency of log_activity: direct INSERT/COMMIT versus batched enqueue"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "writer.db"))
+
+        def direct(i):
+            with db.pool.writer() as conn:
+                db.partitions.insert(conn, [(None, "MOUSE_BLOCKED", f"direct event {i}",
+                                             time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), True)])
+
+        def batched(i):
+            db.log_activity("MOUSE_BLOCKED", f"batched event {i}", blocked=True)
+
+        print(f"{'mode':<10}{'p50 us':>10}{'p99 us':>10}{'max us':>10}{'events/s':>12}")
+        for name, func in (("direct", direct), ("batched", batched)):
+            samples = []
+            start = time.perf_counter()
+            for i in range(events):
+                t0 = time.perf_counter()
+                func(i)
+                samples.append((time.perf_counter() - t0) * 1e6)
+            if name == "batched":
+                db.flush(timeout=None)
+            rate = events / (time.perf_counter() - start)
+            print(f"{name:<10}{_percentile(samples, 50):>10.1f}{_percentile(samples, 99):>10.1f}"
+                  f"{max(samples):>10.1f}{rate:>12.0f}")
+        print(f"writer stats: {db.writer.stats()}")
+        db.close()
+
+def bench_logger(events):
+    """Per-event caller cost of ExamShieldLogger: file and database writes on the calling
+    thread versus the QueueHandler pipeline"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "logger.db"))
+        sync_logger = logging.getLogger("ExamShieldBenchmark")
+        sync_logger.propagate = False
+        file_handler = logging.FileHandler(os.path.join(tmp, "sync.log"))
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        sync_logger.addHandler(file_handler)
+        sync_logger.setLevel(logging.INFO)
+
+        def synchronous(i):
+            # What every call cost before: a committed INSERT and a flushed file write
+            db.write_events([LogEvent("BLOCKED_KEY_ATTEMPT", f"Attempted to use: alt+tab #{i}", True)])
+            sync_logger.warning(f"SECURITY: BLOCKED_KEY_ATTEMPT - Attempted to use: alt+tab #{i} (BLOCKED)")
+
+        queued_logger = ExamShieldLogger(db, log_dir=tmp)
+        ExamShieldLogger(db, log_dir=tmp)  # a second instance must not add handlers
+        console = [h for h in queued_logger.listener.handlers if type(h) is logging.StreamHandler]
+        for handler in console:
+            handler.setLevel(logging.CRITICAL)
+
+        def queued(i):
+            queued_logger.log_security_event("BLOCKED_KEY_ATTEMPT", f"Attempted to use: alt+tab #{i}", True)
+
+        print(f"{'mode':<12}{'p50 us':>10}{'p99 us':>10}{'max us':>10}{'events/s':>12}")
+        for name, func in (("synchronous", synchronous), ("queued", queued)):
+            samples = []
+            start = time.perf_counter()
+            for i in range(events):
+                t0 = time.perf_counter()
+                func(i)
+                samples.append((time.perf_counter() - t0) * 1e6)
+            if name == "queued":
+                queued_logger.flush(timeout=None)
+            rate = events / (time.perf_counter() - start)
+            print(f"{name:<12}{_percentile(samples, 50):>10.1f}{_percentile(samples, 99):>10.1f}"
+                  f"{max(samples):>10.1f}{rate:>12.0f}")
+        listener = queued_logger.listener
+        lines = sum(entry["records"] for entry in queued_logger.segments.segments())
+        print(f"listener: {listener.records} records in {listener.batches} batches; "
+              f"{len(queued_logger.logger.handlers)} handler(s) on the logger, {lines} file lines")
+        shutdown_logging()
+        file_handler.close()
+        db.close()
+
+def bench_coalesce(events):
+    """Rows written and caller cost for a storm of repeated events (key mashing, a respawning
+    process), checking that the stored counts add up to every event logged"""
+    storm = (("MOUSE_BLOCKED", "Blocked Middle Button Down button action (Message: 0x207)", True),
+             ("BLOCKED_KEY_ATTEMPT", "Attempted to use: alt+tab", True),
+             ("BLOCKED_KEY_ATTEMPT", "Attempted to use: win+d", True),
+             ("SUSPICIOUS_PROCESS", "Detected: cmd.exe", True))
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "coalesce.db"))
+        rng = random.Random(3)
+        samples = []
+        start = time.perf_counter()
+        for i in range(events):
+            action, details, blocked = storm[rng.randrange(len(storm))]
+            t0 = time.perf_counter()
+            db.log_activity(action, details, blocked)
+            samples.append((time.perf_counter() - t0) * 1e6)
+            if i % 1000 == 999:
+                time.sleep(0.05)  # roughly 15k events per second, in bursts
+        db.flush(timeout=None)
+        elapsed = time.perf_counter() - start
+        rows, total = db.pool.reader().execute("SELECT COUNT(*), SUM(count) FROM activity_logs").fetchone()
+        rolled = db.pool.reader().execute("SELECT SUM(count) FROM log_rollup_minute").fetchone()[0]
+        print(f"{events} events in {elapsed:.1f}s -> {rows} rows ({events / rows:.0f} events per row)")
+        print(f"log_activity p50 {_percentile(samples, 50):.1f} us, p99 {_percentile(samples, 99):.1f} us")
+        print(f"stored count {total}, rollup count {rolled}: {'exact' if total == rolled == events else 'MISMATCH'}")
+        print(f"coalescer: {db.coalescer.stats()}")
+        db.close()
+
+    # Distinct events of one action (no repeats to fold): the rate limit alone has to cap the rows
+    rows = []
+    rate, burst = Config.LOG_RATE_LIMITS["SUSPICIOUS_PROCESS"]
+    coalescer = EventCoalescer(rows.append, window=0.1)
+    for i in range(500):
+        coalescer.add(LogEvent("SUSPICIOUS_PROCESS", f"Detected: tool{i}.exe", True))
+    time.sleep(1.0)
+    written = len(rows)
+    coalescer.stop()
+    print(f"500 distinct SUSPICIOUS_PROCESS events at {rate}/s, burst {burst}: {written} rows within 1 s, "
+          f"{len(rows)} after stop holding {sum(row.count for row in rows)} events; {coalescer.stats()}")
+
+SAMPLE_EVENTS = (
+    ("MOUSE_BLOCKED", "Blocked Middle Button Down button action (Message: 0x207)", True),
+    ("MOUSE_BLOCKED", "Blocked Side Button Down button action (Message: 0x20b)", True),
+    ("BLOCKED_KEY_ATTEMPT", "Attempted to use: alt+tab", True),
+    ("BLOCKED_KEY_ATTEMPT", "Attempted to use: win+d", True),
+    ("SUSPICIOUS_PROCESS", "Detected: cmd.exe", True),
+    ("SUSPICIOUS_PROCESS", "Detected: taskmgr.exe", True),
+    ("WINDOW_PROTECTED", "Applied protection to: Exam Portal - Google Chrome", False),
+    ("WINDOW_RESTORED", "Restored minimized window: Exam Portal - Google Chrome", False),
+    ("ADMIN_ACCESS_REQUEST", "Admin hotkey pressed", False),
+    ("EXAM_MODE_START", "Selective restrictions: keyboard, mouse, internet, windows, processes", False),
+    ("EXAM_MODE_STOP", "All security restrictions deactivated", False),
+    ("INTERNET_BLOCKING_START", "Aggressive internet blocking activated", False),
+    ("ENFORCED_FULLSCREEN", "Enforced fullscreen for: Exam Portal - Question 12 of 40", False),
+    ("PROCESS_TERMINATED", "Terminated chrome.exe (PID 18344) using 212 MB", True),
+)
+
+def bench_segments(records, segment_kb):
+    """File log segments: write rate through the JSONL sink, then a one-hour read and retention
+    driven by the manifest versus opening every segment"""
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = JsonlSegmentHandler(tmp, max_bytes=segment_kb * 1024)
+        logger = logging.getLogger("ExamShieldSegments")
+        start_ts = time.time() - 30 * 86400
+        step = 30 * 86400 / records
+        batch, start = [], time.perf_counter()
+        for i in range(records):
+            record = logger.makeRecord(logger.name, logging.WARNING, "(bench)", 0, "SECURITY: %s - %s (%s)",
+                                       ("BLOCKED_KEY_ATTEMPT", f"Attempted to use: alt+tab #{i}", "BLOCKED"), None,
+                                       extra={"action": "BLOCKED_KEY_ATTEMPT", "details": f"alt+tab #{i}",
+                                              "blocked": True, "session_id": None})
+            record.created = start_ts + i * step
+            batch.append(record)
+            if len(batch) == Config.LOG_BATCH_SIZE:
+                handler.handle_batch(batch)
+                batch = []
+        handler.handle_batch(batch)
+        elapsed = time.perf_counter() - start
+        handler.segments.close(timeout=None)  # wait for every closed segment to be compressed
+        handler.close()
+        segments = handler.segments.segments()
+        stored = sum(entry["stored_bytes"] for entry in segments)
+        raw = sum(entry["bytes"] for entry in segments)
+        print(f"wrote {records:,} records in {elapsed:.2f}s ({records / elapsed:,.0f}/s): {len(segments)} segments, "
+              f"{raw / 1e6:.1f} MB raw, {stored / 1e6:.1f} MB on disk")
+
+        since = start_ts + 15 * 86400
+        t0 = time.perf_counter()
+        hits = sum(1 for _ in read_logs(tmp, since, since + 3600))
+        manifest_ms = (time.perf_counter() - t0) * 1e3
+        t0 = time.perf_counter()
+        every = [{"name": name, "first": 0, "last": 0, "closed": False}
+                 for name in sorted(os.listdir(tmp)) if name.endswith(".gz")]
+        scanned = sum(1 for _ in read_entries(tmp, every, since, since + 3600))
+        scan_ms = (time.perf_counter() - t0) * 1e3
+        print(f"one-hour read: {hits} records via manifest in {manifest_ms:.1f} ms, "
+              f"{scanned} opening every segment in {scan_ms:.1f} ms")
+        t0 = time.perf_counter()
+        removed = handler.segments.prune(start_ts + 7 * 86400)
+        print(f"retention: {len(removed)} segments removed in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+
+def bench_journal(events):
+    """Binary event journal: append cost, then a full-day scan and a one-minute binary search
+    over a busy lab's day of events"""
+    actions = ("BLOCKED_KEY_ATTEMPT", "MOUSE_BLOCKED", "SUSPICIOUS_PROCESS", "WINDOW_FOCUS_LOST", "USB_INSERTED")
+    rng = random.Random(11)
+    day = time.time() // 86400 * 86400 - 86400
+    step = 86400 / events
+    batch = [LogEvent(rng.choice(actions), f"Attempted to use: alt+tab #{i}", i % 3 == 0, None, day + i * step, 1)
+             for i in range(events)]
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = EventJournal(tmp)
+        samples = []
+        start = time.perf_counter()
+        for event in batch:
+            t0 = time.perf_counter()
+            journal.append(event)
+            samples.append((time.perf_counter() - t0) * 1e6)
+        elapsed = time.perf_counter() - start
+        journal.close()
+        size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        print(f"append: p50 {_percentile(samples, 50):.1f} us, p99 {_percentile(samples, 99):.1f} us, "
+              f"{events / elapsed:,.0f} events/s; {size / 1e6:.1f} MB in {len(os.listdir(tmp)) // 2} segment(s)")
+
+        reader = JournalReader(tmp)
+        t0 = time.perf_counter()
+        blocked = sum(1 for row in reader.scan(day, day + 86400) if row[2] & FLAG_BLOCKED)
+        scan_ms = (time.perf_counter() - t0) * 1e3
+        t0 = time.perf_counter()
+        decoded = sum(1 for _ in reader.events(day, day + 86400))
+        events_ms = (time.perf_counter() - t0) * 1e3
+        print(f"full day: raw scan of {blocked:,} blocked in {scan_ms:.0f} ms, "
+              f"{decoded:,} decoded events in {events_ms:.0f} ms")
+        lookups = []
+        for _ in range(200):
+            since = day + rng.random() * 86000
+            t0 = time.perf_counter()
+            hits = sum(1 for _ in reader.events(since, since + 60))
+            lookups.append((time.perf_counter() - t0) * 1e3)
+        print(f"one-minute range ({hits} events): p50 {_percentile(lookups, 50):.2f} ms, "
+              f"p99 {_percentile(lookups, 99):.2f} ms")
+
+def _corpus(rows, days=90, seed=7):
+    """Synthetic (user_id, action, details, timestamp, blocked) rows spread evenly over `days`"""
+    rng = random.Random(seed)
+    start = time.time() - days * 86400
+    step = days * 86400 / rows
+    for i in range(rows):
+        action, details, blocked = SAMPLE_EVENTS[rng.randrange(len(SAMPLE_EVENTS))]
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + i * step))
+        yield (None, action, f"{details} #{i % 97}", ts, blocked)
+
+def _generate_activity_logs(db, rows, days=90, seed=7):
+    """Bulk-load a synthetic activity_logs corpus spread evenly over `days`"""
+    with db.pool.writer() as conn:
+        db.partitions.insert(conn, _corpus(rows, days, seed))
+        conn.execute("ANALYZE")
+
+def _time_query(conn, sql, params, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+_FAKE_STAT_TAIL = ("S 1 {pid} {pid} 0 -1 4194304 107 0 0 0 0 0 0 0 20 0 1 0 {start} 2703360 321 "
+                   "18446744073709551615 1 1 1 0 0 0 0 0 0 0 0 0 17 0 0 0 0 0 0\n")
+
+def _fake_process(root, pid, name):
+    """Add a process to a fake procfs tree; psutil only needs its stat file for pids() and name()"""
+    os.makedirs(os.path.join(root, str(pid)), exist_ok=True)
+    with open(os.path.join(root, str(pid), "stat"), "w") as f:
+        f.write(f"{pid} ({name}) " + _FAKE_STAT_TAIL.format(pid=pid, start=1000 + pid % 100_000))
+
+def _fake_procfs(root, processes):
+    """A procfs tree with `processes` benign entries; PIDs sit far above any real one"""
+    with open(os.path.join(root, "stat"), "w") as f:
+        f.write(f"cpu  0 0 0 0 0 0 0 0 0 0\nbtime {int(time.time()) - 86400}\n")
+    names = ("chrome.exe", "explorer.exe", "svchost.exe", "code.exe", "python.exe", "winword.exe", "teams.exe")
+    pids = list(range(3_000_000, 3_000_000 + processes))
+    for pid in pids:
+        _fake_process(root, pid, names[pid % len(names)])
+    return pids
+
+def _scan_cpu(scan, scans):
+    cpu = time.process_time()
+    for _ in range(scans):
+        scan()
+    return (time.process_time() - cpu) / scans * 1e3
+
+def _detection(monitor, spawn, launches, spawned, latencies):
+    """Start monitor, make `launches` suspicious processes appear via spawn(), return process CPU %"""
+    monitor.scan()
+    monitor.start()
+    cpu, wall = time.process_time(), time.monotonic()
+    for _ in range(launches):
+        time.sleep(random.uniform(0.05, 0.3))
+        spawn()
+    time.sleep(Config.PROCESS_SCAN_INTERVAL * 2)
+    monitor.stop()
+    return (time.process_time() - cpu) / (time.monotonic() - wall) * 100
+
+def _latency_line(label, spawned, latencies, load):
+    latencies = sorted(latencies)
+    if not latencies:
+        print(f"{label}: nothing detected out of {len(spawned)} launches")
+        return
+    print(f"{label}: {len(latencies)}/{len(spawned)} caught, p50 {latencies[len(latencies) // 2] * 1e3:.2f} ms, "
+          f"max {latencies[-1] * 1e3:.2f} ms, process CPU {load:.2f}%")
+
+def bench_processes(processes, seconds):
+    """CPU cost of each process monitor backend against the old full process_iter walk, on a fake process
+    table read through PROCFS_PATH, then detection latency for real launches on this machine"""
+    if not sys.platform.startswith("linux"):
+        print("The processes benchmark fakes /proc and runs on Linux only")
+        return
+    suspicious = ['taskmgr.exe', 'cmd.exe', 'powershell.exe', 'regedit.exe', 'msconfig.exe']
+    rules = ProcessRules.from_settings([], suspicious)
+    launches = max(1, int(seconds / 0.175))
+    real_procfs = psutil.PROCFS_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        pids = _fake_procfs(tmp, processes)
+        next_pid = pids[-1] + 1
+        psutil.PROCFS_PATH = tmp
+        try:
+            def full_walk():
+                wanted = {name.lower() for name in suspicious}
+                for process in psutil.process_iter(['pid', 'name']):
+                    if process.info['name'].lower() in wanted:
+                        pass
+            interval = Config.PROCESS_SCAN_INTERVAL
+            print(f"{processes:,} processes in a fake /proc")
+            print(f"{'scan':40} {'CPU ms':>8} {'interval':>9} {'CPU %':>7}")
+            full_ms = _scan_cpu(full_walk, 20)
+            print(f"{'full process_iter walk':40} {full_ms:8.2f} {'2.00s':>9} {full_ms / 2000 * 100:7.2f}")
+            churn = 5
+            for backend in (PsutilBackend(), ProcfsBackend(tmp)):
+                monitor = ProcessMonitor(rules, lambda process, name, rule: True, backend=backend)
+                first_ms = _scan_cpu(monitor.scan, 1)
+                steady_ms = _scan_cpu(monitor.scan, 200)
+                def churned():
+                    nonlocal next_pid
+                    for _ in range(churn):
+                        _fake_process(tmp, next_pid, "notepad.exe")
+                        next_pid += 1
+                    monitor.scan()
+                churn_ms = _scan_cpu(churned, 200)  # includes writing the fake entries
+                print(f"{backend.name + ' diff, first scan':40} {first_ms:8.2f} {'once':>9}")
+                for label, ms in (("unchanged table", steady_ms), (f"{churn} new processes per scan", churn_ms)):
+                    print(f"{backend.name + ' diff, ' + label:40} {ms:8.2f} {interval:8.2f}s "
+                          f"{ms / (interval * 1000) * 100:7.2f}")
+
+            spawned, latencies = {}, []
+            def on_match(process, name, rule):
+                latencies.append(time.monotonic() - spawned[process.pid])
+                return True
+            def spawn_fake():
+                nonlocal next_pid
+                spawned[next_pid] = time.monotonic()
+                _fake_process(tmp, next_pid, random.choice(('cmd.exe', 'Taskmgr.exe', 'powershell.exe')))
+                next_pid += 1
+            load = _detection(ProcessMonitor(rules, on_match, backend=ProcfsBackend(tmp)), spawn_fake, launches,
+                              spawned, latencies)
+            _latency_line("fake /proc, procfs backend", spawned, latencies, load)
+        finally:
+            psutil.PROCFS_PATH = real_procfs
+
+    # Real launches: latency is measured from the return of Popen, by which time the child has exec'd
+    sleeper = ProcessRules.from_settings([], ["sleep"])
+    for make in (ProcfsBackend, NetlinkBackend):
+        try:
+            backend = make()
+        except OSError as e:
+            print(f"real launches, {make.name} backend: unavailable ({e})")
+            continue
+        spawned, latencies, children, seen = {}, [], [], {}
+        def on_match(process, name, rule):
+            seen.setdefault(process.pid, time.monotonic())  # may fire before Popen has returned
+            return True
+        def spawn_real():
+            child = subprocess.Popen(["sleep", "0.5"])
+            spawned[child.pid] = time.monotonic()
+            children.append(child)
+        load = _detection(ProcessMonitor(sleeper, on_match, backend=backend), spawn_real, launches, spawned,
+                          latencies)
+        for child in children:
+            child.wait()
+        latencies = [max(0.0, seen[pid] - started) for pid, started in spawned.items() if pid in seen]
+        _latency_line(f"real launches, {backend.name} backend", spawned, latencies, load)
+
+def _naive_match(rules, patterns, hashes, name, exe, cmdline):
+    """Rule by rule, as a plain loop over the settings would do it (regexes precompiled, one hash per process)"""
+    text, digest = " ".join(cmdline), None
+    for rule in rules:
+        kind, value = rule["type"], rule["value"]
+        if kind == "name" and name.lower() == value.lower():
+            return rule
+        if kind == "path" and exe.replace("\\", "/").lower().startswith(value.replace("\\", "/").lower()):
+            return rule
+        if kind == "cmdline" and patterns[value].search(text):
+            return rule
+        if kind == "hash":
+            digest = digest or hashes.get(exe)
+            if digest == value:
+                return rule
+    return None
+
+def bench_rules(count, processes):
+    """Compile `count` process rules (names, path prefixes, command-line patterns and hashes) and evaluate
+    them against `processes` synthetic processes, cold and with the hash cache warm, versus a plain loop"""
+    random.seed(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        binaries = []
+        for i in range(200):
+            path = os.path.join(tmp, f"bin{i}", f"app{i}.exe")
+            os.makedirs(os.path.dirname(path))
+            with open(path, "wb") as f:
+                f.write(os.urandom(256 * 1024))
+            binaries.append(path)
+        hashes = ExecutableHashes()
+        banned = [hashes.get(path) for path in binaries[:5]]
+        hashes = ExecutableHashes()
+
+        names, paths, cmdlines = int(count * 0.4), int(count * 0.3), int(count * 0.25)
+        rules = [{"type": "name", "value": f"cheat{i}.exe"} for i in range(names)]
+        rules += [{"type": "path", "value": f"C:\\Tools\\kit{i}"} for i in range(paths)]
+        rules += [{"type": "cmdline", "value": rf"--answer-key-{i}\b" if i % 5 else rf"\w+solver{i}\.(py|exe)"}
+                  for i in range(cmdlines)]
+        # Escapes, inline flags and backreferences, which the literal indexing and the combined fallback have
+        # to get right
+        rules += [{"type": "cmdline", "value": value} for value in
+                  (r"proxy\x20tool", r"\x61nswer-dump", r"\141utoclick\d", r"(?i)KEYLOGGER\d+", r"(?x) screen \s* grab  # verbose",
+                   r"(q)\1", r"(z)\1\d")]
+        rules += [{"type": "hash", "value": banned[i % len(banned)] if i < len(banned) else f"{i:064x}"}
+                  for i in range(count - len(rules))]
+
+        tricky = [["tool.exe", text] for text in ("proxy tool", "answer-dump", "autoclick7", "keylogger42",
+                                                  "screengrab", "qq", "zz9")]
+        table = []
+        for i in range(processes):
+            exe = binaries[i % len(binaries)]
+            cmdline = [exe, "--type=renderer", f"--field-trial-handle={random.randrange(10**9)}", "--lang=en-US",
+                       "--enable-features=NetworkService,NetworkServiceInProcess", f"C:\\Users\\student\\doc{i}.txt"]
+            name = os.path.basename(exe)
+            if i % 100 == 1:
+                name = f"cheat{random.randrange(names)}.exe"
+            elif i % 100 == 2:
+                cmdline = cmdline + [f"--answer-key-{random.randrange(1, cmdlines // 5) * 5 + 1}"]
+            elif i % 100 == 3:
+                cmdline = ["python", f"mysolver{random.randrange(cmdlines // 5) * 5}.py"]
+            elif i % 100 == 4:
+                cmdline = random.choice(tricky)
+            table.append((name, exe, cmdline))
+
+        start = time.perf_counter()
+        compiled = ProcessRules(rules, hashes)
+        compile_ms = (time.perf_counter() - start) * 1e3
+        print(f"{len(compiled):,} rules compiled in {compile_ms:.0f} ms; {processes:,} processes over "
+              f"{len(binaries)} distinct executables")
+        for label in ("cold hash cache", "warm hash cache"):
+            start = time.perf_counter()
+            matched = sum(1 for name, exe, cmdline in table if compiled.match(name, exe, cmdline))
+            elapsed = time.perf_counter() - start
+            print(f"compiled, {label:16} {elapsed * 1e3:8.1f} ms total, {elapsed / processes * 1e6:7.1f} us/process, "
+                  f"{matched} matched, {hashes.hashed} files hashed")
+
+        patterns = {rule["value"]: re.compile(rule["value"], re.IGNORECASE) for rule in rules if rule["type"] == "cmdline"}
+        sample = table[:max(1, processes // 10)]
+        start = time.perf_counter()
+        naive = [_naive_match(rules, patterns, hashes, name, exe, cmdline) is not None
+                 for name, exe, cmdline in sample]
+        per = (time.perf_counter() - start) / len(sample)
+        print(f"plain loop over the rules  {per * processes * 1e3:8.1f} ms total, {per * 1e6:7.1f} us/process "
+              f"(timed on {len(sample)} processes, {sum(naive)} matched)")
+        # Every tricky command line too, which the sample may miss
+        sample += [("tool.exe", binaries[-1], cmdline) for cmdline in tricky]
+        naive += [_naive_match(rules, patterns, hashes, *process) is not None for process in sample[-len(tricky):]]
+        disagree = sum(1 for (name, exe, cmdline), expected in zip(sample, naive)
+                       if (compiled.match(name, exe, cmdline) is not None) != expected)
+        print(f"compiled rules disagree with the plain loop (re.search) on {disagree} of {len(sample)} processes")
+
+def bench_terminate(trees):
+    """Tree kills with terminate-to-kill escalation, then a launcher that keeps respawning renamed copies of
+    a blocked tool; runs real processes on this machine"""
+    if not sys.platform.startswith("linux"):
+        print("The terminate benchmark runs on Linux only")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        tool = os.path.join(tmp, "cheattool")
+        with open("/bin/sh", "rb") as src, open(tool, "wb") as dst:
+            dst.write(src.read() + b"cheattool")  # a hash of its own, so banning it does not ban sh
+        os.chmod(tool, 0o755)
+        rules = ProcessRules.from_settings([], ["cheattool"])
+        terminator = ProcessTerminator(timeout=0.5)
+
+        # Each tree: the tool with two children; every other root ignores SIGTERM and has to be killed
+        roots = []
+        for i in range(trees):
+            trap = 'trap "" TERM; ' if i % 2 else ''
+            roots.append(subprocess.Popen([tool, "-c", f"{trap}sleep 60 & sleep 60 & wait"]))
+        time.sleep(0.3)
+        batch = [(psutil.Process(root.pid), "cheattool", rules.match("cheattool")) for root in roots]
+        members = sum(1 + len(process.children(recursive=True)) for process, _, _ in batch)
+        start = time.perf_counter()
+        alive = terminator.terminate(batch)
+        elapsed = time.perf_counter() - start
+        for root in roots:
+            root.wait()
+        left = sum(1 for process, _, _ in batch if process.is_running())
+        print(f"{trees} trees ({members} processes) in one batch: {elapsed * 1e3:.0f} ms, "
+              f"{terminator.terminated} exited on terminate, {terminator.killed} needed kill, "
+              f"{len(alive)} survived, {left} roots still running")
+
+        # A launcher relaunching the tool as a fresh copy under a new name every 50 ms; it is a renamed sh,
+        # since shells themselves are protected parents
+        launcher_sh = os.path.join(tmp, "respawner")
+        shutil.copy("/bin/sh", launcher_sh)
+        script = (f'i=0; while true; do i=$((i+1)); cp {tool} {tmp}/copy$i; '
+                  f'{tmp}/copy$i -c "sleep 60"; sleep 0.05; done')
+        kills = []
+        def on_match(process, name, rule):
+            kills.append((time.monotonic(), name, rule.type))
+            return terminator.submit(process, name, rule)
+        monitor = ProcessMonitor(rules, on_match, banned=terminator.banned)
+        monitor.scan()
+        monitor.start()
+        start = time.monotonic()
+        launcher = subprocess.Popen([launcher_sh, "-c", f"{tool} -c 'sleep 60'; {script}"])
+        try:
+            launcher.wait(timeout=20)
+            outcome = f"launcher terminated after {time.monotonic() - start:.2f}s"
+        except subprocess.TimeoutExpired:
+            outcome = "launcher still running after 20s"
+            launcher.kill()
+            launcher.wait()
+        time.sleep(0.3)
+        monitor.stop()
+        terminator.stop()
+        by_type = collections.Counter(kind for _, _, kind in kills)
+        print(f"respawning launcher: {outcome}; {len(kills)} launches caught "
+              f"({', '.join(f'{n} by {kind} rule' for kind, n in sorted(by_type.items()))}), "
+              f"backend {monitor.backend.name}, terminator {terminator.stats()}")
+
+def bench_allowlist(processes, launches):
+    """Allowlist baseline and per-process decision cost on a fake /proc whose exe links point at real files,
+    then the delay between a real launch and its refusal on this machine"""
+    if not sys.platform.startswith("linux"):
+        print("The allowlist benchmark fakes /proc and runs on Linux only")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        binaries = []
+        for i in range(200):
+            path = os.path.join(tmp, "bin", f"app{i}.exe")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(os.urandom(512 * 1024))
+            binaries.append(path)
+        procfs = os.path.join(tmp, "proc")
+        os.makedirs(procfs)
+        pids = _fake_procfs(procfs, processes)
+        for pid in pids:
+            os.symlink(binaries[pid % len(binaries)], os.path.join(procfs, str(pid), "exe"))
+        hashes = ExecutableHashes()
+        start = time.perf_counter()
+        allowlist = ProcessAllowlist.from_baseline(ProcfsBackend(procfs), hashes=hashes)
+        print(f"baseline of {processes:,} processes over {len(binaries)} executables: "
+              f"{(time.perf_counter() - start) * 1e3:.0f} ms, {hashes.hashed} files hashed")
+
+        unknown = os.path.join(tmp, "cheat.exe")
+        with open(unknown, "wb") as f:
+            f.write(os.urandom(512 * 1024))
+        cases = (("allowlisted executable", binaries[7], None), ("executable not on the list", unknown, "allowlist"))
+        for label, exe, expected in cases:
+            calls = 20_000
+            start = time.perf_counter()
+            for _ in range(calls):
+                rule = allowlist.match("app.exe", exe)
+            per = (time.perf_counter() - start) / calls
+            print(f"decision, {label:28} {per * 1e6:7.1f} us/process, rule {rule.type if rule else None} "
+                  f"(expected {expected})")
+        with open(binaries[7], "ab") as f:
+            f.write(b"patched")
+        start = time.perf_counter()
+        rule = allowlist.match("app.exe", binaries[7])
+        print(f"decision, {'allowlisted file modified':28} {(time.perf_counter() - start) * 1e6:7.1f} us "
+              f"(re-hashed once), rule {rule.type if rule else None} (expected allowlist)")
+
+        # Real launches: sleep was running at baseline and may run again; a copy of it elsewhere may not
+        copy = os.path.join(tmp, "sleeper")
+        with open(shutil.which("sleep"), "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        os.chmod(copy, 0o755)
+        holder = subprocess.Popen(["sleep", "60"])
+        for make in (PsutilBackend, ProcfsBackend, NetlinkBackend):
+            try:
+                backend = make()
+            except OSError as e:
+                print(f"real launches, {make.name} backend: unavailable ({e})")
+                continue
+            allowlist = ProcessAllowlist.from_baseline(backend)
+            spawned, seen, children = {}, {}, []
+            def on_match(process, name, rule):
+                if rule.type == "allowlist" and not allowlist.started_by_shield(process):
+                    return True  # only what this benchmark launched counts
+                seen.setdefault(process.pid, (time.monotonic(), name))  # may fire before Popen has returned
+                return True
+            interval = None if backend.event_driven else Config.PROCESS_ALLOWLIST_SCAN_INTERVAL
+            monitor = ProcessMonitor(allowlist, on_match, interval=interval, backend=backend)
+            monitor.scan()
+            if not backend.event_driven:
+                scans = 2000
+                start = time.process_time()
+                for _ in range(scans):
+                    monitor.scan()
+                per = (time.process_time() - start) / scans
+                print(f"idle scan, {backend.name} backend: {per * 1e6:.1f} us CPU, {per / interval * 100:.2f}% of a "
+                      f"core every {interval * 1e3:.0f} ms")
+            monitor.start()
+            for i in range(launches):
+                time.sleep(random.uniform(0.05, 0.2))
+                child = subprocess.Popen([copy if i % 2 else "sleep", "0.3"])
+                spawned[child.pid] = (time.monotonic(), bool(i % 2))
+                children.append(child)
+            time.sleep(Config.PROCESS_SCAN_INTERVAL * 2)
+            monitor.stop()
+            for child in children:
+                child.wait()
+            refused = sorted(max(0.0, seen[pid][0] - started) for pid, (started, bad) in spawned.items()
+                             if bad and pid in seen)
+            wrong = sum(1 for pid, (_, bad) in spawned.items() if not bad and pid in seen)
+            bad_total = sum(1 for _, bad in spawned.values() if bad)
+            if refused:
+                print(f"real launches, {backend.name} backend: {len(refused)}/{bad_total} copies refused, "
+                      f"p50 {refused[len(refused) // 2] * 1e3:.2f} ms, max {refused[-1] * 1e3:.2f} ms after Popen; "
+                      f"{wrong}/{len(spawned) - bad_total} allowlisted launches refused")
+            else:
+                print(f"real launches, {backend.name} backend: nothing refused out of {bad_total} copies")
+        holder.kill()
+        holder.wait()
+
+def bench_queries(rows):
+    """EXPLAIN QUERY PLAN (for one mid-range partition) and timings for query_activity_logs"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "queries.db"))
+        t0 = time.perf_counter()
+        _generate_activity_logs(db, rows)
+        print(f"generated {rows} rows in {time.perf_counter() - t0:.1f}s")
+        conn = db.pool.reader()
+        max_id = db.latest_log_id()
+        mid_ts = db.query_activity_logs(1, cursor=max_id // 2 + 1)[0][0][3]
+        mid_table = db.partitions.table_name(db.partitions.day_of(mid_ts))
+
+        cases = [
+            ("newest page", {}),
+            ("deep page by id", {"cursor": max_id // 2}),
+            ("deep page by timestamp", {"order_by": "timestamp", "cursor": (mid_ts, max_id // 2)}),
+            ("action prefix", {"action_prefix": "SUSPICIOUS"}),
+            ("blocked only", {"blocked": True, "cursor": max_id // 2}),
+            ("time range", {"since": mid_ts, "until": "9999-12-31 00:00:00", "order_by": "timestamp"}),
+            ("prefix + blocked + range", {"action_prefix": "MOUSE", "blocked": True, "since": mid_ts}),
+        ]
+        columns = ("id", "action", "details", "timestamp", "blocked", "user_id")
+        for label, kwargs in cases:
+            t0 = time.perf_counter()
+            for _ in range(5):
+                db.query_activity_logs(100, **kwargs)
+            elapsed = (time.perf_counter() - t0) / 5 * 1000
+            plan = db._plan_log_query(conn, **kwargs)
+            where, params = plan["where_for"](mid_table)
+            sql = db.partitions.partition_sql(mid_table, db.partitions.stored_columns(columns), where,
+                                              db.partitions.order_clause(plan["order_by"], plan["descending"]))
+            explain = conn.execute("EXPLAIN QUERY PLAN " + sql, list(params) + [100]).fetchall()
+            print(f"\n{label}: {elapsed:.2f} ms")
+            for row in explain:
+                print(f"    {mid_table}: {row[-1]}")
+
+        offset = max_id // 2
+        legacy = "SELECT action, details, timestamp, blocked FROM activity_logs ORDER BY timestamp DESC LIMIT 100 OFFSET ?"
+        print(f"\nOFFSET {offset} page over the activity_logs view (for comparison): "
+              f"{_time_query(conn, legacy, (offset,), repeat=1):.2f} ms")
+        db.close()
+
+def bench_search(rows):
+    """search_activity_logs timings (FTS5) against a LIKE scan of the activity_logs view"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "search.db"))
+        t0 = time.perf_counter()
+        _generate_activity_logs(db, rows)
+        print(f"generated {rows} rows in {time.perf_counter() - t0:.1f}s")
+        conn = db.pool.reader()
+
+        cases = [
+            ("phrase, newest", '"alt tab"', {"order": "newest"}),
+            ("prefix, newest", "task*", {"order": "newest"}),
+            ("term + blocked, newest", "chrome", {"order": "newest", "blocked": True}),
+            ("phrase, by rank", '"side button"', {}),
+            ("column filter, by rank", "action:suspicious cmd", {}),
+        ]
+        print(f"{'case':<26}{'fts ms':>10}")
+        for label, text, kwargs in cases:
+            t0 = time.perf_counter()
+            for _ in range(5):
+                db.search_activity_logs(text, limit=50, **kwargs)
+            print(f"{label:<26}{(time.perf_counter() - t0) / 5 * 1000:>10.2f}")
+
+        legacy = ("SELECT action, details, timestamp, blocked FROM activity_logs "
+                  "WHERE details LIKE ? ORDER BY id DESC LIMIT 50")
+        print(f"\nLIKE '%task%' over the activity_logs view (for comparison): "
+              f"{_time_query(conn, legacy, ('%task%',), repeat=1):.2f} ms")
+        db.close()
+
+def _text_layout_store(conn, table, rows, first_id):
+    """Write rows as a partition would hold them without interning: plain action/details text, with the same
+    later columns (session, coalescing, severity, category, epoch) and indexes as LogPartitions"""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, user_id INTEGER, action TEXT NOT NULL, "
+                 f"details TEXT, timestamp TIMESTAMP NOT NULL, blocked BOOLEAN DEFAULT FALSE, ip_address TEXT, "
+                 f"session_id INTEGER, count INTEGER NOT NULL DEFAULT 1, last_seen TIMESTAMP, "
+                 f"severity INTEGER NOT NULL DEFAULT 0, category INTEGER NOT NULL DEFAULT 0, epoch INTEGER)")
+    for column in LogPartitions.INDEXES:
+        conn.execute(LogPartitions.index_sql(table, "action" if column == "action_id" else column))
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+                 f"action, details, content='{table}', content_rowid='id', prefix='2 3')")
+    conn.executemany(f"INSERT INTO {table} (id, user_id, action, details, timestamp, blocked, severity, category, "
+                     f"epoch) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     [(first_id + i,) + row + classify(row[1], row[4]) + (LogPartitions.epoch(row[3]),)
+                      for i, row in enumerate(rows)])
+    conn.executemany(f"INSERT INTO {table}_fts (rowid, action, details) VALUES (?, ?, ?)",
+                     [(first_id + i, row[1], row[2]) for i, row in enumerate(rows)])
+
+def _file_size(conn, path):
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(path)
+
+def bench_storage(events):
+    """Database size and insert throughput, text layout versus interned actions/templates"""
+    corpus = list(_corpus(events))
+    batch = Config.LOG_BATCH_SIZE
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, "text.db")
+        conn = sqlite3.connect(before_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        t0 = time.perf_counter()
+        for start in range(0, events, batch):
+            rows = corpus[start:start + batch]
+            # Same day grouping as LogPartitions.insert
+            for day in sorted({row[3][:10] for row in rows}):
+                part = [row for row in rows if row[3][:10] == day]
+                _text_layout_store(conn, "activity_logs_" + day.replace("-", ""), part, start + rows.index(part[0]) + 1)
+            conn.commit()
+        before_rate = events / (time.perf_counter() - t0)
+        before_size = _file_size(conn, before_path)
+        conn.close()
+
+        db = DatabaseManager(os.path.join(tmp, "interned.db"))
+        t0 = time.perf_counter()
+        for start in range(0, events, batch):
+            with db.pool.writer() as conn:
+                db.partitions.insert(conn, corpus[start:start + batch])
+        after_rate = events / (time.perf_counter() - t0)
+        conn = db.pool.reader()
+        after_size = _file_size(conn, db.db_path)
+        templates = conn.execute("SELECT COUNT(*) FROM log_templates").fetchone()[0]
+        sample = db.get_activity_logs(3)
+        db.close()
+
+    print(f"{events} events in batches of {batch}")
+    print(f"{'layout':<12}{'size MB':>10}{'bytes/row':>11}{'events/s':>12}")
+    for name, size, rate in (("text", before_size, before_rate), ("interned", after_size, after_rate)):
+        print(f"{name:<12}{size / 1e6:>10.1f}{size / events:>11.1f}{rate:>12.0f}")
+    print(f"size ratio {after_size / before_size:.2f}, {templates} distinct details templates")
+    print(f"newest rows decode as: {sample[0]}")
+
+def bench_export(rows):
+    """Export throughput and peak Python memory per format; memory should not grow with rows"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "export.db"))
+        t0 = time.perf_counter()
+        _generate_activity_logs(db, rows)
+        print(f"generated {rows} rows in {time.perf_counter() - t0:.1f}s")
+        print(f"{'file':<16}{'rows/s':>10}{'size MB':>10}{'peak KB':>10}")
+        for name in ("logs.csv", "logs.jsonl", "logs.csv.gz", "logs.jsonl.gz"):
+            path = os.path.join(tmp, name)
+            tracemalloc.start()
+            job = db.export_activity_logs(path)
+            count = job.wait()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<16}{count / job.elapsed:>10.0f}{os.path.getsize(path) / 1e6:>10.1f}{peak / 1024:>10.0f}")
+            os.remove(path)
+        db.close()
+
+def bench_sessions(rows, session_events):
+    """Session report latency: scanning the session's time window vs the session_id index at
+    close vs the materialized summary"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "sessions.db"))
+        t0 = time.perf_counter()
+        _generate_activity_logs(db, rows)
+        with db.pool.writer() as conn:
+            session_id = db.sessions.open(conn, "Benchmark exam")
+            # Back-date the session to three hours ending now, interleaved with untagged traffic
+            start = time.time() - 3 * 3600
+            conn.execute("UPDATE exam_sessions SET start_time=? WHERE id=?",
+                         (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start)), session_id))
+            step = 3 * 3600 / session_events
+            tagged = [row[:3] + (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + i * step)), row[4],
+                                 session_id if i % 4 else None)
+                      for i, row in enumerate(_corpus(session_events, seed=11))]
+            db.partitions.insert(conn, tagged)
+            conn.execute("ANALYZE")
+        print(f"generated {rows + session_events} rows in {time.perf_counter() - t0:.1f}s")
+        conn = db.pool.reader()
+        since, until = db._session_bounds(session_id)[0], time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        window = _time_query(conn, "SELECT action, COUNT(*), SUM(blocked), MIN(timestamp), MAX(timestamp) "
+                                   "FROM activity_logs WHERE timestamp >= ? AND timestamp <= ? GROUP BY action",
+                             (since, until))
+        print(f"time-window scan of the activity_logs view: {window:.1f} ms (also counts untagged events)")
+        t0 = time.perf_counter()
+        with db.pool.writer() as wconn:
+            summary = db.sessions.close(wconn, db.partitions, session_id)
+        print(f"close (session_id index + materialize): {(time.perf_counter() - t0) * 1e3:.1f} ms, "
+              f"{summary['events']} events")
+        samples = []
+        for _ in range(200):
+            t0 = time.perf_counter()
+            db.get_session_report(session_id)
+            samples.append((time.perf_counter() - t0) * 1e3)
+        print(f"get_session_report (materialized): p50 {_percentile(samples, 50):.3f} ms, "
+              f"p99 {_percentile(samples, 99):.3f} ms")
+        db.close()
+
+def bench_merge(sources, events):
+    """Merge `sources` original-schema workstation databases of `events` rows each"""
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        paths = []
+        for n in range(sources):
+            path = os.path.join(tmp, f"LAB-PC-{n + 1:03d}", "exam_shield.db")
+            os.makedirs(os.path.dirname(path))
+            _create_legacy_schema(path)
+            with sqlite3.connect(path) as conn:
+                conn.executemany("INSERT INTO activity_logs (user_id, action, details, timestamp, blocked) "
+                                 "VALUES (?, ?, ?, ?, ?)", _corpus(events, days=30, seed=n))
+            paths.append(path)
+        print(f"generated {sources} x {events} events in {time.perf_counter() - t0:.1f}s")
+
+        db = DatabaseManager(os.path.join(tmp, "central.db"))
+        result = DatabaseMerger(db).merge(paths)
+        db.close()
+        load = result["seconds"] - result["index_seconds"]
+        total = result["rows"]
+        print(f"merged {total} rows in {result['seconds']:.1f}s "
+              f"(copy {load:.1f}s at {total / load:.0f} rows/s, indexes {result['index_seconds']:.1f}s)")
+        per_source = result["seconds"] / sources
+        print(f"{per_source:.2f}s per source; 300 sources would take about {per_source * 300 / 60:.1f} min")
+
+def _commit_batches(db, samples, stop):
+    """The same work as BatchLogWriter: a 20-event group commit every 10 ms, timed in ms"""
+    while not stop.is_set():
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        batch = [(None, "MOUSE_BLOCKED", "Blocked Middle Button Down button action", ts, True)] * 20
+        t0 = time.perf_counter()
+        with db.pool.writer() as conn:
+            db.partitions.insert(conn, batch)
+            db.rollups.apply(conn, batch)
+        samples.append((time.perf_counter() - t0) * 1e3)
+        time.sleep(0.01)
+
+def _measure_commits(db, during):
+    """Run during() while _commit_batches() logs; returns (latency samples, during's result)"""
+    samples, stop = [], threading.Event()
+    thread = threading.Thread(target=_commit_batches, args=(db, samples, stop))
+    thread.start()
+    result = during()
+    stop.set()
+    thread.join()
+    return samples, result
+
+def _print_commit_latency(phases):
+    print(f"{'writer':<16}{'commits':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, samples in phases:
+        print(f"{name:<16}{len(samples):>9}{_percentile(samples, 50):>9.2f}{_percentile(samples, 99):>9.2f}"
+              f"{max(samples):>9.2f}")
+
+def bench_backup(rows, pages):
+    """Batch-commit latency while idle versus while an online snapshot is being taken"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "backup.db"))
+        t0 = time.perf_counter()
+        _generate_activity_logs(db, rows)
+        size = os.path.getsize(db.db_path)
+        print(f"generated {rows} rows ({size / 1e6:.0f} MB) in {time.perf_counter() - t0:.1f}s")
+
+        scheduler = BackupScheduler(db.pool, db.db_path, backup_dir=os.path.join(tmp, "backups"),
+                                    interval=0, keep=1, pages=pages)
+        idle, _ = _measure_commits(db, lambda: time.sleep(3))
+        busy, report = _measure_commits(db, lambda: scheduler.backup_now(wait=True))
+        scheduler.stop()
+        db.close()
+
+        _print_commit_latency((("idle", idle), ("during backup", busy)))
+        if report["error"]:
+            print(f"backup failed: {report['error']}")
+            return
+        print(f"snapshot {report['bytes'] / 1e6:.0f} MB in {report['seconds']:.1f}s "
+              f"({report['bytes'] / 1e6 / report['seconds']:.0f} MB/s, {pages} pages per step), "
+              f"integrity {'ok' if verify_snapshot(report['path']) else 'FAILED'}")
+
+def bench_vacuum(rows, slice_pages):
+    """Retention over a 90-day corpus, then incremental vacuum slices, with commit latency"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "vacuum.db"))
+        _generate_activity_logs(db, rows)
+        with db.pool.writer() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        before = db.get_storage_stats()
+        scheduler = MaintenanceScheduler(db, interval=3600, slice_pages=slice_pages)
+        idle, _ = _measure_commits(db, lambda: time.sleep(3))
+        retention, dropped = _measure_commits(db, db.cleanup_old_logs)
+        freed = db.get_storage_stats()["freelist_pages"]
+        vacuum, report = _measure_commits(db, scheduler.run_once)
+        scheduler.stop()
+        after = db.get_storage_stats()
+        db.close()
+
+        _print_commit_latency((("idle", idle), ("retention", retention), ("vacuum slices", vacuum)))
+        print(f"retention dropped {len(dropped)} day(s), freeing {freed} pages; reclaimed "
+              f"{report['reclaimed_pages']} in {report['seconds']:.1f}s ({slice_pages} pages per slice)")
+        print(f"file {before['file_bytes'] / 1e6:.1f} MB -> {after['file_bytes'] / 1e6:.1f} MB, "
+              f"auto_vacuum={after['auto_vacuum']}")
+
+def bench_migrate(rows):
+    """Upgrade an original-schema database: foreground migration, background index builds and
+    the longest writer wait while they run, then the cost of opening the current database"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "legacy.db")
+        _create_legacy_schema(path)
+        with sqlite3.connect(path) as conn:
+            conn.executemany("INSERT INTO activity_logs (user_id, action, details, timestamp, blocked) "
+                             "VALUES (?, ?, ?, ?, ?)", _corpus(rows))
+        print(f"legacy database: {rows} rows, {os.path.getsize(path) / 1e6:.0f} MB")
+
+        t0 = time.perf_counter()
+        db = DatabaseManager(path)
+        print(f"migrations applied in {time.perf_counter() - t0:.1f}s")
+        stop, waits = db._index_builds, []
+        if stop:
+            stop.set()
+            migrator = SchemaMigrator(db)
+            done = threading.Event()
+            t0 = time.perf_counter()
+            thread = threading.Thread(target=lambda: (migrator.build_indexes(), done.set()))
+            thread.start()
+            while not done.is_set():
+                w0 = time.perf_counter()
+                with db.pool.writer():
+                    pass
+                waits.append((time.perf_counter() - w0) * 1e3)
+                time.sleep(0.01)
+            thread.join()
+            print(f"indexes built in {time.perf_counter() - t0:.1f}s; writer wait p50 {_percentile(waits, 50):.1f} ms, "
+                  f"p99 {_percentile(waits, 99):.1f} ms, max {max(waits):.1f} ms")
+        db.close()
+
+        opens, checks = [], []
+        for _ in range(20):
+            t0 = time.perf_counter()
+            db = DatabaseManager(path)
+            opens.append((time.perf_counter() - t0) * 1e3)
+            t0 = time.perf_counter()
+            SchemaMigrator(db).version()
+            checks.append((time.perf_counter() - t0) * 1e3)
+            db.close()
+        print(f"reopening the current database: DatabaseManager() p50 {_percentile(opens, 50):.2f} ms, "
+              f"schema check p50 {_percentile(checks, 50):.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Exam Shield benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("database", help="per-method DatabaseManager throughput")
+    p.add_argument("--calls", type=int, default=2000)
+    p = sub.add_parser("writer", help="log_activity caller latency, direct vs batched")
+    p.add_argument("--events", type=int, default=20000)
+    p = sub.add_parser("logger", help="ExamShieldLogger per-event caller cost, synchronous vs queued")
+    p.add_argument("--events", type=int, default=20000)
+    p = sub.add_parser("coalesce", help="rows written for a storm of repeated events")
+    p.add_argument("--events", type=int, default=100_000)
+    p = sub.add_parser("segments", help="JSONL file log segments: write rate, range reads, retention")
+    p.add_argument("--records", type=int, default=500_000)
+    p.add_argument("--segment-kb", type=int, default=1024)
+    p = sub.add_parser("journal", help="binary event journal: append cost, day scans and range lookups")
+    p.add_argument("--events", type=int, default=1_000_000)
+    p = sub.add_parser("processes", help="process monitor CPU and detection latency on a fake process table")
+    p.add_argument("--processes", type=int, default=2000)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p = sub.add_parser("rules", help="compiled process rule evaluation against a synthetic process table")
+    p.add_argument("--rules", type=int, default=10_000)
+    p.add_argument("--processes", type=int, default=1000)
+    p = sub.add_parser("terminate", help="process tree termination and repeat-launcher handling (Linux)")
+    p.add_argument("--trees", type=int, default=20)
+    p = sub.add_parser("allowlist", help="default-deny allowlist baseline, decision cost and refusal delay (Linux)")
+    p.add_argument("--processes", type=int, default=2000)
+    p.add_argument("--launches", type=int, default=40)
+    p = sub.add_parser("queries", help="EXPLAIN QUERY PLAN for the keyset log query API")
+    p.add_argument("--rows", type=int, default=5_000_000)
+    p = sub.add_parser("search", help="FTS5 search_activity_logs timings")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p = sub.add_parser("storage", help="database size and insert rate, text vs interned layout")
+    p.add_argument("--events", type=int, default=1_000_000)
+    p = sub.add_parser("export", help="streaming export throughput and memory")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p = sub.add_parser("sessions", help="exam session report latency")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--session-events", type=int, default=20_000)
+    p = sub.add_parser("merge", help="bulk merge of workstation databases")
+    p.add_argument("--sources", type=int, default=20)
+    p.add_argument("--events", type=int, default=100_000)
+    p = sub.add_parser("backup", help="writer latency during an online snapshot")
+    p.add_argument("--rows", type=int, default=2_000_000)
+    p.add_argument("--pages", type=int, default=Config.BACKUP_PAGES_PER_STEP)
+    p = sub.add_parser("migrate", help="schema upgrade of an original-schema database")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p = sub.add_parser("vacuum", help="retention and incremental vacuum with writer latency")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--slice-pages", type=int, default=Config.VACUUM_SLICE_PAGES)
+    args = parser.parse_args()
+
+    if args.command == "database":
+        bench_database(args.calls)
+    elif args.command == "writer":
+        bench_writer(args.events)
+    elif args.command == "logger":
+        bench_logger(args.events)
+    elif args.command == "coalesce":
+        bench_coalesce(args.events)
+    elif args.command == "segments":
+        bench_segments(args.records, args.segment_kb)
+    elif args.command == "journal":
+        bench_journal(args.events)
+    elif args.command == "processes":
+        bench_processes(args.processes, args.seconds)
+    elif args.command == "rules":
+        bench_rules(args.rules, args.processes)
+    elif args.command == "terminate":
+        bench_terminate(args.trees)
+    elif args.command == "allowlist":
+        bench_allowlist(args.processes, args.launches)
+    elif args.command == "queries":
+        bench_queries(args.rows)
+    elif args.command == "search":
+        bench_search(args.rows)
+    elif args.command == "storage":
+        bench_storage(args.events)
+    elif args.command == "export":
+        bench_export(args.rows)
+    elif args.command == "sessions":
+        bench_sessions(args.rows, args.session_events)
+    elif args.command == "merge":
+        bench_merge(args.sources, args.events)
+    elif args.command == "backup":
+        bench_backup(args.rows, args.pages)
+    elif args.command == "migrate":
+        bench_migrate(args.rows)
+    elif args.command == "vacuum":
+        bench_vacuum(args.rows, args.slice_pages)
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,9 @@ class Config:
     # Database settings
     DATABASE_NAME = "exam_shield.db"
     DATABASE_PATH = os.path.join(os.path.dirname(__file__), DATABASE_NAME)
+    DB_BUSY_TIMEOUT = 5.0               # seconds to wait on a locked database
+    DB_CACHE_SIZE_KB = 8192             # page cache per connection
+    DB_MMAP_SIZE = 64 * 1024 * 1024     # memory-mapped I/O window
     
     # Security settings - KEEPING ORIGINAL NAMES
     DEFAULT_ADMIN_USERNAME = "admin"
@@ -69,5 +72,72 @@ class Config:
     }
     
     # Logging settings
+    LOGS_DIR = os.path.join(os.path.dirname(__file__), "logs")
     LOG_RETENTION_DAYS = 30
     MAX_LOG_ENTRIES = 10000
+    LOG_SEGMENT_MAX_BYTES = 16 * 1024 * 1024  # file log segments also rotate at local midnight
+    LOG_SEGMENT_COMPRESS = True         # gzip closed segments in the background
+
+    # Batched activity log writer
+    LOG_BATCH_SIZE = 200                # rows per group commit
+    LOG_BATCH_INTERVAL = 0.25           # seconds to wait for a batch to fill
+    LOG_QUEUE_SIZE = 10000              # events held in memory before overflow
+    LOG_OVERFLOW_POLICY = "drop_oldest" # drop_oldest, block or spill (to <db>.spill)
+
+    # Binary event journal written next to the database (<db>.journal, see event_journal)
+    JOURNAL_ENABLED = True
+    JOURNAL_SEGMENT_RECORDS = 262144    # records per preallocated segment (32 bytes each)
+    JOURNAL_DETAILS_BYTES = 16 * 1024 * 1024  # preallocated details text per segment
+    JOURNAL_MAX_DETAILS = 4096          # longer details are truncated in the journal
+
+    # Coalescing of repeated identical events (see log_coalescer)
+    LOG_COALESCE_WINDOW = 2.0           # seconds of quiet that end a run of identical events
+    LOG_COALESCE_MAX_SPAN = 30.0        # a run still going is written out at least this often
+    LOG_COALESCE_MAX_RUNS = 5000        # runs tracked at once; the oldest join their backlog beyond this
+    LOG_RATE_LIMITS = {                 # action: (rows per second, burst); overridable by the log_rate_limits setting
+        'MOUSE_BLOCKED': (1, 10),
+        'BLOCKED_KEY_ATTEMPT': (1, 10),
+        'SUSPICIOUS_PROCESS': (0.5, 5),
+    }
+    LOG_RATE_LIMIT_DEFAULT = (20, 100)
+    LOG_RATE_BACKLOG = 100              # finished runs per action waiting for a token; more fold into one row
+
+    # Process monitoring during exam mode (see process_monitor and process_backends)
+    PROCESS_MONITOR_BACKEND = "auto"    # auto, psutil, procfs or netlink
+    PROCESS_MODE = "blocklist"          # or "allowlist": only the baseline and process_allowlist may run
+    PROCESS_SCAN_INTERVAL = 0.15        # seconds between PID table diffs
+    PROCESS_ALLOWLIST_SCAN_INTERVAL = 0.025  # the same in allowlist mode on polled backends, to refuse within ~50 ms
+    PROCESS_RETRY_INTERVAL = 2.0        # a matched process that survived termination is retried this often
+    PROCESS_HASH_CACHE = 4096           # executables whose SHA-256 is kept (see process_rules)
+    PROCESS_KILL_TIMEOUT = 1.0          # seconds a terminated process tree gets before it is killed
+    PROCESS_BAN_SECONDS = 120.0         # a killed executable's hash is blocked on sight for this long
+    PROCESS_REPEAT_WINDOW = 60.0        # a parent whose children are killed PROCESS_REPEAT_LIMIT times
+    PROCESS_REPEAT_LIMIT = 3            # within this window is terminated as well
+    PROCESS_KILL_ATTEMPTS = 5           # a process that survives kill is retried this often, backing off, then left
+    # Parents never terminated for relaunching blocked tools: system processes, desktop shells and
+    # launchers, terminals and command shells
+    PROCESS_PROTECTED_PARENTS = [
+        'explorer.exe', 'services.exe', 'wininit.exe', 'winlogon.exe', 'svchost.exe', 'sihost.exe',
+        'runtimebroker.exe', 'startmenuexperiencehost.exe', 'searchhost.exe', 'taskhostw.exe', 'dllhost.exe',
+        'conhost.exe', 'openconsole.exe', 'windowsterminal.exe', 'cmd.exe', 'powershell.exe', 'pwsh.exe',
+        'systemd', 'init', 'launchd', 'gnome-shell', 'plasmashell', 'krunner', 'kwin_x11', 'kwin_wayland',
+        'xfce4-panel', 'xfdesktop', 'lxpanel', 'cinnamon', 'mate-panel', 'gnome-session-binary', 'dbus-daemon',
+        'xdg-desktop-portal', 'gnome-terminal-server', 'konsole', 'xterm', 'xfce4-terminal', 'tilix', 'alacritty',
+        'kitty', 'terminator', 'tmux: server', 'screen', 'sh', 'bash', 'dash', 'zsh', 'fish', 'ksh', 'tcsh', 'csh',
+        'sshd', 'login', 'sudo', 'su', 'Finder', 'Dock', 'Terminal', 'iTerm2',
+    ]
+
+    # Online database backups
+    BACKUP_DIR = os.path.join(os.path.dirname(__file__), "backups")
+    BACKUP_INTERVAL_MINUTES = 15        # 0 = only on demand
+    BACKUP_KEEP = 8                     # snapshots retained
+    BACKUP_PAGES_PER_STEP = 256         # pages copied per writer-lock hold
+    BACKUP_STEP_PAUSE = 0.002           # seconds the writer lock is free between steps
+
+    # Idle-time maintenance (retention and incremental vacuum); never runs during exam mode
+    MAINTENANCE_CHECK_SECONDS = 30      # how often to look for an idle window
+    MAINTENANCE_IDLE_SECONDS = 60       # no activity logs written for this long
+    MAINTENANCE_IDLE_CPU = 30           # and system CPU below this percentage
+    RETENTION_CHECK_HOURS = 6
+    VACUUM_SLICE_PAGES = 256            # pages returned to the OS per writer-lock hold
+    VACUUM_SLICE_PAUSE = 0.05
@@ -0,0 +1,129 @@
+"""
+Connection pool for Exam Shield
+One long-lived writer connection plus one reader connection per thread,
+with the database switched to WAL so readers never wait on the writer.
+A thread's reader is closed when the thread ends, so short-lived worker
+threads (exports, backups, stats refreshes) do not leave connections open.
+"""
+
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from config import Config
+
+class _ReaderHolder:
+    """Kept only in the owning thread's threading.local; it is dropped when the thread ends"""
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+class ConnectionPool:
+    def __init__(self, db_path, on_connect=None, on_rollback=None):
+        self.db_path = db_path
+        self.on_connect = on_connect
+        self.on_rollback = on_rollback   # called after the writer rolls back, to drop state cached from it
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers = set()
+        self._readers_lock = threading.Lock()
+        self._closed = False
+        self._writer = self._connect()
+        # Only takes effect on a new database; db_maintenance converts existing ones when idle
+        self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._writer.execute("PRAGMA journal_mode=WAL")
+
+    def _connect(self):
+        """Open a connection with the shared tuning pragmas (and on_connect hook) applied"""
+        conn = sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(Config.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={int(Config.DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if self.on_connect:
+            self.on_connect(conn)
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Serialize access to the writer connection; commit on success, roll back on error"""
+        with self._write_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                if self.on_rollback:
+                    self.on_rollback()
+                raise
+
+    def backup(self, target, pages=256, pause=0.0, progress=None):
+        """Copy the database into the target connection with SQLite's backup API, `pages` per step.
+
+        Each step runs on the writer connection with the write lock held, and the lock is released
+        for `pause` seconds between steps: writers wait at most one step, and the pages they change
+        are carried into the copy instead of restarting it. progress(remaining, total) is called
+        between steps and may raise to abort the backup.
+        """
+        def step_done(status, remaining, total):
+            self._write_lock.release()
+            try:
+                if progress:
+                    progress(remaining, total)
+                time.sleep(pause)
+            finally:
+                self._write_lock.acquire()
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+
+        with self._write_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            self._writer.backup(target, pages=pages, progress=step_done)
+
+    def reader(self):
+        """Return the calling thread's reader connection, opening it on first use; it is closed when
+        the thread ends"""
+        holder = getattr(self._local, "reader", None)
+        if holder is None:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            holder = _ReaderHolder(self._connect())
+            self._local.reader = holder
+            with self._readers_lock:
+                self._readers.add(holder.conn)
+            weakref.finalize(holder, self._release_reader, holder.conn)
+        return holder.conn
+
+    @property
+    def open_readers(self):
+        with self._readers_lock:
+            return len(self._readers)
+
+    def _release_reader(self, conn):
+        with self._readers_lock:
+            self._readers.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Close the writer and every reader connection handed out so far"""
+        with self._write_lock:
+            self._closed = True
+            with self._readers_lock:
+                for conn in self._readers:
+                    try:
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+                self._readers.clear()
+            try:
+                self._writer.close()
+            except sqlite3.Error:
+                pass
@@ -8,151 +8,565 @@ import sqlite3
 import hashlib
 import datetime
 import os
+import time
 from config import Config
+from connection_pool import ConnectionPool
+from db_backup import BackupScheduler
+from db_maintenance import MaintenanceScheduler, storage_stats
+from exam_sessions import ExamSessions
+from event_journal import EventJournal
+from log_coalescer import EventCoalescer
+from log_writer import BatchLogWriter, CommitNotifier, LogEvent
+from log_dictionary import LogDictionary
+from log_export import EXPORT_COLUMNS, ExportJob, detect_format, open_output, write_rows
+from log_partitions import LogPartitions, build_match_query
+from log_rollups import LogRollups
+from log_severity import CATEGORIES, SEVERITY_NAMES, category_code, register as register_severity
+from schema_migrations import SCHEMA_VERSION, SchemaMigrator
+from settings_cache import SettingsCache
+
+def _format_timestamp(value):
+    """Convert a datetime (naive = local time) to the UTC text format stored in activity_logs"""
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+def _register_functions(conn):
+    """SQL functions the partition views, copies and migrations rely on"""
+    LogDictionary.register(conn)
+    register_severity(conn)
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_path = Config.DATABASE_PATH
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        self.pool = ConnectionPool(self.db_path, on_connect=_register_functions)
+        self.partitions = LogPartitions()
+        # Day tables and dictionary codes created by a rolled-back write are gone with it
+        self.pool.on_rollback = self.partitions.invalidate
+        self.rollups = LogRollups()
+        self.sessions = ExamSessions()
+        self.settings = SettingsCache(self.pool)
+        self.backups = None
+        self.maintenance = None
+        self.exam_active = False
+        self.active_session_id = None
+        self.last_write = time.monotonic()
+        self._index_builds = None
         self.init_database()
+        self.notifier = CommitNotifier(self.latest_log_id())
+        self.writer = BatchLogWriter(self._write_batch,
+                                     batch_size=Config.LOG_BATCH_SIZE,
+                                     interval=Config.LOG_BATCH_INTERVAL,
+                                     max_queue=Config.LOG_QUEUE_SIZE,
+                                     overflow=Config.LOG_OVERFLOW_POLICY,
+                                     spill_path=self.db_path + ".spill")
+        self.coalescer = EventCoalescer(self.writer.enqueue, limits=self._rate_limits())
+        self.journal = EventJournal(self.db_path + ".journal") if Config.JOURNAL_ENABLED else None
+        self.subscribe_setting(self._on_rate_limits_changed, 'log_rate_limits')
+
+    def flush(self, timeout=5.0):
+        """Block until queued activity logs, including runs still being coalesced, are committed"""
+        self.coalescer.flush()
+        return self.writer.flush(timeout)
+
+    def close(self):
+        """Flush pending activity logs and release the pooled connections"""
+        if self.backups:
+            self.backups.stop()
+        if self.maintenance:
+            self.maintenance.stop()
+        if self._index_builds:
+            self._index_builds.set()
+        self.coalescer.stop()
+        self.writer.stop()
+        if self.journal:
+            self.journal.close()
+        self.pool.close()
+
+    def start_backups(self, on_done=None):
+        """Start scheduled online snapshots and return the BackupScheduler.
+
+        The interval and retention come from the backup_interval_minutes and backup_keep
+        settings (falling back to Config) and follow later changes to them.
+        """
+        if self.backups is None:
+            interval = self.get_setting('backup_interval_minutes', Config.BACKUP_INTERVAL_MINUTES)
+            self.backups = BackupScheduler(self.pool, self.db_path, interval=interval * 60,
+                                           keep=self.get_setting('backup_keep', Config.BACKUP_KEEP),
+                                           on_done=on_done)
+            self.subscribe_setting(self._on_backup_setting_changed, 'backup_interval_minutes')
+            self.subscribe_setting(self._on_backup_setting_changed, 'backup_keep')
+        return self.backups
+
+    def start_maintenance(self):
+        """Start idle-time retention and space reclamation and return the MaintenanceScheduler"""
+        if self.maintenance is None:
+            self.maintenance = MaintenanceScheduler(self)
+            if self.exam_active:
+                self.maintenance.hold()
+        return self.maintenance
+
+    def set_exam_mode(self, active):
+        """Keep background maintenance off the database while an exam is running"""
+        if active == self.exam_active:
+            return
+        self.exam_active = active
+        if self.maintenance:
+            if active:
+                self.maintenance.hold()
+            else:
+                self.maintenance.release()
+
+    def start_exam_session(self, name=None, restrictions=None, admin_id=None):
+        """Open an exam_sessions row; events logged from now on carry its id. Returns the id.
+
+        Sessions a crash left open are closed and summarized first.
+        """
+        if self.active_session_id is not None:
+            return self.active_session_id
+        name = name or datetime.datetime.now().strftime("Exam %Y-%m-%d %H:%M")
+        try:
+            with self.pool.writer() as conn:
+                self.sessions.close_abandoned(conn, self.partitions)
+                self.active_session_id = self.sessions.open(conn, name, admin_id, restrictions)
+        except sqlite3.Error as e:
+            print(f"Error starting exam session: {e}")
+        self.set_exam_mode(True)
+        return self.active_session_id
+
+    def end_exam_session(self):
+        """Close the active session once its queued events are committed, materializing its
+        summary; returns the session report (None if no session was open)"""
+        session_id, self.active_session_id = self.active_session_id, None
+        if session_id is None:
+            self.set_exam_mode(False)
+            return None
+        self.flush()
+        try:
+            with self.pool.writer() as conn:
+                self.sessions.close(conn, self.partitions, session_id)
+        except sqlite3.Error as e:
+            print(f"Error closing exam session: {e}")
+        self.set_exam_mode(False)
+        return self.get_session_report(session_id)
+
+    def get_session_report(self, session_id=None):
+        """Summary of an exam session (the active or most recent one by default): duration,
+        event and blocked counts, per-action counts and the first and last blocked event.
+        Closed sessions read their materialized summary rows."""
+        try:
+            conn = self.pool.reader()
+            if session_id is None:
+                session_id = self.active_session_id
+            if session_id is None:
+                row = conn.execute("SELECT MAX(id) FROM exam_sessions").fetchone()
+                session_id = row[0] if row else None
+            if session_id is None:
+                return None
+            return self.sessions.report(conn, self.partitions, session_id)
+        except sqlite3.Error as e:
+            print(f"Error fetching session report: {e}")
+            return None
+
+    def list_exam_sessions(self, limit=50):
+        try:
+            return self.sessions.list(self.pool.reader(), limit)
+        except sqlite3.Error as e:
+            print(f"Error listing exam sessions: {e}")
+            return []
+
+    def get_storage_stats(self, detail=False):
+        """Database size, freelist and (with detail=True) per-table fragmentation; see
+        db_maintenance.storage_stats. Includes the last maintenance run under "maintenance"."""
+        try:
+            stats = storage_stats(self.pool.reader(), self.db_path, detail)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Storage stats error: {e}")
+            return {}
+        stats["maintenance"] = self.maintenance.last if self.maintenance else None
+        stats["maintenance_held"] = self.exam_active
+        return stats
+
+    def _rate_limits(self, value=None):
+        """Per-action (rows per second, burst) limits: Config.LOG_RATE_LIMITS with the
+        log_rate_limits setting on top"""
+        if value is None:
+            value = self.get_setting('log_rate_limits', {})
+        return {**Config.LOG_RATE_LIMITS, **{action: tuple(limit) for action, limit in (value or {}).items()}}
+
+    def _on_rate_limits_changed(self, key, value):
+        self.coalescer.set_limits(self._rate_limits(value or {}))
+
+    def _on_backup_setting_changed(self, key, value):
+        if key == 'backup_interval_minutes':
+            minutes = Config.BACKUP_INTERVAL_MINUTES if value is None else value
+            self.backups.interval = minutes * 60
+        else:
+            self.backups.keep = Config.BACKUP_KEEP if value is None else value
 
     def init_database(self):
-        """Initialize database and create tables if they don't exist"""
+        """Bring the schema up to date; a current database costs a single PRAGMA read.
+
+        Partition indexes queued by a migration are built afterwards on a background thread.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT UNIQUE NOT NULL,
-                        password_hash TEXT NOT NULL,
-                        role TEXT NOT NULL DEFAULT 'admin',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        last_login TIMESTAMP
-                    )
-                ''')
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS activity_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        action TEXT NOT NULL,
-                        details TEXT,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        blocked BOOLEAN DEFAULT FALSE,
-                        ip_address TEXT,
-                        FOREIGN KEY (user_id) REFERENCES users(id)
-                    )
-                ''')
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS settings (
-                        key TEXT PRIMARY KEY,
-                        value TEXT NOT NULL,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS exam_sessions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        session_name TEXT NOT NULL,
-                        admin_id INTEGER,
-                        start_time TIMESTAMP,
-                        end_time TIMESTAMP,
-                        status TEXT DEFAULT 'inactive',
-                        restrictions TEXT,
-                        FOREIGN KEY (admin_id) REFERENCES users(id)
-                    )
-                ''')
-                conn.commit()
-                if not self.admin_exists():
-                    self.create_default_admin()
+            migrator = SchemaMigrator(self)
+            if migrator.version() < SCHEMA_VERSION:
+                migrator.migrate()
+                self._index_builds = migrator.start_index_builds()
         except sqlite3.Error as e:
             print(f"Database initialization error: {e}")
 
     def admin_exists(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
-                count = cursor.fetchone()[0]
-                return count > 0
+            cursor = self.pool.reader().cursor()
+            cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
+            count = cursor.fetchone()[0]
+            return count > 0
         except sqlite3.Error:
             return False
 
     def create_default_admin(self):
         try:
-            password_hash = hashlib.sha256(Config.DEFAULT_PASSWORD.encode()).hexdigest()
-            with sqlite3.connect(self.db_path) as conn:
+            password_hash = hashlib.sha256(Config.DEFAULT_ADMIN_PASSWORD.encode()).hexdigest()
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, 'admin')",
-                               (Config.DEFAULT_USERNAME, password_hash))
-                conn.commit()
+                               (Config.DEFAULT_ADMIN_USERNAME, password_hash))
             print("Default admin created successfully")
         except sqlite3.Error as e:
             print(f"Error creating admin user: {e}")
 
     def verify_admin(self, username, password_hash):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT id FROM users WHERE username=? AND password_hash=? AND role='admin'",
-                               (username, password_hash))
-                row = cursor.fetchone()
-                if row:
-                    cursor.execute("UPDATE users SET last_login=CURRENT_TIMESTAMP WHERE id=?", (row[0],))
-                    conn.commit()
-                    return True
+            cursor = self.pool.reader().cursor()
+            cursor.execute("SELECT id FROM users WHERE username=? AND password_hash=? AND role='admin'",
+                           (username, password_hash))
+            row = cursor.fetchone()
+            if not row:
                 return False
+            with self.pool.writer() as conn:
+                conn.execute("UPDATE users SET last_login=CURRENT_TIMESTAMP WHERE id=?", (row[0],))
+            return True
         except sqlite3.Error as e:
             print(f"Login verification error: {e}")
             return False
 
     def log_activity(self, action, details=None, blocked=False, user_id=None):
+        """Queue an event for the batch writer; never waits on SQLite.
+
+        Repeats of an identical event are coalesced into one row with an exact count (see
+        log_coalescer), so a held-down key does not write a row per keystroke. Every event, repeats
+        included, is appended to the binary journal first (see event_journal).
+        """
+        event = LogEvent(action, details, blocked, user_id, session_id=self.active_session_id)
+        if self.journal:
+            self.journal.append(event)
+        return self.coalescer.add(event)
+
+    def write_events(self, events):
+        """Commit LogEvents in one transaction on the calling thread, for pipelines that already
+        batch on a background thread of their own (see logger.ExamShieldLogger)"""
+        if self.journal:
+            self.journal.extend(events)
+        self._write_batch(events)
+
+    def _write_batch(self, events):
+        rows = [(e.user_id, e.action, e.details, e.timestamp, e.blocked, e.session_id, e.count, e.last_seen_timestamp,
+                 int(e.created)) for e in events]
+        with self.pool.writer() as conn:
+            last_id = self.partitions.insert(conn, rows)
+            self.rollups.apply(conn, rows)
+        self.last_write = time.monotonic()
+        self.notifier.publish(last_id)
+
+    def subscribe(self, callback):
+        """Register callback(last_id), invoked from the writer thread whenever new logs commit"""
+        self.notifier.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        self.notifier.unsubscribe(callback)
+
+    def wait_for_logs(self, after_id, timeout=None):
+        """Block until a log with id > after_id is committed; returns the newest committed id"""
+        return self.notifier.wait(after_id, timeout)
+
+    def latest_log_id(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO activity_logs (user_id, action, details, blocked) VALUES (?, ?, ?, ?)",
-                               (user_id, action, details, blocked))
-                conn.commit()
+            return self.partitions.last_id(self.pool.reader())
         except sqlite3.Error as e:
-            print(f"Activity logging error: {e}")
+            print(f"Error fetching latest log id: {e}")
+            return 0
+
+    def tail_activity_logs(self, after_id=0, limit=500):
+        """Return (rows, cursor) for logs with id > after_id, oldest first.
+
+        Rows are (id, action, details, timestamp, blocked, count, severity, epoch); hold on to cursor
+        and pass it back as after_id to receive only the events committed since.
+        """
+        try:
+            rows = self.partitions.select(self.pool.reader(),
+                                          ("id", "action", "details", "timestamp", "blocked", "count", "severity",
+                                           "epoch"),
+                                          lambda table: ("id > ?", (after_id,)),
+                                          descending=False, limit=limit, min_id=after_id + 1)
+        except sqlite3.Error as e:
+            print(f"Error tailing logs: {e}")
+            return [], after_id
+        return rows, (rows[-1][0] if rows else after_id)
 
     def get_activity_logs(self, limit=100):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT action, details, timestamp, blocked FROM activity_logs ORDER BY timestamp DESC LIMIT ?",
-                               (limit,))
-                return cursor.fetchall()
+            return self.partitions.select(self.pool.reader(), ("action", "details", "timestamp", "blocked"),
+                                          lambda table: ("", ()), limit=limit)
         except sqlite3.Error as e:
             print(f"Error fetching logs: {e}")
             return []
 
-    def save_setting(self, key, value):
+    def query_activity_logs(self, limit=100, cursor=None, order_by="id", descending=True,
+                            action_prefix=None, blocked=None, since=None, until=None, session_id=None,
+                            min_severity=None, category=None):
+        """Keyset-paginated activity log query.
+
+        Returns (rows, next_cursor) where rows are (id, action, details, timestamp, blocked, user_id,
+        count, severity, category, epoch) tuples; action_prefix may be a single prefix or a tuple of
+        them, session_id keeps the events tagged with that exam session, min_severity the events at
+        that severity or above and category (a name or code, see log_severity) one category. Pass
+        next_cursor back as `cursor` to fetch the following page; it is None on the last page. With
+        order_by="id" the cursor is a row id, with order_by="timestamp" a (timestamp, id) pair and
+        with order_by="severity" a (severity, id) pair.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
-                               (key, value))
-                conn.commit()
+            conn = self.pool.reader()
+            plan = self._plan_log_query(conn, cursor, order_by, descending, action_prefix,
+                                        blocked, since, until, session_id, min_severity, category)
+            rows = self.partitions.select(conn,
+                                          ("id", "action", "details", "timestamp", "blocked", "user_id", "count",
+                                           "severity", "category", "epoch"),
+                                          limit=limit, **plan)
         except sqlite3.Error as e:
+            print(f"Error querying logs: {e}")
+            return [], None
+        if len(rows) < limit:
+            return rows, None
+        last = rows[-1]
+        if order_by == "id":
+            return rows, last[0]
+        return rows, ((last[3] if order_by == "timestamp" else last[7]), last[0])
+
+    def _plan_log_query(self, conn, cursor=None, order_by="id", descending=True, action_prefix=None,
+                        blocked=None, since=None, until=None, session_id=None, min_severity=None, category=None):
+        """Translate query_activity_logs filters into LogPartitions.select() arguments"""
+        if order_by not in ("id", "timestamp", "severity"):
+            raise ValueError(f"Unsupported order_by: {order_by}")
+        since, until = _format_timestamp(since), _format_timestamp(until)
+        if session_id is not None:
+            session_start, session_end = self._session_bounds(session_id)
+            since = max(filter(None, (since, session_start)), default=None)
+            until = min(filter(None, (until, session_end)), default=None)
+        where, params = [], []
+        if blocked is not None:
+            where.append("blocked = ?")
+            params.append(1 if blocked else 0)
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("timestamp < ?")
+            params.append(until)
+        if min_severity is not None:
+            where.append("severity >= ?")
+            params.append(min_severity)
+        if category is not None:
+            where.append("category = ?")
+            params.append(category_code(category))
+        if action_prefix:
+            # Equality/IN on action codes lets the (action_id, rowid) index serve ORDER BY id
+            action_ids = self.partitions.dictionary.action_ids_with_prefix(conn, action_prefix)
+            where.insert(0, "action_id = ?" if len(action_ids) == 1
+                         else f"action_id IN ({', '.join('?' * len(action_ids))})")
+            params[0:0] = action_ids
+        if session_id is not None:
+            where.insert(0, "session_id = ?")
+            params.insert(0, session_id)
+        plan = {"order_by": order_by, "descending": descending, "since": since, "until": until}
+        op = "<" if descending else ">"
+        if cursor is not None and order_by == "id":
+            where.append(f"id {op} ?")
+            params.append(cursor)
+            plan["max_id" if descending else "min_id"] = cursor - 1 if descending else cursor + 1
+        elif cursor is not None and order_by == "severity":
+            where.append(f"(severity, id) {op} (?, ?)")
+            params += list(cursor)
+        elif cursor is not None:
+            cursor_ts = _format_timestamp(cursor[0])
+            where.append(f"(timestamp, id) {op} (?, ?)")
+            params += [cursor_ts, cursor[1]]
+            plan["until" if descending else "since"] = cursor_ts
+        plan["where_for"] = lambda table: (" AND ".join(where), params)
+        return plan
+
+    def search_activity_logs(self, text, limit=50, order="rank", action_prefix=None, blocked=None,
+                             since=None, until=None, min_severity=None):
+        """Full-text search over action and details.
+
+        Supports words, "exact phrases", prefix* terms, AND/OR/NOT and action:/details: column
+        filters. Returns (id, action, details_snippet, timestamp, blocked, rank, count) rows with
+        matched terms wrapped in [brackets]; order is "rank" (bm25) or "newest".
+        """
+        match = build_match_query(text)
+        if match is None:
+            return []
+        since, until = _format_timestamp(since), _format_timestamp(until)
+        try:
+            conn = self.pool.reader()
+            action_ids = self.partitions.dictionary.action_ids_with_prefix(conn, action_prefix) if action_prefix else None
+
+            def where_for(table):
+                clauses, values = [], []
+                if action_ids is not None:
+                    clauses.append(f"p.action_id IN ({', '.join('?' * len(action_ids))})")
+                    values += action_ids
+                if blocked is not None:
+                    clauses.append("p.blocked = ?")
+                    values.append(1 if blocked else 0)
+                if min_severity is not None:
+                    clauses.append("p.severity >= ?")
+                    values.append(min_severity)
+                if since is not None:
+                    clauses.append("p.timestamp >= ?")
+                    values.append(since)
+                if until is not None:
+                    clauses.append("p.timestamp < ?")
+                    values.append(until)
+                return " AND ".join(clauses), values
+
+            return self.partitions.search(conn, match, where_for, limit, order, since, until)
+        except sqlite3.Error as e:
+            print(f"Log search error: {e}")
+            return []
+
+    def export_activity_logs(self, path, fmt=None, compression=None, action_prefix=None, blocked=None,
+                             since=None, until=None, progress=None, on_done=None, session_id=None,
+                             min_severity=None):
+        """Stream matching logs to path on a background thread and return the ExportJob.
+
+        fmt is "csv" or "jsonl" and compression None, "gzip" or "zstd"; both default to what the
+        file name implies (logs.csv, logs.jsonl.gz, logs.csv.zst). progress(count) and
+        on_done(job) are called from the export thread. The file only appears once complete.
+        """
+        implied_fmt, implied_compression = detect_format(path)
+        fmt = fmt or implied_fmt
+        compression = compression if compression is not None else implied_compression
+        self.flush()
+
+        def run(tmp_path, report, cancel):
+            conn = self.pool.reader()
+            plan = self._plan_log_query(conn, order_by="id", descending=False, action_prefix=action_prefix,
+                                        blocked=blocked, since=since, until=until, session_id=session_id,
+                                        min_severity=min_severity)
+            rows = ((row[:8] + (SEVERITY_NAMES[row[8]], CATEGORIES[row[9]]))
+                    for row in self.partitions.iterate(conn, EXPORT_COLUMNS, plan["where_for"], plan["since"],
+                                                       plan["until"]))
+            with open_output(tmp_path, compression) as out:
+                count = write_rows(out, rows, fmt, report, cancel)
+            report(count)
+            return count
+
+        return ExportJob(run, path, progress, on_done)
+
+    def estimate_export_rows(self, since=None, until=None):
+        """Cheap upper bound on the rows an export over this time range will write"""
+        try:
+            return self.partitions.estimate_rows(self.pool.reader(), _format_timestamp(since),
+                                                 _format_timestamp(until))
+        except sqlite3.Error:
+            return 0
+
+    def get_event_series(self, resolution="minute", since=None, until=None, action_prefix=None,
+                         blocked=None, by_action=False, fill=False, session_id=None, min_severity=None):
+        """Event counts per minute or hour from the rollup tables.
+
+        Returns (bucket, count) rows, or (bucket, action, count) with by_action=True; buckets are
+        UTC 'YYYY-MM-DD HH:MM:SS' strings. session_id narrows the range to an exam session.
+        """
+        since, until = _format_timestamp(since), _format_timestamp(until)
+        try:
+            if session_id is not None:
+                session_start, session_end = self._session_bounds(session_id)
+                since = max(filter(None, (since, session_start)), default=None)
+                until = min(filter(None, (until, session_end)), default=None)
+            return self.rollups.series(self.pool.reader(), resolution, since, until, action_prefix,
+                                       blocked, by_action, fill, min_severity)
+        except sqlite3.Error as e:
+            print(f"Error fetching event series: {e}")
+            return []
+
+    def rebuild_rollups(self, since_day=None):
+        """Recompute the rollup tables from raw logs (all days, or from 'YYYY-MM-DD' on)"""
+        self.flush()
+        try:
+            with self.pool.writer() as conn:
+                return self.rollups.rebuild(conn, self.partitions, since_day)
+        except sqlite3.Error as e:
+            print(f"Rollup rebuild error: {e}")
+            return 0
+
+    def _session_bounds(self, session_id):
+        """Return the (start_time, end_time) window of an exam session"""
+        row = self.pool.reader().execute("SELECT start_time, end_time FROM exam_sessions WHERE id=?",
+                                         (session_id,)).fetchone()
+        if row is None:
+            raise sqlite3.DataError(f"Unknown exam session: {session_id}")
+        return row
+
+    def save_setting(self, key, value):
+        """Store a JSON-serialisable value and notify listeners if it changed"""
+        try:
+            self.settings.set(key, value)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Settings save error: {e}")
+
+    def save_settings(self, values):
+        """Store several settings in one transaction"""
+        try:
+            self.settings.update(values)
+        except (sqlite3.Error, TypeError, ValueError) as e:
             print(f"Settings save error: {e}")
 
     def get_setting(self, key, default=None):
+        """Cached read; returns the decoded value (or default) without touching SQLite"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT value FROM settings WHERE key=?", (key,))
-                row = cursor.fetchone()
-                return row[0] if row else default
+            return self.settings.get(key, default)
         except sqlite3.Error as e:
             print(f"Settings fetch error: {e}")
             return default
 
+    def subscribe_setting(self, callback, key=None):
+        """Register callback(key, value) for changes to key, or to every key when key is None"""
+        self.settings.subscribe(callback, key)
+
+    def unsubscribe_setting(self, callback, key=None):
+        self.settings.unsubscribe(callback, key)
+
     def cleanup_old_logs(self):
+        """Drop whole day partitions that fall outside Config.LOG_RETENTION_DAYS.
+
+        Each day is dropped in its own transaction so logging is never held up for long.
+        """
+        dropped = []
         try:
-            cutoff_date = datetime.datetime.now() - datetime.timedelta(days=Config.LOG_RETENTION_DAYS)
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM activity_logs WHERE timestamp < ?", (cutoff_date,))
-                conn.commit()
+            cutoff_day = LogPartitions.retention_cutoff(Config.LOG_RETENTION_DAYS)
+            if self.journal:
+                self.journal.prune(cutoff_day)
+            with self.pool.writer() as conn:
+                self.rollups.drop_before(conn, cutoff_day)
+            while True:
+                with self.pool.writer() as conn:
+                    days = self.partitions.drop_before(conn, cutoff_day, limit=1)
+                if not days:
+                    return dropped
+                dropped += days
         except sqlite3.Error as e:
             print(f"Log cleanup error: {e}")
+            return dropped
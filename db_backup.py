@@ -0,0 +1,177 @@
+"""
+Online backups for Exam Shield
+Snapshots of the live database are taken with SQLite's backup API a few
+pages at a time on a background thread (see ConnectionPool.backup), so the
+batch writer keeps committing while a copy is in progress. The newest N
+snapshots are kept; restore_snapshot() copies one back over the database.
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+
+SNAPSHOT_SUFFIX = ".db"
+
+class BackupCancelled(Exception):
+    pass
+
+def snapshot_prefix(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0] + "-"
+
+def list_snapshots(backup_dir, db_path):
+    """Snapshot paths of db_path in backup_dir, newest first"""
+    prefix = snapshot_prefix(db_path)
+    try:
+        names = os.listdir(backup_dir)
+    except FileNotFoundError:
+        return []
+    names = [n for n in names if n.startswith(prefix) and n.endswith(SNAPSHOT_SUFFIX)]
+    # Names embed a sortable UTC timestamp
+    return [os.path.join(backup_dir, n) for n in sorted(names, reverse=True)]
+
+def prune_snapshots(backup_dir, db_path, keep):
+    """Delete all but the newest `keep` snapshots; returns the deleted paths"""
+    removed = []
+    for path in list_snapshots(backup_dir, db_path)[max(keep, 1):]:
+        try:
+            os.remove(path)
+            removed.append(path)
+        except OSError as e:
+            print(f"Could not remove old backup {path}: {e}")
+    return removed
+
+def verify_snapshot(path):
+    """True if the file opens as a database and passes PRAGMA quick_check"""
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+def restore_snapshot(snapshot, db_path, pages=1024):
+    """Copy a snapshot over db_path; run this while Exam Shield is not using the database.
+
+    The copy goes through SQLite rather than the file system, so a stale -wal file next to the
+    database cannot be replayed over the restored pages. Returns the number of pages copied.
+    """
+    if not verify_snapshot(snapshot):
+        raise sqlite3.DatabaseError(f"Backup failed integrity check: {snapshot}")
+    source = sqlite3.connect(f"file:{snapshot}?mode=ro", uri=True)
+    target = sqlite3.connect(db_path, timeout=Config.DB_BUSY_TIMEOUT)
+    try:
+        source.backup(target, pages=pages)
+        return source.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        source.close()
+        target.close()
+
+class BackupScheduler:
+    """Takes a snapshot every `interval` seconds (and on demand) on a background thread.
+
+    `last` holds the most recent result: {"path", "pages", "bytes", "seconds", "started", "error"}.
+    """
+
+    def __init__(self, pool, db_path, backup_dir=None, interval=None, keep=None,
+                 pages=None, pause=None, on_done=None):
+        self.pool = pool
+        self.db_path = db_path
+        self.backup_dir = backup_dir or Config.BACKUP_DIR
+        self.interval = Config.BACKUP_INTERVAL_MINUTES * 60 if interval is None else interval
+        self.keep = Config.BACKUP_KEEP if keep is None else keep
+        self.pages = pages or Config.BACKUP_PAGES_PER_STEP
+        self.pause = Config.BACKUP_STEP_PAUSE if pause is None else pause
+        self.on_done = on_done
+        self.last = None
+        self.progress = (0, 0)
+        self._requested = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="DatabaseBackup", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return not self._idle.is_set()
+
+    def backup_now(self, wait=False, timeout=None):
+        """Request a snapshot; with wait=True block until it finishes and return `last`"""
+        self._idle.clear()
+        self._requested.set()
+        if wait:
+            self._idle.wait(timeout)
+        return self.last
+
+    def stop(self, timeout=5.0):
+        """Stop the schedule, abandoning a snapshot in progress"""
+        self._stop.set()
+        self._requested.set()
+        self._thread.join(timeout)
+
+    def snapshots(self):
+        return list_snapshots(self.backup_dir, self.db_path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._requested.wait(self.interval if self.interval > 0 else None)
+            if self._stop.is_set():
+                break
+            self._requested.clear()
+            self._idle.clear()
+            try:
+                self.last = self.take_snapshot()
+            finally:
+                self._idle.set()
+            if self.on_done:
+                try:
+                    self.on_done(self.last)
+                except Exception as e:
+                    print(f"Backup completion callback error: {e}")
+
+    def take_snapshot(self):
+        """Copy the live database to a new snapshot file, then prune old ones"""
+        started = datetime.datetime.now(datetime.timezone.utc)
+        name = snapshot_prefix(self.db_path) + started.strftime("%Y%m%d-%H%M%S") + SNAPSHOT_SUFFIX
+        path = os.path.join(self.backup_dir, name)
+        tmp_path = path + ".part"
+        report = {"path": path, "pages": 0, "bytes": 0, "seconds": 0.0,
+                  "started": started.strftime("%Y-%m-%d %H:%M:%S"), "error": None}
+        start = time.perf_counter()
+
+        def progress(remaining, total):
+            self.progress = (total - remaining, total)
+            if self._stop.is_set():
+                raise BackupCancelled()
+
+        try:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            target = sqlite3.connect(tmp_path)
+            try:
+                # The last step commits the copy under the write lock; sync it afterwards instead
+                target.execute("PRAGMA synchronous=OFF")
+                self.pool.backup(target, pages=self.pages, pause=self.pause, progress=progress)
+                report["pages"] = target.execute("PRAGMA page_count").fetchone()[0]
+            finally:
+                target.close()
+            with open(tmp_path, "rb+") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            report["bytes"] = os.path.getsize(path)
+            prune_snapshots(self.backup_dir, self.db_path, self.keep)
+        except (sqlite3.Error, OSError, BackupCancelled) as e:
+            report["error"] = "cancelled" if isinstance(e, BackupCancelled) else str(e)
+            for leftover in (tmp_path, tmp_path + "-journal"):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+            if not isinstance(e, BackupCancelled):
+                print(f"Database backup error: {e}")
+        report["seconds"] = time.perf_counter() - start
+        return report
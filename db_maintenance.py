@@ -0,0 +1,198 @@
+"""
+Database maintenance for Exam Shield
+The database runs with auto_vacuum=INCREMENTAL, so pages freed by retention
+stay on the freelist until a PRAGMA incremental_vacuum hands them back to
+the file system. MaintenanceScheduler does that, and applies log retention,
+in small writer-lock slices while the machine is idle, and never while an
+exam is running (hold() / release()).
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+def storage_stats(conn, db_path, detail=False):
+    """File size, page and freelist counts of the database open on conn.
+
+    detail=True also walks every page through the dbstat table (when SQLite has it) to
+    report per-table sizes and fragmentation: the share of leaf pages that do not directly
+    follow the previous leaf of the same b-tree. That reads the whole file, so only do it
+    on request.
+    """
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    stats = {
+        "file_bytes": os.path.getsize(db_path) if os.path.exists(db_path) else 0,
+        "wal_bytes": os.path.getsize(db_path + "-wal") if os.path.exists(db_path + "-wal") else 0,
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_pages": freelist,
+        "free_bytes": freelist * page_size,
+        "free_ratio": freelist / page_count if page_count else 0.0,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(mode, str(mode)),
+    }
+    if detail:
+        try:
+            rows = conn.execute('''
+                SELECT s.name, s.pages, s.bytes, s.unused, COALESCE(l.leaves, 0), COALESCE(l.jumps, 0)
+                FROM (SELECT name, COUNT(*) AS pages, SUM(pgsize) AS bytes, SUM(unused) AS unused
+                      FROM dbstat GROUP BY name) s
+                LEFT JOIN (SELECT name, COUNT(*) AS leaves,
+                                  SUM(CASE WHEN prev IS NOT NULL AND pageno != prev + 1 THEN 1 ELSE 0 END) AS jumps
+                           FROM (SELECT name, pageno, LAG(pageno) OVER (PARTITION BY name ORDER BY path) AS prev
+                                 FROM dbstat WHERE pagetype = 'leaf')
+                           GROUP BY name) l ON l.name = s.name
+                ORDER BY s.bytes DESC
+            ''').fetchall()
+        except sqlite3.OperationalError:
+            rows = None
+        if rows is not None:
+            leaves = sum(r[4] for r in rows)
+            stats["fragmentation"] = sum(r[5] for r in rows) / leaves if leaves else 0.0
+            stats["unused_bytes"] = sum(r[3] for r in rows)
+            stats["objects"] = [{"name": r[0], "pages": r[1], "bytes": r[2], "unused_bytes": r[3],
+                                 "fragmentation": r[5] / r[4] if r[4] else 0.0} for r in rows]
+    return stats
+
+class MaintenanceScheduler:
+    """Background retention and space reclamation; `last` holds the most recent run's report"""
+
+    def __init__(self, db, interval=None, idle_seconds=None, idle_cpu=None, slice_pages=None,
+                 slice_pause=None):
+        self.db = db
+        self.interval = Config.MAINTENANCE_CHECK_SECONDS if interval is None else interval
+        self.idle_seconds = Config.MAINTENANCE_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.idle_cpu = Config.MAINTENANCE_IDLE_CPU if idle_cpu is None else idle_cpu
+        self.slice_pages = slice_pages or Config.VACUUM_SLICE_PAGES
+        self.slice_pause = Config.VACUUM_SLICE_PAUSE if slice_pause is None else slice_pause
+        self.last = None
+        self._last_retention = None
+        self._holds = 0
+        self._state_lock = threading.Lock()
+        self._vacuum_conn = None
+        self._requested = threading.Event()
+        self._stop = threading.Event()
+        if psutil:
+            psutil.cpu_percent(interval=None)  # the first reading is meaningless
+        self._thread = threading.Thread(target=self._run, name="DatabaseMaintenance", daemon=True)
+        self._thread.start()
+
+    @property
+    def held(self):
+        return self._holds > 0
+
+    def hold(self):
+        """Stop maintenance until release(); a full VACUUM in progress is interrupted"""
+        with self._state_lock:
+            self._holds += 1
+            if self._vacuum_conn is not None:
+                self._vacuum_conn.interrupt()
+
+    def release(self):
+        with self._state_lock:
+            self._holds = max(0, self._holds - 1)
+
+    def run_now(self):
+        """Run on the next wake-up without waiting for the machine to be idle"""
+        self._requested.set()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._requested.set()
+        self._thread.join(timeout)
+
+    def idle(self, check_cpu=True):
+        """No activity logs written recently and the CPU mostly idle (when psutil is available)"""
+        if time.monotonic() - self.db.last_write < self.idle_seconds:
+            return False
+        return not check_cpu or psutil is None or psutil.cpu_percent(interval=None) < self.idle_cpu
+
+    def _should_stop(self):
+        return self._stop.is_set() or self.held
+
+    def _run(self):
+        while not self._stop.is_set():
+            forced = self._requested.wait(self.interval)
+            self._requested.clear()
+            if self._should_stop() or not (forced or self.idle()):
+                continue
+            try:
+                self.last = self.run_once(check_idle=not forced)
+            except sqlite3.Error as e:
+                print(f"Database maintenance error: {e}")
+
+    def run_once(self, check_idle=False):
+        """Apply retention (at most every Config.RETENTION_CHECK_HOURS), convert the database to
+        incremental auto-vacuum if needed, then reclaim free pages slice by slice.
+
+        Stops early when held or, with check_idle, when the machine stops being idle.
+        """
+        start = time.perf_counter()
+        report = {"started": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                  "dropped_days": [], "converted": False, "reclaimed_pages": 0, "complete": False}
+        if self._last_retention is None or \
+                time.monotonic() - self._last_retention >= Config.RETENTION_CHECK_HOURS * 3600:
+            report["dropped_days"] = self.db.cleanup_old_logs()
+            self._last_retention = time.monotonic()
+
+        with self.db.pool.writer() as conn:
+            mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != 2:
+            report["converted"] = self._convert()
+            if not report["converted"]:
+                return self._finish(report, start)
+
+        while True:
+            # Our own slices use CPU, so from here on only logging activity ends the idle period
+            if self._should_stop() or (check_idle and not self.idle(check_cpu=False)):
+                return self._finish(report, start)
+            with self.db.pool.writer() as conn:
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if free == 0:
+                    break
+                # executescript steps the pragma to completion; execute() would free one page
+                conn.executescript(f"PRAGMA incremental_vacuum({int(self.slice_pages)})")
+                report["reclaimed_pages"] += free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            time.sleep(self.slice_pause)
+        with self.db.pool.writer() as conn:
+            # The file only shrinks once the WAL is checkpointed into it
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        report["complete"] = True
+        return self._finish(report, start)
+
+    def _convert(self):
+        """Switch an existing database to incremental auto-vacuum; this needs one full VACUUM"""
+        with self.db.pool.writer() as conn:
+            with self._state_lock:
+                if self.held:
+                    return False
+                self._vacuum_conn = conn
+            try:
+                t0 = time.perf_counter()
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+                print(f"Converted database to incremental auto-vacuum in {time.perf_counter() - t0:.1f}s")
+                return True
+            except sqlite3.OperationalError as e:
+                if "interrupt" not in str(e):
+                    raise
+                return False
+            finally:
+                with self._state_lock:
+                    self._vacuum_conn = None
+
+    def _finish(self, report, start):
+        report["seconds"] = time.perf_counter() - start
+        return report
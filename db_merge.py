@@ -0,0 +1,236 @@
+"""
+Workstation database merge for Exam Shield
+Folds exam_shield.db files collected from lab PCs into one central database.
+Each source is ATTACHed in turn and copied with set-based SQL inside a single
+transaction: users are matched by username, exam sessions by host, name and
+start time, and activity logs are re-keyed into the target's day partitions
+and tagged with the source host and the matching target session. Partition
+indexes are dropped while loading and rebuilt once at the end, after which
+the summaries of sessions that received events are recomputed.
+"""
+
+import os
+import sqlite3
+import time
+from log_partitions import LATE_COLUMNS, derived_sql
+
+# Databases named like this are identified by their directory instead (e.g. LAB-PC-12/exam_shield.db)
+GENERIC_NAMES = ("exam_shield", "exam_shield_pro")
+
+def host_from_path(path):
+    """Workstation name for a collected database file"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if stem.lower() in GENERIC_NAMES:
+        parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        return parent or stem
+    return stem
+
+class DatabaseMerger:
+    def __init__(self, db):
+        self.db = db
+        self.partitions = db.partitions
+
+    def merge(self, sources, progress=None):
+        """Merge (path, host) pairs, or plain paths whose host comes from host_from_path().
+
+        progress(report) is called after each source with that source's report dict. Returns
+        {"sources": [...], "rows": n, "seconds": s}. Sources that fail to open are reported with
+        an "error" and skipped; logs already merged from the same host and file are not copied
+        again, so re-collecting a workstation only adds its new events.
+        """
+        sources = [(s, host_from_path(s)) if isinstance(s, str) else tuple(s) for s in sources]
+        self.db.flush()
+        start = time.perf_counter()
+        reports, days, sessions = [], set(), set()
+        for index, (path, host) in enumerate(sources, 1):
+            t0 = time.perf_counter()
+            report = {"index": index, "total": len(sources), "path": path, "host": host, "rows": 0}
+            try:
+                report["rows"], source_days, source_sessions = self._merge_one(path, host)
+                days.update(source_days)
+                sessions.update(source_sessions)
+            except sqlite3.Error as e:
+                report["error"] = str(e)
+                print(f"Merge error ({path}): {e}")
+            report["seconds"] = time.perf_counter() - t0
+            reports.append(report)
+            if progress:
+                progress(report)
+
+        t0 = time.perf_counter()
+        with self.db.pool.writer() as conn:
+            rebuilt = self.partitions.rebuild_indexes(conn)
+            self.partitions.refresh_view(conn)
+            if days:
+                self.db.rollups.rebuild(conn, self.partitions, min(days))
+            for session_id in sorted(sessions):
+                self.db.sessions.summarize(conn, self.partitions, session_id)
+            conn.execute("ANALYZE")
+        total = sum(r["rows"] for r in reports)
+        return {"sources": reports, "rows": total, "partitions_rebuilt": len(rebuilt),
+                "index_seconds": time.perf_counter() - t0, "seconds": time.perf_counter() - start}
+
+    def _merge_one(self, path, host):
+        if not os.path.exists(path):
+            raise sqlite3.OperationalError(f"no such file: {path}")
+        with self.db.pool.writer() as conn:
+            conn.execute("ATTACH DATABASE ? AS src", (path,))
+            try:
+                with self.db.pool.writer():
+                    return self._copy(conn, path, host)
+            except BaseException:
+                # Partitions and codes created by the rolled-back transaction are gone again
+                self.partitions.invalidate()
+                raise
+            finally:
+                conn.execute("DROP TABLE IF EXISTS temp.merge_rows")
+                conn.execute("DROP TABLE IF EXISTS temp.merge_user_map")
+                conn.execute("DROP TABLE IF EXISTS temp.merge_session_map")
+                conn.execute("DETACH DATABASE src")
+
+    def _copy(self, conn, path, host):
+        name = os.path.basename(path)
+        row = conn.execute("SELECT last_source_id FROM merge_sources WHERE source_host=? AND source_name=?",
+                           (host, name)).fetchone()
+        after_id = row[0] if row else 0
+        self._map_users(conn)
+        self._merge_sessions(conn, host)
+        if not self._stage_logs(conn, host, after_id):
+            return 0, [], []
+
+        # New strings first, so every staged row finds its codes by join
+        conn.execute("INSERT OR IGNORE INTO main.log_actions (action) SELECT DISTINCT action FROM temp.merge_rows")
+        conn.execute("INSERT OR IGNORE INTO main.log_templates (template) "
+                     "SELECT DISTINCT details_template(details) FROM temp.merge_rows WHERE details IS NOT NULL")
+        conn.execute("INSERT OR IGNORE INTO main.log_hosts (host) SELECT DISTINCT host FROM temp.merge_rows")
+
+        copied, days = 0, []
+        derived = ", ".join(derived_sql("r.action", "r.blocked", "r.timestamp"))
+        for day, count in conn.execute(
+                "SELECT day, COUNT(*) FROM temp.merge_rows GROUP BY day ORDER BY day").fetchall():
+            table = self.partitions.ensure(conn, day, refresh=False)
+            self.partitions.suspend_indexes(conn, table)
+            first_id = self.partitions.allocate_ids(conn, count)
+            conn.execute(f'''
+                INSERT INTO main.{table} (id, user_id, action_id, template_id, params, timestamp, blocked,
+                                          ip_address, host_id, session_id, count, last_seen, severity, category,
+                                          epoch)
+                SELECT ? + ROW_NUMBER() OVER (ORDER BY r.src_id) - 1, m.new_id, a.id, t.id,
+                       details_params(r.details), r.timestamp, r.blocked, r.ip_address, h.id, sm.new_id,
+                       r.count, r.last_seen, {derived}
+                FROM temp.merge_rows r
+                JOIN main.log_actions a ON a.action = r.action
+                LEFT JOIN main.log_templates t ON t.template = details_template(r.details)
+                LEFT JOIN main.log_hosts h ON h.host = r.host
+                LEFT JOIN temp.merge_user_map m ON m.old_id = r.user_id
+                LEFT JOIN temp.merge_session_map sm ON sm.old_id = r.session_id
+                WHERE r.day = ?
+            ''', (first_id, day))
+            last_id = first_id + count - 1
+            conn.execute("UPDATE log_partitions SET min_id=COALESCE(MIN(min_id, ?), ?), "
+                         "max_id=MAX(COALESCE(max_id, 0), ?) WHERE day=?", (first_id, first_id, last_id, day))
+            copied += count
+            days.append(day)
+
+        last_source_id = conn.execute("SELECT MAX(src_id) FROM temp.merge_rows").fetchone()[0]
+        conn.execute('''
+            INSERT INTO merge_sources (source_host, source_name, last_source_id, rows) VALUES (?, ?, ?, ?)
+            ON CONFLICT (source_host, source_name) DO UPDATE SET
+                last_source_id = excluded.last_source_id, rows = rows + excluded.rows, merged_at = CURRENT_TIMESTAMP
+        ''', (host, name, last_source_id, copied))
+        sessions = [row[0] for row in conn.execute(
+            "SELECT DISTINCT sm.new_id FROM temp.merge_rows r JOIN temp.merge_session_map sm ON sm.old_id = r.session_id")]
+        return copied, days, sessions
+
+    def _source_tables(self, conn):
+        return {row[0]: row[1] for row in conn.execute("SELECT name, type FROM src.sqlite_master")}
+
+    def _stage_logs(self, conn, host, after_id):
+        """Copy the source's new log rows into temp.merge_rows as plain text; returns the row count.
+
+        Handles the original single table, text partitions and interned partitions.
+        """
+        conn.execute('''
+            CREATE TEMP TABLE merge_rows (
+                src_id INTEGER PRIMARY KEY, user_id INTEGER, action TEXT, details TEXT,
+                timestamp TEXT, blocked BOOLEAN, ip_address TEXT, host TEXT, day TEXT, session_id INTEGER,
+                count INTEGER NOT NULL DEFAULT 1, last_seen TEXT
+            )
+        ''')
+        tables = self._source_tables(conn)
+        day = "COALESCE(date(timestamp), date('now'))"
+        insert = ("INSERT INTO temp.merge_rows (src_id, user_id, action, details, timestamp, blocked, "
+                  "ip_address, host, day, session_id, count, last_seen) ")
+        if tables.get("activity_logs") == "table":
+            conn.execute(insert + f"SELECT id, user_id, action, details, COALESCE(timestamp, CURRENT_TIMESTAMP), "
+                                  f"blocked, ip_address, ?, {day}, NULL, 1, NULL FROM src.activity_logs WHERE id > ?",
+                         (host, after_id))
+        elif "log_partitions" in tables:
+            for (table,) in conn.execute("SELECT table_name FROM src.log_partitions WHERE max_id > ? ORDER BY day",
+                                         (after_id,)).fetchall():
+                if tables.get(table) != "table":
+                    continue
+                columns = {row[1] for row in conn.execute(f"PRAGMA src.table_info({table})")}
+                if "action" in columns:
+                    source = (f"SELECT id, user_id, action, details, timestamp, blocked, ip_address, ?, date(timestamp), "
+                              f"NULL, 1, NULL FROM src.{table} WHERE id > ?")
+                else:
+                    host_expr = "COALESCE(h.host, ?)" if "host_id" in columns else "?"
+                    host_join = "LEFT JOIN src.log_hosts h ON h.id = p.host_id" if "host_id" in columns else ""
+                    late = ", ".join(f"p.{column}" if column in columns else default
+                                     for column, default in LATE_COLUMNS.items())
+                    source = (f"SELECT p.id, p.user_id, a.action, expand_details(t.template, p.params), p.timestamp, "
+                              f"p.blocked, p.ip_address, {host_expr}, date(p.timestamp), {late} FROM src.{table} p "
+                              f"JOIN src.log_actions a ON a.id = p.action_id "
+                              f"LEFT JOIN src.log_templates t ON t.id = p.template_id {host_join} WHERE p.id > ?")
+                conn.execute(insert + source, (host, after_id))
+        conn.execute("CREATE INDEX temp.merge_rows_day ON merge_rows (day)")
+        return conn.execute("SELECT COUNT(*) FROM temp.merge_rows").fetchone()[0]
+
+    def _map_users(self, conn):
+        """Match source users to target users by username, adding the ones the target lacks"""
+        conn.execute("CREATE TEMP TABLE merge_user_map (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+        if "users" not in self._source_tables(conn):
+            return
+        conn.execute('''
+            INSERT OR IGNORE INTO main.users (username, password_hash, role, created_at, last_login)
+            SELECT username, password_hash, role, created_at, last_login FROM src.users
+        ''')
+        conn.execute('''
+            INSERT INTO temp.merge_user_map (old_id, new_id)
+            SELECT s.id, u.id FROM src.users s JOIN main.users u ON u.username = s.username
+        ''')
+
+    def _merge_sessions(self, conn, host):
+        """Copy exam sessions not seen before, keyed by (source_host, session_name, start_time), and
+        map source session ids to target ones"""
+        conn.execute("CREATE TEMP TABLE merge_session_map (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+        if "exam_sessions" not in self._source_tables(conn):
+            return
+        columns = {row[1] for row in conn.execute("PRAGMA src.table_info(exam_sessions)")}
+        host_expr = "COALESCE(s.source_host, ?)" if "source_host" in columns else "?"
+        conn.execute(f'''
+            INSERT INTO main.exam_sessions (session_name, admin_id, start_time, end_time, status, restrictions,
+                                            source_host)
+            SELECT s.session_name, m.new_id, s.start_time, s.end_time, s.status, s.restrictions, {host_expr}
+            FROM src.exam_sessions s LEFT JOIN temp.merge_user_map m ON m.old_id = s.admin_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM main.exam_sessions e
+                WHERE e.source_host = {host_expr} AND e.session_name = s.session_name
+                  AND e.start_time IS s.start_time
+            )
+        ''', (host, host))
+        conn.execute(f'''
+            INSERT OR IGNORE INTO temp.merge_session_map (old_id, new_id)
+            SELECT s.id, e.id FROM src.exam_sessions s
+            JOIN main.exam_sessions e ON e.source_host = {host_expr} AND e.session_name = s.session_name
+                                     AND e.start_time IS s.start_time
+        ''', (host,))
+        # A session collected while still running has ended since
+        conn.execute('''
+            UPDATE main.exam_sessions SET (end_time, status) = (
+                SELECT s.end_time, s.status FROM src.exam_sessions s JOIN temp.merge_session_map sm ON sm.old_id = s.id
+                WHERE sm.new_id = main.exam_sessions.id)
+            WHERE id IN (SELECT sm.new_id FROM temp.merge_session_map sm JOIN src.exam_sessions s ON s.id = sm.old_id
+                         WHERE s.end_time IS NOT main.exam_sessions.end_time OR s.status IS NOT main.exam_sessions.status)
+        ''')
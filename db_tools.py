@@ -0,0 +1,171 @@
+"""
+Maintenance commands for the Exam Shield database
+
+    python db_tools.py migrate [--db PATH]
+    python db_tools.py rebuild-rollups [--db PATH] [--since YYYY-MM-DD]
+    python db_tools.py merge [--db PATH] SOURCE [SOURCE ...]
+    python db_tools.py backup [--db PATH] [--dir DIR] [--keep N]
+    python db_tools.py snapshots [--db PATH] [--dir DIR]
+    python db_tools.py restore [--db PATH] SNAPSHOT
+    python db_tools.py sessions [--db PATH] [--limit N]
+    python db_tools.py session-report [--db PATH] [--resummarize] [SESSION_ID]
+    python db_tools.py journal [--db PATH] [--since TIME] [--until TIME] [--action PREFIX] [--blocked]
+
+A merge SOURCE is a collected database file, optionally prefixed with the
+workstation name (LAB-PC-12=path/to/exam_shield.db)
+"""
+
+import argparse
+import datetime
+import os
+import time
+from config import Config
+from database_manager import DatabaseManager
+from db_backup import BackupScheduler, list_snapshots, restore_snapshot, verify_snapshot
+from db_merge import DatabaseMerger
+from event_journal import JournalReader
+from exam_sessions import format_report
+from schema_migrations import SCHEMA_VERSION, SchemaMigrator
+
+def migrate(args):
+    """Upgrade the schema and build any queued partition indexes before returning"""
+    start = time.perf_counter()
+    db = DatabaseManager(args.db)
+    migrator = SchemaMigrator(db)
+    built = migrator.build_indexes(pause=0)
+    print(f"Schema version {migrator.version()} (current: {SCHEMA_VERSION}); built indexes of "
+          f"{len(built)} partition(s); {time.perf_counter() - start:.1f}s")
+    db.close()
+
+def rebuild_rollups(args):
+    db = DatabaseManager(args.db)
+    start = time.perf_counter()
+    scanned = db.rebuild_rollups(args.since)
+    print(f"Rebuilt rollups from {scanned} day partition(s) in {time.perf_counter() - start:.2f}s")
+    db.close()
+
+def _merge_source(arg):
+    host, sep, path = arg.partition("=")
+    return (path, host) if sep and host else arg
+
+def _print_merge_progress(report):
+    prefix = f"[{report['index']}/{report['total']}] {report['host']}"
+    if "error" in report:
+        print(f"{prefix}: skipped ({report['error']})")
+    else:
+        rate = report["rows"] / report["seconds"] if report["seconds"] else 0
+        print(f"{prefix}: {report['rows']} rows ({rate:.0f} rows/s)")
+
+def merge(args):
+    db = DatabaseManager(args.db)
+    result = DatabaseMerger(db).merge([_merge_source(a) for a in args.sources], progress=_print_merge_progress)
+    failed = sum(1 for r in result["sources"] if "error" in r)
+    print(f"Merged {result['rows']} rows from {len(result['sources']) - failed} database(s) in "
+          f"{result['seconds']:.1f}s ({result['partitions_rebuilt']} partition index(es) rebuilt in "
+          f"{result['index_seconds']:.1f}s)" + (f", {failed} skipped" if failed else ""))
+    db.close()
+
+def backup(args):
+    db = DatabaseManager(args.db)
+    scheduler = BackupScheduler(db.pool, db.db_path, backup_dir=args.dir, interval=0,
+                                keep=args.keep if args.keep is not None else db.get_setting('backup_keep'))
+    report = scheduler.backup_now(wait=True)
+    scheduler.stop()
+    db.close()
+    if report["error"]:
+        print(f"Backup failed: {report['error']}")
+    else:
+        print(f"Wrote {report['path']} ({report['bytes'] / 1e6:.1f} MB, {report['pages']} pages) "
+              f"in {report['seconds']:.1f}s")
+
+def snapshots(args):
+    paths = list_snapshots(args.dir or Config.BACKUP_DIR, args.db)
+    if not paths:
+        print("No snapshots found")
+    for path in paths:
+        status = "ok" if verify_snapshot(path) else "DAMAGED"
+        print(f"{path}  {os.path.getsize(path) / 1e6:.1f} MB  {status}")
+
+def restore(args):
+    start = time.perf_counter()
+    pages = restore_snapshot(args.snapshot, args.db)
+    print(f"Restored {args.db} from {args.snapshot} ({pages} pages) in {time.perf_counter() - start:.1f}s")
+
+def sessions(args):
+    db = DatabaseManager(args.db)
+    for session_id, name, start, end, status, host, events, blocked in db.list_exam_sessions(args.limit):
+        counts = f"{events:,} events, {blocked:,} blocked" if events is not None else "not summarized"
+        print(f"#{session_id:<5} {start or '?'} - {end or '...':19}  {status:<9} {name}"
+              + (f" [{host}]" if host else "") + f"  ({counts})")
+    db.close()
+
+def session_report(args):
+    db = DatabaseManager(args.db)
+    if args.resummarize and args.session_id is not None:
+        with db.pool.writer() as conn:
+            db.sessions.summarize(conn, db.partitions, args.session_id)
+    start = time.perf_counter()
+    report = db.get_session_report(args.session_id)
+    elapsed = time.perf_counter() - start
+    db.close()
+    if report is None:
+        print("No such exam session")
+        return
+    print(format_report(report))
+    print(f"\n({'materialized' if report['materialized'] else 'computed from logs'}, {elapsed * 1000:.1f} ms)")
+
+def journal(args):
+    """Replay events from the binary journal; reads the files only, so it works when the
+    database itself is damaged"""
+    since = datetime.datetime.fromisoformat(args.since) if args.since else None
+    until = datetime.datetime.fromisoformat(args.until) if args.until else None
+    shown = 0
+    for event in JournalReader(args.db + ".journal").events(since, until, args.action, True if args.blocked else None):
+        when = datetime.datetime.fromtimestamp(event.timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        print(f"{when}  {'BLOCKED' if event.blocked else 'allowed':<7}  {event.action}: {event.details or 'N/A'}"
+              + (f"  [session {event.session_id}]" if event.session_id else ""))
+        shown += 1
+        if args.limit and shown >= args.limit:
+            break
+
+def main():
+    parser = argparse.ArgumentParser(description="Exam Shield database tools")
+    parser.add_argument("--db", default=Config.DATABASE_PATH, help="database file (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("migrate", help="apply schema migrations and build queued indexes now")
+    p.set_defaults(func=migrate)
+    p = sub.add_parser("rebuild-rollups", help="backfill per-minute/per-hour counters from raw logs")
+    p.add_argument("--since", help="only recompute buckets from this UTC day (YYYY-MM-DD) on")
+    p.set_defaults(func=rebuild_rollups)
+    p = sub.add_parser("merge", help="fold databases collected from lab workstations into --db")
+    p.add_argument("sources", nargs="+", metavar="SOURCE", help="database file, or HOST=file")
+    p.set_defaults(func=merge)
+    p = sub.add_parser("backup", help="take an online snapshot now")
+    p.add_argument("--dir", help="snapshot directory (default: Config.BACKUP_DIR)")
+    p.add_argument("--keep", type=int, help="snapshots to retain (default: backup_keep setting)")
+    p.set_defaults(func=backup)
+    p = sub.add_parser("snapshots", help="list and check snapshots, newest first")
+    p.add_argument("--dir", help="snapshot directory (default: Config.BACKUP_DIR)")
+    p.set_defaults(func=snapshots)
+    p = sub.add_parser("restore", help="overwrite --db with a snapshot (close Exam Shield first)")
+    p.add_argument("snapshot")
+    p.set_defaults(func=restore)
+    p = sub.add_parser("sessions", help="list exam sessions, newest first")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=sessions)
+    p = sub.add_parser("session-report", help="summary of an exam session (default: the most recent)")
+    p.add_argument("session_id", type=int, nargs="?")
+    p.add_argument("--resummarize", action="store_true", help="recompute the stored summary from the logs first")
+    p.set_defaults(func=session_report)
+    p = sub.add_parser("journal", help="replay events from the binary journal next to --db")
+    p.add_argument("--since", help="local time, e.g. 2025-03-01 09:00")
+    p.add_argument("--until", help="local time (exclusive)")
+    p.add_argument("--action", help="only actions starting with this prefix")
+    p.add_argument("--blocked", action="store_true", help="only blocked events")
+    p.add_argument("--limit", type=int, default=0, help="stop after N events (default: all)")
+    p.set_defaults(func=journal)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Append-only binary event journal for Exam Shield
+Every event passed to log_activity is also appended here, before coalescing
+and without touching SQLite, so a forensic replay does not depend on the
+database being healthy.
+
+The journal directory (<db>.journal) holds one segment pair per UTC day or
+per JOURNAL_SEGMENT_RECORDS events:
+
+    YYYYMMDD-NNN.evj   32-byte header, then fixed 32-byte records
+                       (timestamp in microseconds, action code, flags,
+                       session id, user id, details length, details offset)
+    YYYYMMDD-NNN.evd   the details text the records point into
+
+Both files are preallocated and written through mmap; a closed segment is
+truncated to what it used. Action names are numbered in the append-only
+`actions` file. Timestamps never decrease within a segment, so
+JournalReader binary-searches the memory-mapped timestamp column to find a
+time range and scans it without copying the records.
+"""
+
+import bisect
+import collections
+import datetime
+import mmap
+import os
+import struct
+import threading
+from config import Config
+
+MAGIC = b"ESJ1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQ12x")
+RECORD = struct.Struct("<qHHIIIQ")  # ts_us, action, flags, session_id, user_id, details_len, details_offset
+RECORD_TAIL = struct.Struct("<HHIIIQ")
+TIMESTAMP = struct.Struct("<q")
+ACTIONS_FILE = "actions"
+
+FLAG_BLOCKED = 1
+FLAG_NO_DETAILS = 2
+FLAG_TRUNCATED = 4
+
+JournalEvent = collections.namedtuple("JournalEvent", "timestamp action details blocked user_id session_id")
+
+def _utc_day(ts_us):
+    return datetime.datetime.fromtimestamp(ts_us / 1e6, datetime.timezone.utc).strftime("%Y%m%d")
+
+def _day_end_us(day):
+    start = datetime.datetime.strptime(day, "%Y%m%d").replace(tzinfo=datetime.timezone.utc)
+    return int((start + datetime.timedelta(days=1)).timestamp() * 1e6)
+
+def _to_us(value):
+    """Microseconds since the epoch for a datetime (naive = local time) or epoch seconds"""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        value = value.timestamp()
+    return int(value * 1e6)
+
+def _preallocate(f, size):
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        f.truncate(size)
+
+def _load_actions(directory):
+    try:
+        with open(os.path.join(directory, ACTIONS_FILE), encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f]
+    except FileNotFoundError:
+        return []
+
+def _segment_names(directory):
+    try:
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".evj"))
+    except FileNotFoundError:
+        return []
+
+class EventJournal:
+    """Appends LogEvents to the journal in `directory`; safe to call from any thread"""
+
+    def __init__(self, directory, records=None, details_bytes=None):
+        self.directory = directory
+        self.capacity = records or Config.JOURNAL_SEGMENT_RECORDS
+        self.details_capacity = details_bytes or Config.JOURNAL_DETAILS_BYTES
+        self.max_details = Config.JOURNAL_MAX_DETAILS
+        self.appended = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._codes = None
+        self._actions_file = None
+        self._files = None
+        self._records = None
+        self._details = None
+        self._count = 0
+        self._details_used = 0
+        self._last_us = 0
+        self._day_end = 0
+
+    def append(self, event):
+        self.extend((event,))
+
+    def extend(self, events):
+        """Append events in order; a journal error is counted and reported once, never raised"""
+        with self._lock:
+            try:
+                for event in events:
+                    self._append(event)
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                if self.errors == 1:
+                    print(f"Event journal error: {e}")
+
+    def _append(self, event):
+        flags = FLAG_BLOCKED if event.blocked else 0
+        if event.details is None:
+            details = b""
+            flags |= FLAG_NO_DETAILS
+        else:
+            details = str(event.details).encode("utf-8")
+            if len(details) > self.max_details:
+                details = details[:self.max_details]
+                flags |= FLAG_TRUNCATED
+        # Events reach the lock slightly out of order across threads; clamping keeps the
+        # timestamp column sorted for binary search
+        ts = max(int(event.created * 1e6), self._last_us, 1)
+        if self._records is None or ts >= self._day_end or self._count >= self.capacity or \
+                self._details_used + len(details) > self.details_capacity:
+            self._rotate(ts)
+        code = self._codes.get(event.action) or self._add_action(event.action)
+        offset = self._details_used
+        if details:
+            self._details[offset:offset + len(details)] = details
+            self._details_used += len(details)
+        position = (self._count + 1) * RECORD.size
+        # The timestamp goes in last: a reader treats a zero timestamp as the end of the segment
+        RECORD_TAIL.pack_into(self._records, position + TIMESTAMP.size, code, flags, event.session_id or 0,
+                              event.user_id or 0, len(details), offset)
+        TIMESTAMP.pack_into(self._records, position, ts)
+        self._count += 1
+        self._last_us = ts
+        self.appended += 1
+
+    def _add_action(self, action):
+        if self._actions_file is None:
+            self._actions_file = open(os.path.join(self.directory, ACTIONS_FILE), "a", encoding="utf-8")
+        self._actions_file.write(action.replace("\n", " ") + "\n")
+        self._actions_file.flush()
+        code = self._codes[action] = len(self._codes) + 1
+        return code if code <= 0xFFFF else 0
+
+    def _rotate(self, ts):
+        self._close_segment()
+        if self._codes is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._codes = {name: code for code, name in enumerate(_load_actions(self.directory), 1)}
+        day = _utc_day(ts)
+        sequence = 1 + max((int(name[9:]) for name in _segment_names(self.directory) if name.startswith(day)),
+                           default=0)
+        while True:
+            base = os.path.join(self.directory, f"{day}-{sequence:03d}")
+            try:
+                # Exclusive create: another process writing to the same journal never shares a segment
+                records_file = open(base + ".evj", "x+b")
+                break
+            except FileExistsError:
+                sequence += 1
+        details_file = open(base + ".evd", "w+b")
+        records_size = (self.capacity + 1) * RECORD.size
+        _preallocate(records_file, records_size)
+        _preallocate(details_file, self.details_capacity)
+        self._files = (records_file, details_file)
+        self._records = mmap.mmap(records_file.fileno(), records_size)
+        self._details = mmap.mmap(details_file.fileno(), self.details_capacity)
+        HEADER.pack_into(self._records, 0, MAGIC, VERSION, RECORD.size, self.capacity, self.details_capacity)
+        self._count = 0
+        self._details_used = 0
+        self._last_us = ts
+        self._day_end = _day_end_us(day)
+
+    def _close_segment(self):
+        if self._records is None:
+            return
+        self._records.flush()
+        self._details.flush()
+        self._records.close()
+        self._details.close()
+        records_file, details_file = self._files
+        records_file.truncate((self._count + 1) * RECORD.size)
+        details_file.truncate(self._details_used)
+        records_file.close()
+        details_file.close()
+        self._records = self._details = self._files = None
+
+    def sync(self):
+        """Force the open segment to disk (mmap writes otherwise survive a crash of the process,
+        not of the machine)"""
+        with self._lock:
+            if self._records is not None:
+                self._records.flush()
+                self._details.flush()
+
+    def prune(self, before_day):
+        """Delete closed segments of UTC days before `before_day` (YYYY-MM-DD or YYYYMMDD);
+        returns their names"""
+        before_day = before_day.replace("-", "")
+        with self._lock:
+            current = os.path.basename(self._files[0].name)[:-4] if self._files else None
+            removed = [name for name in _segment_names(self.directory) if name[:8] < before_day and name != current]
+            for name in removed:
+                for ext in (".evj", ".evd"):
+                    try:
+                        os.remove(os.path.join(self.directory, name + ext))
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+            if self._actions_file is not None:
+                self._actions_file.close()
+                self._actions_file = None
+
+class _Segment:
+    """Read-only mapping of one segment; `timestamps` is a zero-copy view of the timestamp column"""
+
+    def __init__(self, base):
+        self.name = os.path.basename(base)
+        self._maps = []
+        self.records = self._map(base + ".evj")
+        self.details = self._map(base + ".evd")
+        view = memoryview(self.records) if self.records is not None else memoryview(b"")
+        if len(view) < RECORD.size or HEADER.unpack_from(view, 0)[:3] != (MAGIC, VERSION, RECORD.size):
+            view.release()
+            raise ValueError(f"{self.name} is not a journal segment")
+        self.view = view[:len(view) // RECORD.size * RECORD.size]
+        view.release()
+        self.timestamps = self.view.cast("q")[RECORD.size // 8::RECORD.size // 8]
+        self.count = self._filled()
+
+    def _map(self, path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def _filled(self):
+        """Records written so far: an open segment's preallocated tail is still zero"""
+        ts, lo, hi = self.timestamps, 0, len(self.timestamps)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ts[mid]:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def bounds(self, since_us, until_us):
+        """Index range of the records with since <= ts < until"""
+        lo = 0 if since_us is None else bisect.bisect_left(self.timestamps, since_us, 0, self.count)
+        hi = self.count if until_us is None else bisect.bisect_left(self.timestamps, until_us, lo, self.count)
+        return lo, hi
+
+    def rows(self, lo, hi):
+        """Unpack records lo..hi straight from the mapping"""
+        return RECORD.iter_unpack(self.view[(lo + 1) * RECORD.size:(hi + 1) * RECORD.size])
+
+    def close(self):
+        self.timestamps.release()
+        self.view.release()
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # a caller still holds rows from it; the mapping goes with the last reference
+
+class JournalReader:
+    """Time-range reads over a journal directory; works while a writer is appending"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.actions = [None] + _load_actions(directory)
+
+    def segments(self, since=None, until=None):
+        """Names of the segments that can hold events between since and until"""
+        first = _utc_day(_to_us(since)) if since is not None else ""
+        last = _utc_day(_to_us(until)) if until is not None else "99999999"
+        return [name for name in _segment_names(self.directory) if first <= name[:8] <= last]
+
+    def scan(self, since=None, until=None):
+        """Yield raw record tuples (ts_us, action_code, flags, session_id, user_id, details_len,
+        details_offset) with since <= timestamp < until, unpacked from the mapped segments"""
+        since_us, until_us = _to_us(since), _to_us(until)
+        for name in self.segments(since, until):
+            try:
+                segment = _Segment(os.path.join(self.directory, name))
+            except (OSError, ValueError) as e:
+                print(f"Skipping journal segment {name}: {e}")
+                continue
+            try:
+                yield from segment.rows(*segment.bounds(since_us, until_us))
+            finally:
+                segment.close()
+
+    def count(self, since=None, until=None, blocked=None):
+        """Number of events in the range, optionally only (un)blocked ones"""
+        if blocked is None:
+            total = 0
+            for name in self.segments(since, until):
+                segment = _Segment(os.path.join(self.directory, name))
+                lo, hi = segment.bounds(_to_us(since), _to_us(until))
+                segment.close()
+                total += hi - lo
+            return total
+        want = FLAG_BLOCKED if blocked else 0
+        return sum(1 for row in self.scan(since, until) if row[2] & FLAG_BLOCKED == want)
+
+    def events(self, since=None, until=None, action_prefix=None, blocked=None):
+        """Yield JournalEvents (timestamp in epoch seconds) with since <= timestamp < until"""
+        actions = self.actions
+        codes = None
+        if action_prefix:
+            codes = {code for code, name in enumerate(actions) if name and name.startswith(action_prefix)}
+        since_us, until_us = _to_us(since), _to_us(until)
+        for name in self.segments(since, until):
+            try:
+                segment = _Segment(os.path.join(self.directory, name))
+            except (OSError, ValueError) as e:
+                print(f"Skipping journal segment {name}: {e}")
+                continue
+            details, make = segment.details, JournalEvent
+            try:
+                for ts, code, flags, session_id, user_id, length, offset in segment.rows(
+                        *segment.bounds(since_us, until_us)):
+                    if codes is not None and code not in codes:
+                        continue
+                    if blocked is not None and bool(flags & FLAG_BLOCKED) != blocked:
+                        continue
+                    if code >= len(actions):
+                        actions = self.actions = [None] + _load_actions(self.directory)
+                    yield make(ts / 1e6, actions[code] if code < len(actions) else None,
+                               None if flags & FLAG_NO_DETAILS else
+                               details[offset:offset + length].decode("utf-8", "replace") if length else "",
+                               flags & FLAG_BLOCKED == FLAG_BLOCKED, user_id or None, session_id or None)
+            finally:
+                segment.close()
@@ -0,0 +1,211 @@
+"""
+Exam sessions for Exam Shield
+start_exam_mode opens an exam_sessions row and every event logged while it is
+open carries its id in the partition's session_id column (partially indexed,
+so events outside exams cost nothing). Closing a session materializes its
+summary: event counts per action (coalesced rows count as many events as
+they stand for), the first and last blocked event and the duration, so a
+session report reads a few rows instead of the logs.
+"""
+
+import datetime
+import json
+import sqlite3
+
+class ExamSessions:
+    def setup(self, conn):
+        """Create the summary tables"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS exam_session_summaries (
+                session_id INTEGER PRIMARY KEY,
+                duration_seconds INTEGER,
+                events INTEGER NOT NULL DEFAULT 0,
+                blocked_events INTEGER NOT NULL DEFAULT 0,
+                first_blocked_id INTEGER,
+                first_blocked_at TIMESTAMP,
+                first_blocked_action TEXT,
+                first_blocked_details TEXT,
+                last_blocked_id INTEGER,
+                last_blocked_at TIMESTAMP,
+                last_blocked_action TEXT,
+                last_blocked_details TEXT,
+                summarized_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (session_id) REFERENCES exam_sessions(id)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS exam_session_actions (
+                session_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                events INTEGER NOT NULL,
+                blocked_events INTEGER NOT NULL,
+                PRIMARY KEY (session_id, action)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS exam_sessions_status ON exam_sessions (status)")
+
+    @staticmethod
+    def now():
+        return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    def open(self, conn, name, admin_id=None, restrictions=None):
+        """Insert an active session starting now; returns its id"""
+        if restrictions is not None and not isinstance(restrictions, str):
+            restrictions = json.dumps(restrictions, sort_keys=True)
+        return conn.execute("INSERT INTO exam_sessions (session_name, admin_id, start_time, status, restrictions) "
+                            "VALUES (?, ?, ?, 'active', ?)", (name, admin_id, self.now(), restrictions)).lastrowid
+
+    def close(self, conn, partitions, session_id, end_time=None):
+        """Mark a session completed and materialize its summary; returns the summary dict"""
+        conn.execute("UPDATE exam_sessions SET end_time=?, status='completed' WHERE id=?",
+                     (end_time or self.now(), session_id))
+        return self.summarize(conn, partitions, session_id)
+
+    def close_abandoned(self, conn, partitions):
+        """Close this workstation's sessions left active by a crash, ending them at their last
+        logged event. Returns their ids.
+        """
+        closed = []
+        for session_id, start_time in conn.execute(
+                "SELECT id, start_time FROM exam_sessions WHERE status='active' AND source_host IS NULL").fetchall():
+            last = None
+            for _, table, _, _ in reversed(partitions.partitions(conn, since=start_time)):
+                row = conn.execute(f"SELECT MAX(COALESCE(last_seen, timestamp)) FROM {table} WHERE session_id=?",
+                                   (session_id,)).fetchone()
+                if row[0] is not None:
+                    last = row[0]
+                    break
+            self.close(conn, partitions, session_id, last or start_time)
+            closed.append(session_id)
+        return closed
+
+    def summarize(self, conn, partitions, session_id):
+        """(Re)compute a session's summary rows from its tagged events"""
+        summary = self.aggregate(conn, partitions, session_id)
+        if summary is None:
+            return None
+        first, last = summary["first_blocked"] or {}, summary["last_blocked"] or {}
+        conn.execute('''
+            INSERT OR REPLACE INTO exam_session_summaries (session_id, duration_seconds, events, blocked_events,
+                first_blocked_id, first_blocked_at, first_blocked_action, first_blocked_details,
+                last_blocked_id, last_blocked_at, last_blocked_action, last_blocked_details, summarized_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (session_id, summary["duration_seconds"], summary["events"], summary["blocked_events"],
+              first.get("id"), first.get("timestamp"), first.get("action"), first.get("details"),
+              last.get("id"), last.get("timestamp"), last.get("action"), last.get("details")))
+        conn.execute("DELETE FROM exam_session_actions WHERE session_id=?", (session_id,))
+        conn.executemany("INSERT INTO exam_session_actions (session_id, action, events, blocked_events) "
+                         "VALUES (?, ?, ?, ?)", [(session_id,) + row for row in summary["actions"]])
+        return summary
+
+    def aggregate(self, conn, partitions, session_id):
+        """Summary of a session computed from its events; only the partitions its time range
+        covers are visited, each through the session_id index. None for an unknown session."""
+        session = conn.execute("SELECT start_time, end_time FROM exam_sessions WHERE id=?", (session_id,)).fetchone()
+        if session is None:
+            return None
+        start_time, end_time = session
+        actions, first, last = {}, None, None
+        for _, table, _, _ in partitions.partitions(conn, since=start_time, until=end_time):
+            try:
+                rows = conn.execute(f"SELECT a.action, SUM(p.count), SUM(CASE WHEN p.blocked THEN p.count ELSE 0 END), "
+                                    f"MIN(CASE WHEN p.blocked THEN p.id END), MAX(CASE WHEN p.blocked THEN p.id END) "
+                                    f"FROM {table} p JOIN log_actions a ON a.id = p.action_id "
+                                    f"WHERE p.session_id = ? GROUP BY p.action_id", (session_id,)).fetchall()
+            except sqlite3.OperationalError as e:
+                if "no such table" in str(e):
+                    continue
+                raise
+            for action, events, blocked, low, high in rows:
+                total, total_blocked = actions.get(action, (0, 0))
+                actions[action] = (total + events, total_blocked + blocked)
+                if low is not None and (first is None or low < first):
+                    first = low
+                if high is not None and (last is None or high > last):
+                    last = high
+        return {
+            "session_id": session_id,
+            "duration_seconds": self.duration(start_time, end_time),
+            "events": sum(events for events, _ in actions.values()),
+            "blocked_events": sum(blocked for _, blocked in actions.values()),
+            "first_blocked": self._event(conn, partitions, first),
+            "last_blocked": self._event(conn, partitions, last),
+            "actions": sorted(((action,) + counts for action, counts in actions.items()),
+                              key=lambda row: (-row[1], row[0])),
+        }
+
+    @staticmethod
+    def _event(conn, partitions, event_id):
+        if event_id is None:
+            return None
+        rows = partitions.select(conn, ("id", "action", "details", "timestamp"), lambda table: ("id = ?", (event_id,)),
+                                 limit=1, min_id=event_id, max_id=event_id)
+        if not rows:
+            return None
+        return dict(zip(("id", "action", "details", "timestamp"), rows[0]))
+
+    @staticmethod
+    def duration(start_time, end_time):
+        if not start_time:
+            return None
+        fmt = "%Y-%m-%d %H:%M:%S"
+        end = datetime.datetime.strptime(end_time, fmt) if end_time else \
+            datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return int((end - datetime.datetime.strptime(start_time, fmt)).total_seconds())
+
+    def report(self, conn, partitions, session_id):
+        """Session details with its summary: the materialized rows for a closed session, computed
+        on the fly for one still running (or closed before summaries existed). None if unknown."""
+        session = conn.execute("SELECT id, session_name, admin_id, start_time, end_time, status, restrictions, "
+                               "source_host FROM exam_sessions WHERE id=?", (session_id,)).fetchone()
+        if session is None:
+            return None
+        report = dict(zip(("id", "name", "admin_id", "start_time", "end_time", "status", "restrictions",
+                           "source_host"), session))
+        row = conn.execute("SELECT duration_seconds, events, blocked_events, "
+                           "first_blocked_id, first_blocked_action, first_blocked_details, first_blocked_at, "
+                           "last_blocked_id, last_blocked_action, last_blocked_details, last_blocked_at "
+                           "FROM exam_session_summaries WHERE session_id=?", (session_id,)).fetchone()
+        if row is None or report["status"] == "active":
+            summary = self.aggregate(conn, partitions, session_id)
+            summary.pop("session_id")
+            report.update(summary, materialized=False)
+            return report
+        event_keys = ("id", "action", "details", "timestamp")
+        report.update({
+            "duration_seconds": row[0], "events": row[1], "blocked_events": row[2],
+            "first_blocked": dict(zip(event_keys, row[3:7])) if row[3] is not None else None,
+            "last_blocked": dict(zip(event_keys, row[7:11])) if row[7] is not None else None,
+            "actions": conn.execute("SELECT action, events, blocked_events FROM exam_session_actions "
+                                    "WHERE session_id=? ORDER BY events DESC, action", (session_id,)).fetchall(),
+            "materialized": True,
+        })
+        return report
+
+    def list(self, conn, limit=50):
+        """Most recent sessions first: (id, name, start_time, end_time, status, source_host, events,
+        blocked_events); counts are None until a session has been summarized"""
+        return conn.execute('''
+            SELECT e.id, e.session_name, e.start_time, e.end_time, e.status, e.source_host, s.events, s.blocked_events
+            FROM exam_sessions e LEFT JOIN exam_session_summaries s ON s.session_id = e.id
+            ORDER BY e.id DESC LIMIT ?
+        ''', (limit,)).fetchall()
+
+def format_report(report):
+    """Plain-text rendering of a session report, for the admin panel and db_tools"""
+    duration = report.get("duration_seconds")
+    lines = [f"{report['name']} (#{report['id']}, {report['status']}"
+             + (f", {report['source_host']}" if report.get("source_host") else "") + ")",
+             f"Started {report['start_time']} UTC" + (f", ended {report['end_time']} UTC" if report["end_time"] else ""),
+             f"Duration: {duration // 3600}h {duration % 3600 // 60:02d}m {duration % 60:02d}s" if duration is not None
+             else "Duration: unknown",
+             f"Events: {report['events']:,} ({report['blocked_events']:,} blocked)"]
+    for label, key in (("First blocked", "first_blocked"), ("Last blocked", "last_blocked")):
+        event = report.get(key)
+        if event:
+            lines.append(f"{label}: [{event['timestamp']}] {event['action']}: {event['details'] or 'N/A'}")
+    if report["actions"]:
+        lines.append("")
+        width = max(len(action) for action, _, _ in report["actions"])
+        lines += [f"  {action:<{width}}  {events:>8,}  {blocked:>8,} blocked" for action, events, blocked in report["actions"]]
+    return "\n".join(lines)
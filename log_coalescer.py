@@ -0,0 +1,246 @@
+"""
+Event coalescing for Exam Shield
+A student mashing a blocked key or a process respawning every two seconds
+produces long runs of identical events. EventCoalescer sits in front of the
+batch writer and folds each run into one row carrying count, first_seen
+(the row's timestamp) and last_seen, so counts stay exact while the table
+grows by a row per run instead of a row per event.
+
+The first event of a run is written straight away (the live monitor should
+not lag behind); repeats accumulate until the run has been quiet for
+`window` seconds, and a run that keeps going is written out every
+`max_span` seconds. A token bucket per action caps how many rows an action
+may write per second. A row with no token left waits: a run still going
+keeps accumulating, and a finished one joins its action's backlog, which
+is written out as tokens come in. Rows beyond `backlog` per action are
+folded into one overflow row for that action, so counts stay exact and
+the number of rows stays capped.
+"""
+
+import collections
+import threading
+import time
+from config import Config
+from log_writer import LogEvent
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """Spend a token if one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class _Run:
+    """Repeats of one event not yet written"""
+    __slots__ = ("event", "count", "first_seen", "last_seen", "started")
+
+    def __init__(self, event, count, now):
+        self.event = event
+        self.count = count
+        self.first_seen = event.created if count else None
+        self.last_seen = event.created
+        self.started = now
+
+class _Overflow:
+    """Rows of one action that did not fit in its backlog, written as a single row"""
+    __slots__ = ("first", "rows", "count", "blocked", "last_seen")
+
+    def __init__(self, event):
+        self.first = event
+        self.rows = 0
+        self.count = 0
+        self.blocked = False
+        self.last_seen = None
+
+    def add(self, event):
+        self.rows += 1
+        self.count += event.count
+        self.blocked = self.blocked or event.blocked
+        self.last_seen = event.last_seen or event.created
+
+    def event(self):
+        first = self.first
+        return LogEvent(first.action, f"Rate limited: {self.rows} rows folded into this one", self.blocked,
+                        first.user_id, first.created, first.session_id, self.count,
+                        self.last_seen if self.count > 1 else None)
+
+class EventCoalescer:
+    def __init__(self, emit, window=None, max_span=None, limits=None, default_limit=None, max_runs=None,
+                 backlog=None):
+        """emit(event) receives each outgoing LogEvent; limits maps action -> (rows per second, burst)"""
+        self.emit = emit
+        self.window = Config.LOG_COALESCE_WINDOW if window is None else window
+        self.max_span = Config.LOG_COALESCE_MAX_SPAN if max_span is None else max_span
+        self.limits = dict(Config.LOG_RATE_LIMITS if limits is None else limits)
+        self.default_limit = default_limit or Config.LOG_RATE_LIMIT_DEFAULT
+        self.max_runs = max_runs or Config.LOG_COALESCE_MAX_RUNS
+        self.backlog = backlog or Config.LOG_RATE_BACKLOG
+        self.received = 0
+        self.rows = 0
+        self.deferred = 0
+        self.folded = 0
+        self._runs = {}
+        self._buckets = {}
+        self._backlogs = {}   # action -> deque of finished rows waiting for a token
+        self._overflow = {}   # action -> _Overflow for rows its full backlog had no room for
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="EventCoalescer", daemon=True)
+        self._thread.start()
+
+    def set_limits(self, limits):
+        """Replace the per-action limits; buckets restart full"""
+        with self._lock:
+            self.limits = dict(limits)
+            self._buckets.clear()
+
+    def add(self, event):
+        key = (event.action, event.details, event.blocked, event.user_id, event.session_id)
+        now = time.monotonic()
+        out = None
+        with self._lock:
+            self.received += 1
+            run = self._runs.get(key)
+            if run is not None:
+                if not run.count:
+                    run.first_seen = event.created
+                    run.started = now
+                run.count += 1
+                run.last_seen = event.created
+                return True
+            if self._bucket(event.action, now).take(now):
+                out = event
+                self._runs[key] = _Run(event, 0, now)
+            else:
+                self.deferred += 1
+                self._runs[key] = _Run(event, 1, now)
+            if len(self._runs) > self.max_runs:
+                self._evict()
+        if out is not None:
+            self._send(out)
+        return True
+
+    def flush(self):
+        """Write out every pending run and backlog now, tokens or not"""
+        with self._lock:
+            events = [event for backlog in self._backlogs.values() for event in backlog]
+            events += [overflow.event() for overflow in self._overflow.values()]
+            events += [self._event(run) for run in self._runs.values() if run.count]
+            self._runs.clear()
+            self._backlogs.clear()
+            self._overflow.clear()
+        for event in events:
+            self._send(event)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(5.0)
+        self.flush()
+
+    def pending(self):
+        with self._lock:
+            return (sum(run.count for run in self._runs.values())
+                    + sum(event.count for backlog in self._backlogs.values() for event in backlog)
+                    + sum(overflow.count for overflow in self._overflow.values()))
+
+    def stats(self):
+        with self._lock:
+            backlog = sum(len(backlog) for backlog in self._backlogs.values())
+        return {"received": self.received, "rows": self.rows, "deferred": self.deferred,
+                "backlog": backlog, "folded": self.folded, "pending": self.pending()}
+
+    def _bucket(self, action, now):
+        bucket = self._buckets.get(action)
+        if bucket is None:
+            rate, burst = self.limits.get(action, self.default_limit)
+            bucket = self._buckets[action] = TokenBucket(rate, burst, now)
+        return bucket
+
+    def _run(self):
+        while not self._stop.wait(min(self.window, self.max_span) / 2):
+            with self._lock:
+                events = self._close(time.monotonic())
+            for event in events:
+                self._send(event)
+
+    def _close(self, now):
+        """Write out backlogged rows there are tokens for, then runs that went quiet or spanned max_span
+        (called with the lock held); returns the events to send"""
+        wall = time.time()
+        events, finished = self._release(now), []
+        for key, run in self._runs.items():
+            quiet = wall - run.last_seen >= self.window
+            if run.count and (quiet or now - run.started >= self.max_span):
+                # Rows already waiting for this action's tokens go first
+                if key[0] not in self._backlogs and self._bucket(key[0], now).take(now):
+                    events.append(self._event(run))
+                elif quiet:
+                    self._hold(self._event(run))
+                else:
+                    continue  # still going: it keeps counting until a token comes in
+                run.count, run.first_seen, run.started = 0, None, now
+            if quiet:
+                finished.append(key)
+        for key in finished:
+            del self._runs[key]
+        return events
+
+    def _hold(self, event):
+        """Queue a finished run's row until its action has a token, folding it into the action's overflow
+        row once the backlog is full (called with the lock held)"""
+        backlog = self._backlogs.setdefault(event.action, collections.deque())
+        overflow = self._overflow.get(event.action)
+        if overflow is None and len(backlog) < self.backlog:
+            backlog.append(event)
+            return
+        if overflow is None:
+            overflow = self._overflow[event.action] = _Overflow(event)
+        overflow.add(event)
+        self.folded += 1
+
+    def _release(self, now):
+        """Backlogged rows the actions' buckets have tokens for, oldest first, and an overflow row once
+        its backlog is empty (called with the lock held)"""
+        events, done = [], []
+        for action, backlog in self._backlogs.items():
+            bucket = self._bucket(action, now)
+            while backlog and bucket.take(now):
+                events.append(backlog.popleft())
+            if backlog:
+                continue
+            if action not in self._overflow:
+                done.append(action)
+            elif bucket.take(now):
+                events.append(self._overflow.pop(action).event())
+                done.append(action)
+        for action in done:
+            del self._backlogs[action]
+        return events
+
+    def _evict(self):
+        """Move the oldest runs beyond max_runs to their actions' backlogs (called with the lock held)"""
+        while len(self._runs) > self.max_runs:
+            run = self._runs.pop(next(iter(self._runs)))
+            if run.count:
+                self._hold(self._event(run))
+
+    @staticmethod
+    def _event(run):
+        event = run.event
+        return LogEvent(event.action, event.details, event.blocked, event.user_id, run.first_seen,
+                        event.session_id, run.count, run.last_seen if run.count > 1 else None)
+
+    def _send(self, event):
+        self.rows += 1
+        self.emit(event)
@@ -0,0 +1,156 @@
+"""
+Interned activity log strings for Exam Shield
+Actions are stored as small integer codes, and details are split into a shared
+template (digit runs replaced by a placeholder) plus the digits themselves,
+so the thousands of identical "Attempted to use: alt+tab" rows cost a few
+bytes each
+"""
+
+import functools
+import re
+import threading
+
+PLACEHOLDER = "\x1a"
+PARAM_SEPARATOR = ","
+_DIGITS = re.compile(r"\d+")
+
+@functools.lru_cache(maxsize=4096)
+def split_details(details):
+    """Return (template, params) for a details string; params is None when there are no digits"""
+    if details is None:
+        return None, None
+    if PLACEHOLDER in details:
+        return details, None
+    params = _DIGITS.findall(details)
+    if not params:
+        return details, None
+    return _DIGITS.sub(PLACEHOLDER, details), PARAM_SEPARATOR.join(params)
+
+def expand_details(template, params):
+    """Inverse of split_details(); also registered as the expand_details() SQL function"""
+    if template is None or params is None:
+        return template
+    pieces = template.split(PLACEHOLDER)
+    values = params.split(PARAM_SEPARATOR)
+    out = [pieces[0]]
+    for value, piece in zip(values, pieces[1:]):
+        out.append(value)
+        out.append(piece)
+    return "".join(out)
+
+class LogDictionary:
+    """Two-way action, template and host caches backed by log_actions, log_templates and log_hosts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    @staticmethod
+    def register(conn):
+        """Make expand_details() (needed by the partition views) and the details_template() /
+        details_params() halves of split_details() available to SQL on conn"""
+        conn.create_function("expand_details", 2, expand_details, deterministic=True)
+        conn.create_function("details_template", 1, lambda d: split_details(d)[0], deterministic=True)
+        conn.create_function("details_params", 1, lambda d: split_details(d)[1], deterministic=True)
+
+    def setup(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_actions (
+                id INTEGER PRIMARY KEY,
+                action TEXT NOT NULL UNIQUE
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_templates (
+                id INTEGER PRIMARY KEY,
+                template TEXT NOT NULL UNIQUE
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_hosts (
+                id INTEGER PRIMARY KEY,
+                host TEXT NOT NULL UNIQUE
+            )
+        ''')
+        self.reset()
+
+    def reset(self):
+        """Forget cached codes, e.g. after a write transaction that assigned some was rolled back"""
+        with self._lock:
+            self._action_ids, self._actions = {}, {}
+            self._template_ids, self._templates = {}, {}
+            self._host_ids, self._hosts = {}, {}
+
+    def action_id(self, conn, action):
+        """Code for action, interning it inside the caller's write transaction if new"""
+        code = self._action_ids.get(action)
+        if code is None:
+            code = self._intern(conn, "log_actions", "action", action, self._action_ids, self._actions)
+        return code
+
+    def encode_details(self, conn, details):
+        """(template_id, params) for a details string, interning the template if new"""
+        template, params = split_details(details)
+        if template is None:
+            return None, None
+        code = self._template_ids.get(template)
+        if code is None:
+            code = self._intern(conn, "log_templates", "template", template, self._template_ids, self._templates)
+        return code, params
+
+    def host_id(self, conn, host):
+        """Code for a source workstation name; None (this machine) stays None"""
+        if host is None:
+            return None
+        code = self._host_ids.get(host)
+        if code is None:
+            code = self._intern(conn, "log_hosts", "host", host, self._host_ids, self._hosts)
+        return code
+
+    def host(self, conn, code):
+        name = self._hosts.get(code)
+        if name is None and code is not None:
+            name = self._lookup(conn, "log_hosts", "host", code, self._host_ids, self._hosts)
+        return name
+
+    def action(self, conn, code):
+        name = self._actions.get(code)
+        if name is None and code is not None:
+            name = self._lookup(conn, "log_actions", "action", code, self._action_ids, self._actions)
+        return name
+
+    def details(self, conn, template_id, params):
+        if template_id is None:
+            return None
+        template = self._templates.get(template_id)
+        if template is None:
+            template = self._lookup(conn, "log_templates", "template", template_id,
+                                    self._template_ids, self._templates)
+        return expand_details(template, params)
+
+    def action_ids_with_prefix(self, conn, prefix):
+        """Codes of every known action starting with prefix (or any of a tuple of prefixes)"""
+        prefixes = prefix if isinstance(prefix, (tuple, list)) else (prefix,)
+        where = " OR ".join("(action >= ? AND action < ?)" for _ in prefixes)
+        params = [bound for p in prefixes for bound in (p, p + "\U0010ffff")]
+        return [row[0] for row in conn.execute(f"SELECT id FROM log_actions WHERE {where} ORDER BY id", params)]
+
+    def _intern(self, conn, table, column, value, ids, values):
+        row = conn.execute(f"SELECT id FROM {table} WHERE {column}=?", (value,)).fetchone()
+        if row is None:
+            code = conn.execute(f"INSERT INTO {table} ({column}) VALUES (?)", (value,)).lastrowid
+        else:
+            code = row[0]
+        with self._lock:
+            ids[value] = code
+            values[code] = value
+        return code
+
+    def _lookup(self, conn, table, column, code, ids, values):
+        row = conn.execute(f"SELECT {column} FROM {table} WHERE id=?", (code,)).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            ids[row[0]] = code
+            values[code] = row[0]
+        return row[0]
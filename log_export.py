@@ -0,0 +1,138 @@
+"""
+Streaming activity log export for Exam Shield
+Rows are read partition by partition through chunked cursors and written
+straight to CSV or JSON Lines, optionally gzip or zstd compressed, so memory
+stays flat no matter how many rows are exported
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXPORT_COLUMNS = ("id", "timestamp", "action", "details", "blocked", "user_id", "count", "last_seen", "severity",
+                  "category")
+FORMATS = ("csv", "jsonl")
+COMPRESSIONS = (None, "gzip", "zstd")
+
+class ExportCancelled(Exception):
+    pass
+
+def detect_format(path):
+    """(format, compression) implied by a file name such as logs.jsonl.gz"""
+    name = path.lower()
+    compression = None
+    if name.endswith(".gz"):
+        compression, name = "gzip", name[:-3]
+    elif name.endswith(".zst"):
+        compression, name = "zstd", name[:-4]
+    fmt = "jsonl" if name.endswith((".jsonl", ".json", ".ndjson")) else "csv"
+    return fmt, compression
+
+def open_output(path, compression=None):
+    """Text-mode writer for path with the requested compression"""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd export needs the 'zstandard' package (pip install zstandard)")
+        raw = open(path, "wb")
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=3).stream_writer(raw), encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+def write_rows(out, rows, fmt="csv", progress=None, cancel=None, progress_every=5000):
+    """Write rows of EXPORT_COLUMNS to out; returns the number written.
+
+    progress(count) is called every progress_every rows; a set cancel event stops the export.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_COLUMNS)
+        write = writer.writerow
+    else:
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        write = lambda row: out.write(encode(dict(zip(EXPORT_COLUMNS, row))) + "\n")
+    count = 0
+    for row in rows:
+        if fmt == "jsonl":
+            row = row[:4] + (bool(row[4]),) + row[5:]
+        write(row)
+        count += 1
+        if count % progress_every == 0:
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled(count)
+            if progress:
+                progress(count)
+    return count
+
+class ExportJob:
+    """Runs an export on a background thread; poll done/result/error or call wait()"""
+
+    def __init__(self, run, path, progress=None, on_done=None):
+        self.path = path
+        self.progress = progress
+        self.on_done = on_done
+        self.exported = 0
+        self.result = None
+        self.error = None
+        self.elapsed = 0.0
+        self._run_export = run
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="LogExport", daemon=True)
+        self._thread.start()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.result
+
+    def _report(self, count):
+        self.exported = count
+        if self.progress:
+            try:
+                self.progress(count)
+            except Exception as e:
+                print(f"Export progress callback error: {e}")
+
+    def _run(self):
+        start = time.perf_counter()
+        tmp_path = self.path + ".part"
+        try:
+            self.result = self._run_export(tmp_path, self._report, self._cancel)
+            os.replace(tmp_path, self.path)
+            self.exported = self.result
+        except Exception as e:
+            self.error = e
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            if not isinstance(e, ExportCancelled):
+                print(f"Log export error: {e}")
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self._done.set()
+            if self.on_done:
+                try:
+                    self.on_done(self)
+                except Exception as e:
+                    print(f"Export completion callback error: {e}")
@@ -0,0 +1,610 @@
+"""
+Day-partitioned activity log storage for Exam Shield
+Each UTC day lives in its own activity_logs_YYYYMMDD table, so retention is a
+DROP TABLE per expired day instead of a DELETE scan. activity_logs remains as
+a UNION ALL view for ad-hoc SQL; DatabaseManager reads through the router here.
+Rows store interned action and details codes (see log_dictionary); each
+partition's activity_logs_YYYYMMDD_v view decodes them and serves as the content
+table of its FTS5 index. The views call expand_details(), so ad-hoc SQL needs a
+connection set up with LogDictionary.register() (and log_severity.register() for
+partitions not yet migrated to stored severities).
+"""
+
+import calendar
+import datetime
+import itertools
+import re
+import sqlite3
+from log_dictionary import LogDictionary
+from log_severity import classify
+
+TABLE_PREFIX = "activity_logs_"
+COLUMNS = ("id", "user_id", "action", "details", "timestamp", "blocked", "ip_address")
+# Columns of the activity_logs view; source_host is set on rows merged in from other workstations,
+# session_id on rows logged during an exam session; count > 1 marks a coalesced run of identical
+# events from timestamp to last_seen; severity, category (see log_severity) and epoch are derived
+# from the row when it is written
+VIEW_COLUMNS = COLUMNS + ("source_host", "session_id", "count", "last_seen", "severity", "category", "epoch")
+# Partition columns added by later migrations, and what the views show until a partition has them
+LATE_COLUMNS = {"session_id": "NULL", "count": "1", "last_seen": "NULL"}
+DERIVED_COLUMNS = ("severity", "category", "epoch")
+# How each logical column is stored in a partition table
+STORED_COLUMNS = {"action": ("action_id",), "details": ("template_id", "params"), "source_host": ("host_id",)}
+
+def derived_sql(action, blocked, timestamp):
+    """SQL expressions computing DERIVED_COLUMNS from the given action, blocked and timestamp
+    expressions; they need a connection set up with log_severity.register()"""
+    return (f"log_severity({action}, {blocked})", f"log_category({action})",
+            f"CAST(strftime('%s', {timestamp}) AS INTEGER)")
+
+_SEARCH_TOKEN = re.compile(r'(?:(action|details):)?(?:"([^"]*)"|(\S+))')
+
+def build_match_query(text):
+    """Turn user search text into a safe FTS5 MATCH expression.
+
+    Words become quoted terms, "quoted text" stays a phrase, a trailing * makes a prefix
+    query, AND/OR/NOT pass through and action:/details: restrict a term to one column.
+    Returns None when there is nothing to search for.
+    """
+    parts = []
+    for match in _SEARCH_TOKEN.finditer(text or ""):
+        column, phrase, word = match.groups()
+        if word in ("AND", "OR", "NOT") and not column:
+            parts.append(word)
+            continue
+        term = phrase if phrase is not None else word
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if not term.strip():
+            continue
+        expr = f'"{term}"' + ("*" if prefix else "")
+        parts.append(f"{column} : {expr}" if column else expr)
+    while parts and parts[-1] in ("AND", "OR", "NOT"):
+        parts.pop()
+    while parts and parts[0] in ("AND", "OR"):
+        parts.pop(0)
+    return " ".join(parts) or None
+
+class LogPartitions:
+    INDEXES = ("timestamp", "action_id", "blocked", "user_id", "session_id", "severity", "category")
+    # Partial indexes: most events are logged outside exams and need no session entry
+    INDEX_FILTERS = {"session_id": "session_id IS NOT NULL"}
+    # Indexes of the pre-interning layout, dropped when a partition is compacted
+    LEGACY_INDEXES = ("timestamp", "action", "blocked", "user_id")
+    # SQLite refuses compound SELECTs with more terms than this
+    MAX_VIEW_PARTITIONS = 500
+
+    def __init__(self):
+        self._known_days = None
+        self.dictionary = LogDictionary()
+
+    @staticmethod
+    def table_name(day):
+        """activity_logs_YYYYMMDD for a 'YYYY-MM-DD' day"""
+        return TABLE_PREFIX + day.replace("-", "")
+
+    @staticmethod
+    def day_of(timestamp):
+        return timestamp[:10]
+
+    def create_catalog(self, conn):
+        """Create the partition catalog, id sequence, rebuild queue and dictionary tables"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_partitions (
+                day TEXT PRIMARY KEY,
+                table_name TEXT NOT NULL UNIQUE,
+                min_id INTEGER,
+                max_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_sequence (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO log_sequence (name, value) VALUES ('activity_logs', 0)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_partition_rebuilds (
+                table_name TEXT PRIMARY KEY
+            )
+        ''')
+        self.dictionary.setup(conn)
+        self._known_days = None
+
+    def _existing_partitions(self, conn):
+        """(table, column names) of every catalogued partition table that exists"""
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        return [(table, {row[1] for row in conn.execute(f"PRAGMA table_info({table})")})
+                for (table,) in conn.execute("SELECT table_name FROM log_partitions ORDER BY day").fetchall()
+                if table in existing]
+
+    def migrate_legacy_table(self, conn):
+        """Split the original single activity_logs table into day partitions.
+
+        Returns False when there is no such table. Indexes are queued for rebuild_indexes().
+        """
+        kind = conn.execute("SELECT type FROM sqlite_master WHERE name='activity_logs'").fetchone()
+        if not kind or kind[0] != "table":
+            return False
+        # One pass to find each row's day, then one set-based copy per day
+        conn.execute("CREATE TEMP TABLE legacy_days (id INTEGER PRIMARY KEY, day TEXT NOT NULL)")
+        conn.execute("INSERT INTO temp.legacy_days SELECT id, COALESCE(date(timestamp), date('now')) FROM activity_logs")
+        conn.execute("CREATE INDEX temp.legacy_days_day ON legacy_days (day)")
+        source = ", ".join("COALESCE(l.timestamp, CURRENT_TIMESTAMP) AS timestamp" if c == "timestamp" else f"l.{c}"
+                           for c in COLUMNS)
+        for (day,) in conn.execute("SELECT DISTINCT day FROM temp.legacy_days ORDER BY day").fetchall():
+            table = self.ensure(conn, day, refresh=False)
+            self.suspend_indexes(conn, table)
+            self._copy(conn, table, f"SELECT {source} FROM temp.legacy_days d JOIN activity_logs l ON l.id = d.id "
+                                    f"WHERE d.day = ?", (day,))
+            conn.execute(f"UPDATE log_partitions SET min_id=(SELECT MIN(id) FROM {table}), "
+                         f"max_id=(SELECT MAX(id) FROM {table}) WHERE day=?", (day,))
+        conn.execute("DROP TABLE temp.legacy_days")
+        conn.execute("UPDATE log_sequence SET value=MAX(value, (SELECT COALESCE(MAX(id), 0) FROM activity_logs)) "
+                     "WHERE name='activity_logs'")
+        conn.execute("DROP TABLE activity_logs")
+        return True
+
+    def compact_partitions(self, conn):
+        """Rewrite text-layout partitions into interned codes, keeping ids; returns how many.
+
+        Indexes are queued for rebuild_indexes().
+        """
+        tables = [table for table, columns in self._existing_partitions(conn) if "action" in columns]
+        if tables:
+            # The view reads the old columns; refresh_view() recreates it afterwards
+            conn.execute("DROP VIEW IF EXISTS activity_logs")
+        for table in tables:
+            conn.execute(f"DROP TABLE IF EXISTS {table}_fts")
+            conn.execute(f"DROP VIEW IF EXISTS {table}_v")
+            for column in self.LEGACY_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {table}_{column}")
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_uncompacted")
+            self._create_table(conn, table)
+            self.suspend_indexes(conn, table)
+            self._copy(conn, table, f"SELECT {', '.join(COLUMNS)} FROM {table}_uncompacted")
+            conn.execute(f"DROP TABLE {table}_uncompacted")
+        return len(tables)
+
+    def _copy(self, conn, table, source, params=()):
+        """Encode the rows of a SELECT over COLUMNS into a partition with set-based SQL, keeping ids.
+
+        Strings are interned by INSERT OR IGNORE, so the dictionary cache simply misses on them
+        and looks them up later.
+        """
+        conn.execute(f"INSERT OR IGNORE INTO log_actions (action) SELECT DISTINCT action FROM ({source})", params)
+        conn.execute(f"INSERT OR IGNORE INTO log_templates (template) SELECT DISTINCT details_template(details) "
+                     f"FROM ({source}) WHERE details IS NOT NULL", params)
+        derived = ", ".join(derived_sql("s.action", "s.blocked", "s.timestamp"))
+        conn.execute(f"INSERT INTO {table} (id, user_id, action_id, template_id, params, timestamp, blocked, ip_address, "
+                     f"severity, category, epoch) "
+                     f"SELECT s.id, s.user_id, a.id, t.id, details_params(s.details), s.timestamp, s.blocked, "
+                     f"s.ip_address, {derived} FROM ({source}) s JOIN log_actions a ON a.action = s.action "
+                     f"LEFT JOIN log_templates t ON t.template = details_template(s.details)", params)
+
+    def add_host_ids(self, conn):
+        """Add the host_id column to partitions created before merging existed; returns how many"""
+        tables = [table for table, columns in self._existing_partitions(conn) if "host_id" not in columns]
+        if tables:
+            conn.execute("DROP VIEW IF EXISTS activity_logs")
+        for table in tables:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN host_id INTEGER")
+            conn.execute(f"DROP VIEW IF EXISTS {table}_v")
+            self._create_views(conn, table)
+        return len(tables)
+
+    def add_event_counts(self, conn):
+        """Add the count and last_seen columns of coalesced runs to older partitions; returns how many"""
+        tables = [table for table, columns in self._existing_partitions(conn) if "count" not in columns]
+        if tables:
+            conn.execute("DROP VIEW IF EXISTS activity_logs")
+        for table in tables:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN count INTEGER NOT NULL DEFAULT 1")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN last_seen TIMESTAMP")
+            conn.execute(f"DROP VIEW IF EXISTS {table}_v")
+            self._create_views(conn, table)
+        return len(tables)
+
+    def add_classification(self, conn):
+        """Add and backfill the severity, category and epoch columns (and their indexes) of older
+        partitions; returns how many. Each action is classified once, not once per row."""
+        tables = [table for table, columns in self._existing_partitions(conn) if "severity" not in columns]
+        if not tables:
+            return 0
+        conn.execute("DROP VIEW IF EXISTS activity_logs")
+        conn.execute("CREATE TEMP TABLE action_classes (id INTEGER PRIMARY KEY, allowed INTEGER, blocked INTEGER, "
+                     "category INTEGER)")
+        conn.execute("INSERT INTO temp.action_classes SELECT id, log_severity(action, 0), log_severity(action, 1), "
+                     "log_category(action) FROM log_actions")
+        for table in tables:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN severity INTEGER NOT NULL DEFAULT 0")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN category INTEGER NOT NULL DEFAULT 0")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN epoch INTEGER")
+            conn.execute(f"UPDATE {table} SET "
+                         f"severity = (SELECT CASE WHEN {table}.blocked THEN c.blocked ELSE c.allowed END "
+                         f"FROM temp.action_classes c WHERE c.id = {table}.action_id), "
+                         f"category = (SELECT c.category FROM temp.action_classes c WHERE c.id = {table}.action_id), "
+                         f"epoch = CAST(strftime('%s', timestamp) AS INTEGER)")
+            for column in DERIVED_COLUMNS:
+                if column in self.INDEXES:
+                    conn.execute(self.index_sql(table, column))
+            conn.execute(f"DROP VIEW IF EXISTS {table}_v")
+            self._create_views(conn, table)
+        conn.execute("DROP TABLE temp.action_classes")
+        return len(tables)
+
+    def add_session_ids(self, conn):
+        """Add the session_id column and its index to partitions created before exam sessions
+        were tracked; returns how many. The column starts out NULL, so the partial index is empty."""
+        tables = [table for table, columns in self._existing_partitions(conn) if "session_id" not in columns]
+        if tables:
+            conn.execute("DROP VIEW IF EXISTS activity_logs")
+        for table in tables:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN session_id INTEGER")
+            conn.execute(self.index_sql(table, "session_id"))
+            conn.execute(f"DROP VIEW IF EXISTS {table}_v")
+            self._create_views(conn, table)
+        return len(tables)
+
+    def ensure(self, conn, day, refresh=True):
+        """Return the partition table for day, creating it (and its indexes) on first use"""
+        table = self.table_name(day)
+        known = self._days(conn)
+        if day in known:
+            return table
+        self._create_table(conn, table)
+        conn.execute("INSERT OR IGNORE INTO log_partitions (day, table_name) VALUES (?, ?)", (day, table))
+        known.add(day)
+        if refresh:
+            self.refresh_view(conn)
+        return table
+
+    def _days(self, conn):
+        """Days with a partition, read from the catalog on first use"""
+        if self._known_days is None:
+            self._known_days = {row[0] for row in conn.execute("SELECT day FROM log_partitions")}
+        return self._known_days
+
+    def _create_table(self, conn, table):
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                action_id INTEGER NOT NULL,
+                template_id INTEGER,
+                params TEXT,
+                timestamp TIMESTAMP NOT NULL,
+                blocked BOOLEAN DEFAULT FALSE,
+                ip_address TEXT,
+                host_id INTEGER,
+                session_id INTEGER,
+                count INTEGER NOT NULL DEFAULT 1,
+                last_seen TIMESTAMP,
+                severity INTEGER NOT NULL DEFAULT 0,
+                category INTEGER NOT NULL DEFAULT 0,
+                epoch INTEGER,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+        for column in self.INDEXES:
+            conn.execute(self.index_sql(table, column))
+        self._create_views(conn, table)
+
+    @classmethod
+    def index_sql(cls, table, column):
+        sql = f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})"
+        if column in cls.INDEX_FILTERS:
+            sql += " WHERE " + cls.INDEX_FILTERS[column]
+        return sql
+
+    @staticmethod
+    def _create_views(conn, table, rebuild=False):
+        """The decoding view over a partition and the external-content FTS5 index built on it;
+        rows are added to the index explicitly by _store()"""
+        stored = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        late = ", ".join(f"{'p.' + column if column in stored else default} AS {column}"
+                         for column, default in LATE_COLUMNS.items())
+        late += ", " + ", ".join(f"{'p.' + column if column in stored else default} AS {column}" for column, default
+                                 in zip(DERIVED_COLUMNS, derived_sql("a.action", "p.blocked", "p.timestamp")))
+        conn.execute(f'''
+            CREATE VIEW IF NOT EXISTS {table}_v AS
+            SELECT p.id AS id, p.user_id AS user_id, a.action AS action,
+                   expand_details(t.template, p.params) AS details, p.timestamp AS timestamp,
+                   p.blocked AS blocked, p.ip_address AS ip_address, h.host AS source_host, {late}
+            FROM {table} p JOIN log_actions a ON a.id = p.action_id
+            LEFT JOIN log_templates t ON t.id = p.template_id
+            LEFT JOIN log_hosts h ON h.id = p.host_id
+        ''')
+        conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+                     f"action, details, content='{table}_v', content_rowid='id', prefix='2 3')")
+        if rebuild:
+            conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+    def refresh_view(self, conn):
+        """Rebuild the activity_logs compatibility view over the current partitions"""
+        tables = [row[0] for row in conn.execute(
+            "SELECT table_name FROM log_partitions ORDER BY day DESC LIMIT ?", (self.MAX_VIEW_PARTITIONS,))]
+        columns = ", ".join(VIEW_COLUMNS)
+        if tables:
+            body = " UNION ALL ".join(f"SELECT {columns} FROM {table}_v" for table in reversed(tables))
+        else:
+            body = "SELECT " + ", ".join(f"NULL AS {c}" for c in VIEW_COLUMNS) + " WHERE 0"
+        conn.execute("DROP VIEW IF EXISTS activity_logs")
+        conn.execute(f"CREATE VIEW activity_logs AS {body}")
+
+    def allocate_ids(self, conn, count):
+        """Reserve `count` consecutive log ids inside the caller's write transaction"""
+        last = conn.execute("SELECT value FROM log_sequence WHERE name='activity_logs'").fetchone()[0]
+        conn.execute("UPDATE log_sequence SET value=? WHERE name='activity_logs'", (last + count,))
+        return last + 1
+
+    def last_id(self, conn):
+        row = conn.execute("SELECT value FROM log_sequence WHERE name='activity_logs'").fetchone()
+        return row[0] if row else 0
+
+    def insert(self, conn, rows):
+        """Insert (user_id, action, details, timestamp, blocked[, session_id, count, last_seen, epoch])
+        rows into their day partitions; epoch is derived from timestamp when not given.
+
+        Rows are grouped by consecutive day, so time-ordered input touches each partition once.
+        Returns the last id assigned.
+        """
+        last_id = None
+        new_partition = False
+        for day, group in itertools.groupby(rows, key=lambda r: self.day_of(r[3])):
+            group = list(group)
+            if day not in self._days(conn):
+                new_partition = True
+            table = self.ensure(conn, day, refresh=False)
+            first_id = self.allocate_ids(conn, len(group))
+            self._store(conn, table, [self._stored_row(first_id + i, row) for i, row in enumerate(group)])
+            last_id = first_id + len(group) - 1
+            conn.execute("UPDATE log_partitions SET min_id=COALESCE(MIN(min_id, ?), ?), max_id=MAX(COALESCE(max_id, 0), ?) "
+                         "WHERE day=?", (first_id, first_id, last_id, day))
+        if new_partition:
+            self.refresh_view(conn)
+        return last_id
+
+    @staticmethod
+    def _stored_row(row_id, row):
+        """insert() row -> _store() row, filling in ip_address and the optional trailing fields"""
+        optional = tuple(row[5:9])
+        return (row_id,) + tuple(row[:5]) + (None,) + optional + (None, 1, None, None)[len(optional):]
+
+    @staticmethod
+    def epoch(timestamp):
+        """Epoch seconds of a UTC 'YYYY-MM-DD HH:MM:SS' timestamp"""
+        # Sliced rather than strptime'd: this runs once per row written and strptime is ~20x slower
+        return calendar.timegm((int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                                int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19])))
+
+    def _store(self, conn, table, rows):
+        """Encode and insert (id, user_id, action, details, timestamp, blocked, ip_address, session_id,
+        count, last_seen, epoch) rows with their severity and category, indexing them for search"""
+        try:
+            encoded = []
+            for row_id, user_id, action, details, timestamp, blocked, ip_address, session_id, count, last_seen, \
+                    epoch in rows:
+                template_id, params = self.dictionary.encode_details(conn, details)
+                encoded.append((row_id, user_id, self.dictionary.action_id(conn, action), template_id, params,
+                                timestamp, blocked, ip_address, session_id, count, last_seen)
+                               + classify(action, blocked) + (self.epoch(timestamp) if epoch is None else epoch,))
+            conn.executemany(f"INSERT INTO {table} (id, user_id, action_id, template_id, params, timestamp, "
+                             f"blocked, ip_address, session_id, count, last_seen, severity, category, epoch) "
+                             f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", encoded)
+            conn.executemany(f"INSERT INTO {table}_fts (rowid, action, details) VALUES (?, ?, ?)",
+                             [(row[0], row[2], row[3]) for row in rows])
+        except BaseException:
+            # Codes interned by this transaction disappear if it rolls back
+            self.invalidate()
+            raise
+
+    def invalidate(self):
+        """Drop cached partition and dictionary state after a rolled-back write; ensure() is
+        idempotent, so partitions are simply re-read from the catalog on next use"""
+        self._known_days = None
+        self.dictionary.reset()
+
+    def stored_columns(self, columns):
+        """Partition table columns that hold the given logical columns"""
+        return [stored for column in columns for stored in STORED_COLUMNS.get(column, (column,))]
+
+    def decode(self, conn, columns, row):
+        """Turn a row of stored_columns(columns) back into a tuple of the logical columns"""
+        out, i = [], 0
+        for column in columns:
+            if column == "action":
+                out.append(self.dictionary.action(conn, row[i]))
+                i += 1
+            elif column == "details":
+                out.append(self.dictionary.details(conn, row[i], row[i + 1]))
+                i += 2
+            elif column == "source_host":
+                out.append(self.dictionary.host(conn, row[i]))
+                i += 1
+            else:
+                out.append(row[i])
+                i += 1
+        return tuple(out)
+
+    def suspend_indexes(self, conn, table):
+        """Drop a partition's indexes ahead of a bulk load; rebuild_indexes() restores them.
+
+        Rows loaded while suspended are not in the search index either. The pending rebuild is
+        recorded in the caller's transaction, so an interrupted load is finished on the next
+        rebuild_indexes() (see schema_migrations.build_pending_indexes).
+        """
+        if conn.execute("INSERT OR IGNORE INTO log_partition_rebuilds (table_name) VALUES (?)",
+                        (table,)).rowcount == 0:
+            return
+        for column in self.INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {table}_{column}")
+
+    def rebuild_indexes(self, conn, limit=None):
+        """Recreate indexes and search indexes of suspended partitions (at most `limit` of them,
+        oldest first); returns their names"""
+        sql = "SELECT table_name FROM log_partition_rebuilds ORDER BY table_name"
+        tables = [row[0] for row in conn.execute(sql + (" LIMIT ?" if limit else ""), (limit,) if limit else ())]
+        for table in tables:
+            for column in self.INDEXES:
+                conn.execute(self.index_sql(table, column))
+            conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+            conn.execute("DELETE FROM log_partition_rebuilds WHERE table_name=?", (table,))
+        return tables
+
+    def pending_rebuilds(self, conn):
+        return conn.execute("SELECT COUNT(*) FROM log_partition_rebuilds").fetchone()[0]
+
+    def partitions(self, conn, since=None, until=None, min_id=None, max_id=None):
+        """Catalog rows (day, table_name, min_id, max_id) overlapping a time and id range"""
+        where, params = ["min_id IS NOT NULL"], []
+        if since is not None:
+            where.append("day >= ?")
+            params.append(self.day_of(since))
+        if until is not None:
+            where.append("day <= ?")
+            params.append(self.day_of(until))
+        if min_id is not None:
+            where.append("max_id >= ?")
+            params.append(min_id)
+        if max_id is not None:
+            where.append("min_id <= ?")
+            params.append(max_id)
+        return conn.execute("SELECT day, table_name, min_id, max_id FROM log_partitions WHERE "
+                            + " AND ".join(where) + " ORDER BY day", params).fetchall()
+
+    def select(self, conn, columns, where_for, order_by="id", descending=True, limit=100,
+               since=None, until=None, min_id=None, max_id=None):
+        """Run one ordered, limited SELECT per partition and merge the results.
+
+        where_for(table) returns (sql, params) for that partition's WHERE clause. Rows come back as
+        tuples of `columns`, ordered by id, (timestamp, id) or (severity, id), and at most `limit`
+        long. Partitions are visited in key order and the scan stops once later partitions cannot
+        contribute to the first `limit` rows; severity order has to ask every partition.
+        """
+        candidates = self.partitions(conn, since, until, min_id, max_id)
+        if order_by == "id":
+            candidates.sort(key=lambda p: p[3] if descending else p[2], reverse=descending)
+        else:
+            candidates.sort(key=lambda p: p[0], reverse=descending)
+        order = self.order_clause(order_by, descending)
+
+        keyed = []
+        sort_column = "severity" if order_by == "severity" else "timestamp"
+        select_list = ["id", sort_column] + self.stored_columns(columns)
+        for day, table, low, high in candidates:
+            if len(keyed) >= limit:
+                boundary = keyed[limit - 1][0]
+                if order_by == "id":
+                    if (descending and high < boundary) or (not descending and low > boundary):
+                        break
+                elif order_by == "timestamp":
+                    # Days are disjoint in time, so a full page from newer days is final
+                    break
+            where, params = where_for(table)
+            sql = self.partition_sql(table, select_list, where, order)
+            try:
+                rows = conn.execute(sql, list(params) + [limit]).fetchall()
+            except sqlite3.OperationalError:
+                # Partition dropped by retention between the catalog read and this query
+                continue
+            for row in rows:
+                key = row[0] if order_by == "id" else (row[1], row[0])
+                keyed.append((key, row[2:]))
+            keyed.sort(key=lambda item: item[0], reverse=descending)
+            del keyed[limit:]
+        return [self.decode(conn, columns, row) for _, row in keyed]
+
+    def iterate(self, conn, columns, where_for, since=None, until=None, chunk_size=5000):
+        """Yield every matching row in id order, one partition cursor at a time.
+
+        Rows are fetched chunk_size at a time, so memory use does not grow with the result.
+        """
+        candidates = self.partitions(conn, since, until)
+        candidates.sort(key=lambda p: p[2])
+        stored = self.stored_columns(columns)
+        for day, table, low, high in candidates:
+            where, params = where_for(table)
+            try:
+                cursor = conn.execute(self.partition_sql(table, stored, where, "id ASC"), list(params) + [-1])
+            except sqlite3.OperationalError:
+                continue
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                for row in chunk:
+                    yield self.decode(conn, columns, row)
+
+    def estimate_rows(self, conn, since=None, until=None):
+        """Upper bound on the rows in a time range, from the catalog id ranges"""
+        return sum(high - low + 1 for _, _, low, high in self.partitions(conn, since, until))
+
+    def search(self, conn, match, where_for, limit=50, order="rank", since=None, until=None):
+        """Full-text search across partitions.
+
+        Returns (id, action, details_snippet, timestamp, blocked, rank, count) rows; matched terms
+        are wrapped in [brackets]. order="rank" merges each partition's best bm25 matches, while
+        order="newest" walks partitions newest first and stops as soon as the page is full.
+        where_for(table) adds filters on the partition, aliased as p.
+        """
+        candidates = self.partitions(conn, since, until)
+        candidates.sort(key=lambda p: p[3], reverse=True)
+        by_rank = order == "rank"
+        results = []
+        for day, table, low, high in candidates:
+            if not by_rank and len(results) >= limit:
+                break
+            fts = f"{table}_fts"
+            where, params = where_for(table)
+            sql = (f"SELECT {fts}.rowid, highlight({fts}, 0, '[', ']'), "
+                   f"snippet({fts}, 1, '[', ']', '…', 16), p.timestamp, p.blocked, {fts}.rank, p.count "
+                   f"FROM {fts} JOIN {table} AS p ON p.id = {fts}.rowid WHERE {fts} MATCH ?")
+            if where:
+                sql += " AND " + where
+            sql += f" ORDER BY {'rank' if by_rank else fts + '.rowid DESC'} LIMIT ?"
+            try:
+                results.extend(conn.execute(sql, [match] + list(params) + [limit - (0 if by_rank else len(results))]))
+            except sqlite3.OperationalError as e:
+                if "no such table" in str(e):
+                    continue
+                raise
+        if by_rank:
+            results.sort(key=lambda row: row[5])
+        return results[:limit]
+
+    @staticmethod
+    def order_clause(order_by="id", descending=True):
+        direction = "DESC" if descending else "ASC"
+        return f"id {direction}" if order_by == "id" else f"{order_by} {direction}, id {direction}"
+
+    @staticmethod
+    def partition_sql(table, columns, where="", order="id DESC"):
+        """The per-partition SELECT issued by select(), ending in a LIMIT placeholder"""
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+        if where:
+            sql += " WHERE " + where
+        return sql + f" ORDER BY {order} LIMIT ?"
+
+    def drop_before(self, conn, day, limit=None):
+        """Drop partitions older than day (at most `limit`, oldest first); returns the days removed"""
+        sql = "SELECT day, table_name FROM log_partitions WHERE day < ? ORDER BY day"
+        expired = conn.execute(sql + (" LIMIT ?" if limit else ""), (day, limit) if limit else (day,)).fetchall()
+        for old_day, table in expired:
+            conn.execute(f"DROP TABLE IF EXISTS {table}_fts")
+            conn.execute(f"DROP VIEW IF EXISTS {table}_v")
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute("DELETE FROM log_partitions WHERE day=?", (old_day,))
+            conn.execute("DELETE FROM log_partition_rebuilds WHERE table_name=?", (table,))
+            if self._known_days is not None:
+                self._known_days.discard(old_day)
+        if expired:
+            self.refresh_view(conn)
+        return [d for d, _ in expired]
+
+    @staticmethod
+    def retention_cutoff(days):
+        """First UTC day that is still kept under a `days`-long retention window"""
+        return (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).strftime("%Y-%m-%d")
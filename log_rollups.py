@@ -0,0 +1,144 @@
+"""
+Activity log rollups for Exam Shield
+Per-minute and per-hour event counters keyed by (bucket, action, blocked),
+updated in the same transaction that writes each batch, so dashboard series
+never have to scan raw activity_logs rows. Each counter also carries the
+severity of its (action, blocked) pair, so series can be filtered by it.
+"""
+
+import datetime
+from collections import Counter
+from log_severity import severity
+
+# resolution -> (table, bucket length in characters of 'YYYY-MM-DD HH:MM:SS', bucket suffix, seconds)
+RESOLUTIONS = {
+    "minute": ("log_rollup_minute", 16, ":00", 60),
+    "hour": ("log_rollup_hour", 13, ":00:00", 3600),
+}
+
+class LogRollups:
+    def setup(self, conn, partitions):
+        """Create the rollup tables, backfilling them when they are new"""
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        for table, _, _, _ in RESOLUTIONS.values():
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    blocked INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    severity INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (bucket, action, blocked)
+                ) WITHOUT ROWID
+            ''')
+        if any(table not in existing for table, _, _, _ in RESOLUTIONS.values()):
+            self.rebuild(conn, partitions)
+
+    def add_severity(self, conn):
+        """Add the severity column to rollup tables created before it existed"""
+        for table, _, _, _ in RESOLUTIONS.values():
+            if "severity" not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN severity INTEGER NOT NULL DEFAULT 0")
+                conn.execute(f"UPDATE {table} SET severity = log_severity(action, blocked)")
+
+    @staticmethod
+    def bucket(timestamp, resolution="minute"):
+        """Start of the bucket containing a 'YYYY-MM-DD HH:MM:SS' timestamp"""
+        _, length, suffix, _ = RESOLUTIONS[resolution]
+        return timestamp[:length] + suffix
+
+    def apply(self, conn, rows):
+        """Add (user_id, action, details, timestamp, blocked[, session_id, count, ...]) rows to the counters.
+
+        A coalesced row counts `count` events, all in the bucket of its first timestamp.
+        """
+        for resolution, (table, _, _, _) in RESOLUTIONS.items():
+            counts = Counter()
+            for row in rows:
+                counts[(self.bucket(row[3], resolution), row[1], 1 if row[4] else 0)] += row[6] if len(row) > 6 else 1
+            conn.executemany(f"INSERT INTO {table} (bucket, action, blocked, count, severity) VALUES (?, ?, ?, ?, ?) "
+                             f"ON CONFLICT (bucket, action, blocked) DO UPDATE SET count = count + excluded.count",
+                             [key + (n, severity(key[1], key[2] == 1)) for key, n in counts.items()])
+
+    def rebuild(self, conn, partitions, since_day=None):
+        """Recompute the counters from the raw partitions, optionally only from since_day on.
+
+        Returns the number of partitions scanned.
+        """
+        tables = partitions.partitions(conn, since=f"{since_day} 00:00:00" if since_day else None)
+        if not tables:
+            return 0
+        # Hourly buckets outlive the raw partitions, so only replace what can be recomputed
+        since = f"{max(since_day or '', tables[0][0])} 00:00:00"
+        minute, length, suffix, _ = RESOLUTIONS["minute"]
+        hour, hour_length, hour_suffix, _ = RESOLUTIONS["hour"]
+        conn.execute(f"DELETE FROM {minute} WHERE bucket >= ?", (since,))
+        conn.execute(f"DELETE FROM {hour} WHERE bucket >= ?", (since,))
+        for _, table, _, _ in tables:
+            conn.execute(f"INSERT INTO {minute} (bucket, action, blocked, count, severity) "
+                         f"SELECT substr(timestamp, 1, {length}) || '{suffix}', action, "
+                         f"CASE WHEN blocked THEN 1 ELSE 0 END, SUM(count), MAX(severity) FROM {table}_v "
+                         f"WHERE true GROUP BY 1, 2, 3 "
+                         f"ON CONFLICT (bucket, action, blocked) DO UPDATE SET count = count + excluded.count")
+        # Hours are a straight re-aggregation of the minute table
+        conn.execute(f"INSERT INTO {hour} (bucket, action, blocked, count, severity) "
+                     f"SELECT substr(bucket, 1, {hour_length}) || '{hour_suffix}', action, blocked, SUM(count), "
+                     f"MAX(severity) "
+                     f"FROM {minute} WHERE bucket >= ? GROUP BY 1, 2, 3 "
+                     f"ON CONFLICT (bucket, action, blocked) DO UPDATE SET count = count + excluded.count",
+                     (since,))
+        return len(tables)
+
+    def series(self, conn, resolution="minute", since=None, until=None, action_prefix=None,
+               blocked=None, by_action=False, fill=False, min_severity=None):
+        """Time-bucketed counts between since (inclusive) and until (exclusive), optionally only
+        of events at min_severity or above.
+
+        Returns (bucket, count) rows, or (bucket, action, count) rows with by_action=True.
+        fill=True inserts zero buckets for gaps; it needs both since and until.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown rollup resolution: {resolution}")
+        table, _, _, step = RESOLUTIONS[resolution]
+        where, params = [], []
+        if since is not None:
+            where.append("bucket >= ?")
+            params.append(self.bucket(since, resolution))
+        if until is not None:
+            where.append("bucket < ?")
+            params.append(until)
+        if blocked is not None:
+            where.append("blocked = ?")
+            params.append(1 if blocked else 0)
+        if min_severity is not None:
+            where.append("severity >= ?")
+            params.append(min_severity)
+        if action_prefix:
+            prefixes = action_prefix if isinstance(action_prefix, (tuple, list)) else (action_prefix,)
+            where.append("(" + " OR ".join("(action >= ? AND action < ?)" for _ in prefixes) + ")")
+            for prefix in prefixes:
+                params += [prefix, prefix + "\U0010ffff"]
+        group = "bucket, action" if by_action else "bucket"
+        sql = f"SELECT {group}, SUM(count) FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = conn.execute(sql + f" GROUP BY {group} ORDER BY {group}", params).fetchall()
+        if not fill or by_action:
+            return rows
+        if since is None or until is None:
+            raise ValueError("fill=True needs both since and until")
+        counts = dict(rows)
+        fmt = "%Y-%m-%d %H:%M:%S"
+        current = datetime.datetime.strptime(self.bucket(since, resolution), fmt)
+        end = datetime.datetime.strptime(until, fmt)
+        filled = []
+        while current < end:
+            key = current.strftime(fmt)
+            filled.append((key, counts.get(key, 0)))
+            current += datetime.timedelta(seconds=step)
+        return filled
+
+    def drop_before(self, conn, day, resolution="minute"):
+        """Trim buckets older than day; hourly buckets are small enough to keep by default"""
+        table = RESOLUTIONS[resolution][0]
+        conn.execute(f"DELETE FROM {table} WHERE bucket < ?", (f"{day} 00:00:00",))
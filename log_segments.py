@@ -0,0 +1,355 @@
+"""
+Rotating JSON Lines log segments for Exam Shield
+The file sink writes one JSON object per line into segments named
+exam_shield-YYYYMMDD-NNN.jsonl, starting a new segment at local midnight or
+once a segment reaches Config.LOG_SEGMENT_MAX_BYTES. Closed segments are
+gzip-compressed on a background thread. manifest.json in the log directory
+lists every segment with its first and last timestamp, record count and size,
+so retention and time-range reads pick their files from the manifest and
+never list or stat the directory.
+
+The manifest is rewritten (atomically) only when a segment is opened, closed,
+compressed or deleted. The open segment's `last` is therefore stale on disk;
+readers treat an open segment as reaching up to now, and a segment left open
+by a crash is rescanned and closed on the next start.
+"""
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from config import Config
+
+MANIFEST = "manifest.json"
+SEGMENT_PATTERN = re.compile(r"^exam_shield-(\d{8})-(\d{3,})\.jsonl(\.gz)?$")
+LEGACY_PATTERN = re.compile(r"^exam_shield_(\d{8})\.log$")
+
+def _epoch(value):
+    """Seconds since the epoch for a datetime or a number; None stays None"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return value.timestamp()
+
+def _day_bounds(day):
+    """Local-time [start, end) of a YYYYMMDD day as epoch seconds"""
+    date = datetime.datetime.strptime(day, "%Y%m%d")
+    return date.timestamp(), (date + datetime.timedelta(days=1)).timestamp()
+
+def load_manifest(log_dir):
+    """Segment entries recorded in log_dir's manifest; [] when there is none"""
+    try:
+        with open(os.path.join(log_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)["segments"]
+    except FileNotFoundError:
+        return []
+    except (ValueError, KeyError) as e:
+        print(f"Log manifest unreadable: {e}")
+        return []
+
+def _overlaps(entry, since, until):
+    if entry.get("format", "jsonl") != "jsonl" or entry["first"] is None:
+        return False
+    if since is not None and entry["closed"] and entry["last"] < since:
+        return False
+    return until is None or entry["first"] < until
+
+def _open_segment(log_dir, name):
+    """Text reader for a segment; a plain name that has since been compressed falls back to .gz"""
+    path = os.path.join(log_dir, name)
+    try:
+        if name.endswith(".gz"):
+            return gzip.open(path, "rt", encoding="utf-8")
+        return open(path, encoding="utf-8")
+    except FileNotFoundError:
+        if name.endswith(".gz"):
+            raise
+        return gzip.open(path + ".gz", "rt", encoding="utf-8")
+
+def read_entries(log_dir, entries, since=None, until=None):
+    """Yield the records of the given segments with since <= ts < until, oldest segment first"""
+    since, until = _epoch(since), _epoch(until)
+    for entry in entries:
+        if not _overlaps(entry, since, until):
+            continue
+        try:
+            f = _open_segment(log_dir, entry["name"])
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                ts = record.get("ts", 0)
+                if (since is None or ts >= since) and (until is None or ts < until):
+                    yield record
+
+def read_logs(log_dir, since=None, until=None):
+    """Records between since and until (datetimes or epoch seconds) from log_dir, using only
+    the segments the manifest says overlap the range. Usable from another process."""
+    return read_entries(log_dir, load_manifest(log_dir), since, until)
+
+class LogSegments:
+    """The segment files and manifest of one log directory; write() is called by a single thread"""
+
+    def __init__(self, log_dir, max_bytes=None, compress=None):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes or Config.LOG_SEGMENT_MAX_BYTES
+        self.compress = Config.LOG_SEGMENT_COMPRESS if compress is None else compress
+        self._lock = threading.RLock()
+        self._stream = None
+        self._active = None
+        self._day_end = None
+        self._pending = queue.SimpleQueue()
+        os.makedirs(log_dir, exist_ok=True)
+        if os.path.exists(os.path.join(log_dir, MANIFEST)):
+            self._segments = load_manifest(log_dir)
+        else:
+            self._segments = self._adopt()
+        self._recover()
+        self._compressor = None
+        if self.compress:
+            self._compressor = threading.Thread(target=self._compress_loop, name="LogSegmentCompressor", daemon=True)
+            self._compressor.start()
+            for entry in self._segments:
+                if entry["closed"] and not entry["compressed"] and entry.get("format", "jsonl") == "jsonl":
+                    self._pending.put(entry["name"])
+
+    def segments(self):
+        """Copies of the manifest entries, oldest first"""
+        with self._lock:
+            return [dict(entry) for entry in self._segments]
+
+    def write(self, items):
+        """Append (created, encoded line) pairs, rotating by day and size as needed"""
+        lines = []
+        with self._lock:
+            for created, line in items:
+                entry = self._active
+                # A record created before midnight but written after it stays in the new day's segment
+                if entry is None or created >= self._day_end or \
+                        (entry["records"] and entry["bytes"] + len(line) > self.max_bytes):
+                    self._flush(lines)
+                    lines = []
+                    self._rotate(created)
+                    entry = self._active
+                lines.append(line)
+                entry["records"] += 1
+                entry["bytes"] += len(line)
+                if entry["first"] is None or created < entry["first"]:
+                    entry["first"] = created
+                if entry["last"] is None or created > entry["last"]:
+                    entry["last"] = created
+            self._flush(lines)
+
+    def read(self, since=None, until=None):
+        """Records between since and until from the segments that overlap the range"""
+        return read_entries(self.log_dir, self.segments(), since, until)
+
+    def prune(self, before):
+        """Delete closed segments whose last record is older than `before`; returns their names"""
+        before = _epoch(before)
+        with self._lock:
+            expired = [e for e in self._segments if e["closed"] and e["last"] is not None and e["last"] < before]
+            if not expired:
+                return []
+            self._segments = [e for e in self._segments if not (e["closed"] and e["last"] is not None
+                                                                 and e["last"] < before)]
+            self._save()
+        for entry in expired:
+            try:
+                os.remove(os.path.join(self.log_dir, entry["name"]))
+            except FileNotFoundError:
+                pass  # compressed after we took the entry; the compressor removes its output
+            except OSError as e:
+                print(f"Error removing log segment {entry['name']}: {e}")
+        return [entry["name"] for entry in expired]
+
+    def close(self, timeout=5.0):
+        """Close the open segment and let the compressor finish what it is working on"""
+        with self._lock:
+            self._close_active()
+            if self._active is not None:
+                self._active = None
+                self._save()
+        if self._compressor is not None:
+            self._pending.put(None)
+            self._compressor.join(timeout)
+            self._compressor = None
+
+    def _flush(self, lines):
+        if lines:
+            self._stream.write(b"".join(lines))
+            self._stream.flush()
+
+    def _rotate(self, created):
+        self._close_active()
+        day = time.strftime("%Y%m%d", time.localtime(created))
+        sequence = 1 + max((int(SEGMENT_PATTERN.match(e["name"]).group(2)) for e in self._segments
+                            if e["day"] == day and SEGMENT_PATTERN.match(e["name"])), default=0)
+        self._active = {"name": f"exam_shield-{day}-{sequence:03d}.jsonl", "day": day, "first": None, "last": None,
+                        "records": 0, "bytes": 0, "stored_bytes": None, "closed": False, "compressed": False,
+                        "format": "jsonl"}
+        self._day_end = _day_bounds(day)[1]
+        self._stream = open(os.path.join(self.log_dir, self._active["name"]), "ab")
+        self._segments.append(self._active)
+        self._save()
+
+    def _close_active(self):
+        if self._stream is None:
+            return
+        self._stream.close()
+        self._stream = None
+        self._active["closed"] = True
+        self._active["stored_bytes"] = self._active["bytes"]
+        self._save()
+        if self._compressor is not None:
+            self._pending.put(self._active["name"])
+
+    def _save(self):
+        path = os.path.join(self.log_dir, MANIFEST)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "segments": self._segments}, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    def _compress_loop(self):
+        while True:
+            name = self._pending.get()
+            if name is None:
+                return
+            try:
+                self._compress(name)
+            except OSError as e:
+                print(f"Log segment compression error ({name}): {e}")
+
+    def _compress(self, name):
+        path = os.path.join(self.log_dir, name)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as src, gzip.open(path + ".gz.part", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(path + ".gz.part", path + ".gz")
+        with self._lock:
+            entry = next((e for e in self._segments if e["name"] == name), None)
+            if entry is not None:
+                entry.update(name=name + ".gz", compressed=True, stored_bytes=os.path.getsize(path + ".gz"))
+                self._save()
+        # The manifest points at the .gz before the plain file goes, so a reader always finds one of them
+        if entry is None:
+            os.remove(path + ".gz")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _recover(self):
+        """Close segments a crash left open, recounting them from their contents"""
+        recovered = False
+        for entry in self._segments:
+            if entry["closed"]:
+                continue
+            path = os.path.join(self.log_dir, entry["name"])
+            if os.path.exists(path):
+                entry.update(self._scan(path))
+            entry.update(closed=True, stored_bytes=entry["bytes"])
+            recovered = True
+        if recovered:
+            self._save()
+
+    def _scan(self, path):
+        """first/last/records/bytes of a segment file, dropping a torn final line"""
+        first = last = None
+        records = size = 0
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    if opener is open:
+                        with open(path, "r+b") as g:
+                            g.truncate(size)
+                    break
+                try:
+                    ts = json.loads(line)["ts"]
+                except (ValueError, KeyError):
+                    size += len(line)
+                    continue
+                first = ts if first is None else min(first, ts)
+                last = ts if last is None else max(last, ts)
+                records += 1
+                size += len(line)
+        return {"first": first, "last": last, "records": records, "bytes": size}
+
+    def _adopt(self):
+        """Build the first manifest: the one time the directory is listed. Daily text logs from
+        before segments existed are kept for retention; segments without a manifest are rescanned."""
+        entries = []
+        for filename in sorted(os.listdir(self.log_dir)):
+            path = os.path.join(self.log_dir, filename)
+            legacy, segment = LEGACY_PATTERN.match(filename), SEGMENT_PATTERN.match(filename)
+            if legacy:
+                start, end = _day_bounds(legacy.group(1))
+                size = os.path.getsize(path)
+                entries.append({"name": filename, "day": legacy.group(1), "first": start, "last": end,
+                                "records": None, "bytes": size, "stored_bytes": size, "closed": True,
+                                "compressed": False, "format": "text"})
+            elif segment:
+                entry = {"name": filename, "day": segment.group(1), "closed": True,
+                         "compressed": bool(segment.group(3)), "format": "jsonl"}
+                entry.update(self._scan(path))
+                entry["stored_bytes"] = os.path.getsize(path)
+                entries.append(entry)
+        # A segment found both plain and compressed was mid-compression; keep the plain one
+        names = {entry["name"] for entry in entries}
+        entries = [e for e in entries if not (e["compressed"] and e["name"][:-3] in names)]
+        self._segments = entries
+        self._save()
+        return entries
+
+class JsonlSegmentHandler(logging.Handler):
+    """File sink writing each record as a JSON line into rotating segments; ExamShieldLogger events
+    also carry action, details, blocked and session_id"""
+
+    def __init__(self, log_dir, max_bytes=None, compress=None, level=logging.INFO):
+        super().__init__(level)
+        self.segments = LogSegments(log_dir, max_bytes, compress)
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+    def _line(self, record):
+        created = record.created
+        entry = {"ts": round(created, 6),
+                 "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)) + f".{int(record.msecs):03d}",
+                 "level": record.levelname, "message": record.getMessage()}
+        if hasattr(record, "action"):
+            entry.update(action=record.action, details=record.details, blocked=record.blocked,
+                         session_id=getattr(record, "session_id", None))
+        return (self._encode(entry) + "\n").encode("utf-8")
+
+    def emit(self, record):
+        self.handle_batch([record])
+
+    def handle_batch(self, records):
+        items = []
+        for record in records:
+            if record.levelno < self.level or not self.filter(record):
+                continue
+            try:
+                items.append((record.created, self._line(record)))
+            except Exception:
+                self.handleError(record)
+        if not items:
+            return
+        try:
+            self.segments.write(items)
+        except Exception:
+            self.handleError(records[-1])
+
+    def close(self):
+        self.segments.close()
+        super().close()
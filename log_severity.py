@@ -0,0 +1,65 @@
+"""
+Event severity and category for Exam Shield
+Each activity log row stores a severity, a category code and an epoch
+timestamp, computed once when the row is written, so the admin feed,
+exports and rollups filter and sort on indexed integers instead of matching
+strings in every action on every refresh.
+"""
+
+import functools
+
+LOW, MEDIUM, HIGH = 0, 1, 2
+SEVERITY_NAMES = ("LOW", "MED", "HIGH")
+
+# Category codes are positions in this tuple; append only, never reorder
+CATEGORIES = ("system", "keyboard", "mouse", "window", "process", "network", "admin", "exam")
+# First matching fragment of the action name decides the category
+_CATEGORY_RULES = (
+    ("PROCESS", "process"),
+    ("KEY", "keyboard"),
+    ("HOOK", "keyboard"),
+    ("MOUSE", "mouse"),
+    ("WINDOW", "window"),
+    ("INTERNET", "network"),
+    ("NETWORK", "network"),
+    ("ADMIN", "admin"),
+    ("LOGIN", "admin"),
+    ("EXAM", "exam"),
+    ("SESSION", "exam"),
+)
+
+@functools.lru_cache(maxsize=1024)
+def category(action):
+    """Category code of an action name"""
+    name = (action or "").upper()
+    for fragment, label in _CATEGORY_RULES:
+        if fragment in name:
+            return CATEGORIES.index(label)
+    return 0
+
+@functools.lru_cache(maxsize=2048)
+def severity(action, blocked):
+    """HIGH for blocked or suspicious events, MEDIUM for other block-related actions, else LOW"""
+    name = (action or "").upper()
+    if blocked or "SUSPICIOUS" in name:
+        return HIGH
+    if "BLOCKED" in name:
+        return MEDIUM
+    return LOW
+
+def classify(action, blocked):
+    """(severity, category) of an event"""
+    return severity(action, bool(blocked)), category(action)
+
+def category_code(value):
+    """Category code for a name or code"""
+    if isinstance(value, int):
+        return value
+    return CATEGORIES.index(value)
+
+def register(conn):
+    """Make log_severity(action, blocked) and log_category(action) available to SQL on conn, for
+    set-based copies and backfills"""
+    conn.create_function("log_severity", 2, lambda action, blocked: severity(action, bool(blocked)),
+                         deterministic=True)
+    conn.create_function("log_category", 1, category, deterministic=True)
@@ -0,0 +1,325 @@
+"""
+Batched activity log writer for Exam Shield
+Hook callbacks enqueue events without touching SQLite; a background thread
+group-commits them by count or time window. A batch the sink refuses is
+spilled to disk (or put back in the queue when there is no spill file) and
+replayed later rather than dropped.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+OVERFLOW_POLICIES = ("drop_oldest", "block", "spill")
+
+class LogEvent:
+    """One activity_logs row waiting to be written; count > 1 stands for a run of identical
+    events between created and last_seen (see log_coalescer)"""
+    __slots__ = ("action", "details", "blocked", "user_id", "created", "session_id", "count", "last_seen")
+
+    def __init__(self, action, details=None, blocked=False, user_id=None, created=None, session_id=None,
+                 count=1, last_seen=None):
+        self.action = action
+        self.details = details
+        self.blocked = bool(blocked)
+        self.user_id = user_id
+        self.created = created if created is not None else time.time()
+        self.session_id = session_id
+        self.count = count
+        self.last_seen = last_seen
+
+    @property
+    def timestamp(self):
+        """UTC timestamp in the same format as SQLite's CURRENT_TIMESTAMP"""
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.created))
+
+    @property
+    def last_seen_timestamp(self):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.last_seen)) if self.last_seen else None
+
+    def to_record(self):
+        return [self.created, self.action, self.details, self.blocked, self.user_id, self.session_id,
+                self.count, self.last_seen]
+
+    @classmethod
+    def from_record(cls, record):
+        # Spill files from older versions have fewer fields
+        created, action, details, blocked, user_id = record[:5]
+        session_id, count, last_seen = (list(record[5:]) + [None, 1, None][len(record) - 5:])[:3]
+        return cls(action, details, blocked, user_id, created, session_id, count, last_seen)
+
+class CommitNotifier:
+    """Tracks the newest committed log id and wakes subscribers when it advances"""
+
+    def __init__(self, last_id=0):
+        self.last_id = last_id
+        self._cond = threading.Condition()
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """Call callback(last_id) from the writer thread after each commit; keep it cheap"""
+        with self._cond:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._cond:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, last_id):
+        with self._cond:
+            if last_id <= self.last_id:
+                return
+            self.last_id = last_id
+            subscribers = list(self._subscribers)
+            self._cond.notify_all()
+        for callback in subscribers:
+            try:
+                callback(last_id)
+            except Exception as e:
+                print(f"Log subscriber error: {e}")
+
+    def wait(self, after_id, timeout=None):
+        """Block until a log newer than after_id is committed; returns the newest id"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.last_id > after_id, timeout)
+            return self.last_id
+
+class BatchLogWriter:
+    def __init__(self, sink, batch_size=200, interval=0.25, max_queue=10000,
+                 overflow="drop_oldest", spill_path=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        if overflow == "spill" and not spill_path:
+            raise ValueError("Spill overflow policy requires a spill_path")
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.spill_path = spill_path
+
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._flush_requested = False
+        self._running = True
+        self._overflow = []       # events waiting to be appended to the spill file
+        self._spilling = False
+        self._spill_lock = threading.Lock()  # the spill and replay files; taken before _cond, never inside it
+        self._replay_failures = 0
+        self._has_spill = bool(spill_path and (os.path.exists(spill_path) or os.path.exists(spill_path + ".replay")))
+        self._thread = threading.Thread(target=self._run, name="BatchLogWriter", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, event):
+        """Queue an event for the next batch; only blocks under the 'block' policy"""
+        with self._cond:
+            if not self._running:
+                return False
+            if len(self._queue) >= self.max_queue:
+                if self.overflow == "drop_oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.overflow == "spill":
+                    # The caller that finds no spill under way writes the file, outside the lock; the others
+                    # only add to the list
+                    self._overflow.append(event)
+                    if self._spilling:
+                        return True
+                    self._spilling = True
+                    event = None
+                else:
+                    while self._running and len(self._queue) >= self.max_queue:
+                        self._cond.wait()
+            if event is not None:
+                self._queue.append(event)
+                if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                    self._cond.notify_all()
+                return True
+        self._drain_overflow()
+        return True
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far (including spilled events) is committed"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            try:
+                while self._queue or self._in_flight or self._has_spill or self._spilling:
+                    if not self._thread.is_alive():
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                return not (self._queue or self._in_flight or self._has_spill or self._spilling)
+            finally:
+                self._flush_requested = False
+
+    def stop(self, timeout=5.0):
+        """Flush pending events and stop the writer thread"""
+        self.flush(timeout)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue) + self._in_flight
+
+    def stats(self):
+        return {"pending": self.pending(), "written": self.written, "dropped": self.dropped,
+                "spilled": self.spilled, "failed": self.failed}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue and not (self._has_spill and self._flush_requested):
+                    self._cond.wait()
+                if not self._running and not self._queue:
+                    return
+                deadline = time.monotonic() + self.interval
+                while self._running and not self._flush_requested and len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                count = min(len(self._queue), self.batch_size)
+                batch = [self._queue.popleft() for _ in range(count)]
+                self._in_flight = count
+                self._cond.notify_all()
+
+            committed = self._commit(batch) if batch else True
+            if not committed:
+                self._keep(batch)
+            elif self._has_spill and len(self._queue) < self.max_queue // 2:
+                self._replay_spill()
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _commit(self, batch):
+        """Hand batch to the sink; False if it raised (counted in failed)"""
+        try:
+            self.sink(batch)
+            self.written += len(batch)
+            return True
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Activity logging error: {e}")
+            return False
+
+    def _keep(self, batch):
+        """A batch the sink refused: spilled for a later replay, or put back at the front of the queue"""
+        if self.spill_path:
+            self._spill(batch)
+        else:
+            with self._cond:
+                self._queue.extendleft(reversed(batch))
+        # Whatever failed (a locked or full disk, say) gets a moment before the next attempt
+        time.sleep(self.interval)
+
+    def _drain_overflow(self):
+        """Append overflowed events to the spill file until none are left; called without _cond held"""
+        while True:
+            with self._cond:
+                events, self._overflow = self._overflow, []
+                if not events:
+                    self._spilling = False
+                    self._cond.notify_all()
+                    return
+            self._spill(events)
+
+    def _spill(self, events):
+        """Append events to the on-disk spill file; called without _cond held"""
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for event in events:
+                        f.write(json.dumps(event.to_record()) + "\n")
+        except OSError as e:
+            with self._cond:
+                self.dropped += len(events)
+            print(f"Activity log spill error: {e}")
+            return
+        with self._cond:
+            self.spilled += len(events)
+            self._has_spill = True
+            self._cond.notify_all()
+
+    def _replay_spill(self):
+        """Feed spilled events back through the sink once the queue has drained. The offset reached is
+        saved after each committed batch, so a failed replay resumes there instead of writing rows
+        twice; the replay file is removed only once all of it is committed."""
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            if not os.path.exists(replay_path) and os.path.exists(self.spill_path):
+                try:
+                    os.replace(self.spill_path, replay_path)
+                except OSError as e:
+                    print(f"Activity log replay error: {e}")
+        replayed = True
+        if os.path.exists(replay_path):
+            try:
+                replayed = self._replay_file(replay_path, replay_path + ".offset")
+            except OSError as e:
+                print(f"Activity log replay error: {e}")
+                replayed = False
+        with self._cond:
+            self._has_spill = os.path.exists(self.spill_path) or os.path.exists(replay_path)
+            self._cond.notify_all()
+        if not replayed:
+            time.sleep(self.interval)
+
+    def _replay_file(self, replay_path, offset_path):
+        try:
+            with open(offset_path, encoding="utf-8") as f:
+                offset = int(f.read())
+        except (OSError, ValueError):
+            offset = 0
+        with open(replay_path, "rb") as f:
+            f.seek(offset)
+            end, batch = offset, []
+            while True:
+                line = f.readline()
+                end += len(line)
+                if line:
+                    try:
+                        batch.append(LogEvent.from_record(json.loads(line)))
+                    except (ValueError, TypeError):
+                        pass
+                if batch and (len(batch) >= self.batch_size or not line):
+                    if not self._commit(batch):
+                        self._replay_failures += 1
+                        if self._replay_failures < 3:
+                            return False
+                        # Refused three times running: rows like these would hold up the rest for good
+                        self.dropped += len(batch)
+                        print(f"Dropping {len(batch)} spilled activity logs the database keeps refusing")
+                    self._replay_failures = 0
+                    batch = []
+                    self._save_offset(offset_path, end)
+                if not line:
+                    break
+        os.remove(replay_path)
+        if os.path.exists(offset_path):
+            os.remove(offset_path)
+        return True
+
+    @staticmethod
+    def _save_offset(offset_path, offset):
+        with open(offset_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(str(offset))
+        os.replace(offset_path + ".tmp", offset_path)
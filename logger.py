@@ -1,66 +1,210 @@
 """
 Enhanced logging system for Exam Shield
+Callers only build a LogRecord and put it on a queue (QueueHandler); one
+QueueListener thread drains the queue in batches and hands each batch to the
+sinks: the daily log file is written and flushed once per batch and
+structured events are committed to the database in one transaction. The file
+sink writes JSON Lines segments that rotate by size and day (see log_segments).
+The pipeline is attached to the "ExamShield" logger once per process, however many
+ExamShieldLogger objects are created.
 """
 
 import logging
+import logging.handlers
 import os
-from datetime import datetime, timedelta
+import queue
+import threading
+import time
 from config import Config
+from log_segments import JsonlSegmentHandler
+from log_writer import LogEvent
+
+LOGGER_NAME = "ExamShield"
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_setup_lock = threading.Lock()
+_pipeline = None
+
+class _FlushMarker:
+    """Queued by flush(); the listener sets `done` once every record before it is handled"""
+    def __init__(self):
+        self.done = threading.Event()
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+
+    The stock prepare() formats every record in the caller's thread; our messages only
+    carry plain strings and numbers, so the record can travel as it is.
+    """
+
+    def prepare(self, record):
+        return record
+
+class DatabaseLogHandler(logging.Handler):
+    """Commits records carrying an `action` (see ExamShieldLogger) as activity logs, a batch
+    per transaction"""
 
-class ExamShieldLogger:
     def __init__(self, db_manager):
+        super().__init__(logging.INFO)
         self.db_manager = db_manager
-        self.setup_file_logging()
 
-    def setup_file_logging(self):
-        """Setup file-based logging"""
-        logs_dir = os.path.join(os.path.dirname(__file__), "logs")
-        if not os.path.exists(logs_dir):
-            os.makedirs(logs_dir)
-        self.logger = logging.getLogger("ExamShield")
-        self.logger.setLevel(logging.INFO)
-
-        log_filename = os.path.join(logs_dir, f"exam_shield_{datetime.now().strftime('%Y%m%d')}.log")
-        file_handler = logging.FileHandler(log_filename)
-        file_handler.setLevel(logging.INFO)
+    def emit(self, record):
+        self.handle_batch([record])
+
+    def handle_batch(self, records):
+        events = [LogEvent(record.action, record.details, record.blocked, None, record.created,
+                           getattr(record, "session_id", None))
+                  for record in records if hasattr(record, "action")]
+        if not events:
+            return
+        try:
+            self.db_manager.write_events(events)
+        except Exception as e:
+            print(f"Activity logging error: {e}")
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """QueueListener that takes up to batch_size records at a time, waiting at most `interval`
+    for a batch to fill, and passes handlers with handle_batch() the whole batch"""
+
+    def __init__(self, log_queue, *handlers, batch_size=None, interval=None):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size or Config.LOG_BATCH_SIZE
+        self.interval = Config.LOG_BATCH_INTERVAL if interval is None else interval
+        self.batches = 0
+        self.records = 0
+
+    def _monitor(self):
+        q = self.queue
+        while True:
+            batch, markers, stop = [], [], False
+            item = q.get()
+            deadline = time.monotonic() + self.interval
+            while True:
+                if item is self._sentinel:
+                    stop = True
+                elif isinstance(item, _FlushMarker):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                # A flush or stop request ends the wait for a fuller batch
+                if stop or markers or len(batch) >= self.batch_size:
+                    break
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = q.get(timeout=remaining) if remaining > 0 else q.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._dispatch(batch)
+            for marker in markers:
+                marker.done.set()
+            if stop:
+                return
+
+    def _dispatch(self, batch):
+        self.batches += 1
+        self.records += len(batch)
+        for handler in self.handlers:
+            if hasattr(handler, "handle_batch"):
+                handler.handle_batch(batch)
+                continue
+            for record in batch:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+def _setup_pipeline(db_manager, log_dir):
+    """Attach the queue pipeline to the ExamShield logger, or reuse the one already attached"""
+    global _pipeline
+    with _setup_lock:
+        if _pipeline is not None:
+            _pipeline["database"].db_manager = db_manager
+            return _pipeline
+        os.makedirs(log_dir, exist_ok=True)
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(logging.INFO)
+        formatter = logging.Formatter(FORMAT)
+        file_handler = JsonlSegmentHandler(log_dir)
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.WARNING)
+        console_handler.setFormatter(formatter)
+        database_handler = DatabaseLogHandler(db_manager)
 
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        log_queue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        listener = BatchQueueListener(log_queue, database_handler, file_handler, console_handler)
+        # Handlers added by earlier, unqueued setups would write every line a second time
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        logger.addHandler(queue_handler)
+        listener.start()
+        _pipeline = {"logger": logger, "queue": log_queue, "listener": listener, "database": database_handler,
+                     "file": file_handler, "console": console_handler}
+        return _pipeline
 
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
+def shutdown_logging():
+    """Drain the queue, stop the listener thread and detach the pipeline"""
+    global _pipeline
+    with _setup_lock:
+        if _pipeline is None:
+            return
+        _pipeline["listener"].stop()
+        for handler in list(_pipeline["logger"].handlers):
+            _pipeline["logger"].removeHandler(handler)
+        _pipeline["file"].close()
+        _pipeline = None
 
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+class ExamShieldLogger:
+    def __init__(self, db_manager, log_dir=None):
+        self.db_manager = db_manager
+        self.log_dir = log_dir or Config.LOGS_DIR
+        self.setup_file_logging()
+
+    def setup_file_logging(self):
+        """Attach the queued file/database pipeline; safe to call any number of times"""
+        pipeline = _setup_pipeline(self.db_manager, self.log_dir)
+        self.logger = pipeline["logger"]
+        self._queue = pipeline["queue"]
+        self.listener = pipeline["listener"]
+        self.segments = pipeline["file"].segments
+
+    def _event(self, level, action, details, blocked, message, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        # makeRecord() + handle() skips Logger.log()'s stack walk for the caller's file and line
+        record = self.logger.makeRecord(self.logger.name, level, "(exam_shield)", 0, message, args, None,
+                                        extra={"action": action, "details": details, "blocked": bool(blocked),
+                                               "session_id": self.db_manager.active_session_id})
+        self.logger.handle(record)
 
     def log_security_event(self, event_type, details, blocked=False):
         """Log security-related events"""
-        self.db_manager.log_activity(event_type, details, blocked)
-        level = logging.WARNING if blocked else logging.INFO
-        self.logger.log(level, f"SECURITY: {event_type} - {details} ({'BLOCKED' if blocked else 'ALLOWED'})")
+        self._event(logging.WARNING if blocked else logging.INFO, event_type, details, blocked,
+                    "SECURITY: %s - %s (%s)", event_type, details, 'BLOCKED' if blocked else 'ALLOWED')
 
     def log_system_event(self, event_type, details):
-        self.db_manager.log_activity(f"SYSTEM_{event_type}", details)
-        self.logger.info(f"SYSTEM: {event_type} - {details}")
+        self._event(logging.INFO, f"SYSTEM_{event_type}", details, False, "SYSTEM: %s - %s", event_type, details)
 
     def log_admin_action(self, action, details):
-        self.db_manager.log_activity(f"ADMIN_{action}", details)
-        self.logger.info(f"ADMIN: {action} - {details}")
+        self._event(logging.INFO, f"ADMIN_{action}", details, False, "ADMIN: %s - %s", action, details)
+
+    def flush(self, timeout=5.0):
+        """Block until every event logged so far has reached the file and the database"""
+        marker = _FlushMarker()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self):
+        shutdown_logging()
+
+    def read_logs(self, since=None, until=None):
+        """File log records between since and until (datetimes or epoch seconds)"""
+        self.flush()
+        return self.segments.read(since, until)
 
     def cleanup_old_logs(self):
-        logs_dir = os.path.join(os.path.dirname(__file__), "logs")
-        if not os.path.exists(logs_dir):
-            return
-        cutoff_date = datetime.now() - timedelta(days=Config.LOG_RETENTION_DAYS)
-
-        for filename in os.listdir(logs_dir):
-            if filename.startswith("exam_shield_") and filename.endswith(".log"):
-                file_path = os.path.join(logs_dir, filename)
-                file_date = datetime.fromtimestamp(os.path.getctime(file_path))
-                if file_date < cutoff_date:
-                    try:
-                        os.remove(file_path)
-                        self.logger.info(f"Cleaned up old log file: {filename}")
-                    except OSError as e:
-                        self.logger.error(f"Error cleaning up log file {filename}: {e}")
+        """Delete log segments older than Config.LOG_RETENTION_DAYS, as listed in the manifest"""
+        removed = self.segments.prune(time.time() - Config.LOG_RETENTION_DAYS * 86400)
+        for name in removed:
+            self.logger.info(f"Cleaned up old log file: {name}")
+        return removed
@@ -46,6 +46,8 @@ class ExamShield:
         self.root.configure(bg=self.colors['surface'])
         
         self.db_manager = DatabaseManager()
+        self.db_manager.start_backups()
+        self.db_manager.start_maintenance()
         self.security_manager = None
         self.system_tray = None
         
@@ -400,6 +402,7 @@ class ExamShield:
             try:
                 self.db_manager.log_activity("APPLICATION_EXIT", 
                                            "Exam Shield Premium closed by administrator")
+                self.db_manager.close()
             except:
                 pass
             self.root.quit()
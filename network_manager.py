@@ -11,11 +11,26 @@ import socket
 import threading
 import time     
 from datetime import datetime
-from config import Config
 
 class NetworkManager:
+    # FIXED: Add comprehensive blocking including Google and YouTube
+    DEFAULT_BLOCKED_SITES = [
+        'google.com', 'www.google.com', 'google.co.in', 'www.google.co.in',
+        'youtube.com', 'www.youtube.com', 'youtu.be', 'm.youtube.com',
+        'facebook.com', 'www.facebook.com', 'fb.com', 'm.facebook.com',
+        'twitter.com', 'www.twitter.com', 'x.com', 'www.x.com',
+        'instagram.com', 'www.instagram.com',
+        'tiktok.com', 'www.tiktok.com',
+        'reddit.com', 'www.reddit.com',
+        'discord.com', 'www.discord.com',
+        'whatsapp.com', 'web.whatsapp.com',
+        'telegram.org', 'web.telegram.org'
+    ]
+
     def __init__(self, db_manager):
         self.db_manager = db_manager
+        self.blocked_sites = db_manager.get_setting('blocked_websites', self.DEFAULT_BLOCKED_SITES.copy())
+        db_manager.subscribe_setting(self._on_blocked_sites_changed, 'blocked_websites')
         self.is_blocked = False
         self.hosts_backup = None
         self.original_hosts_content = None  # FIXED: Store original content
@@ -127,20 +142,7 @@ class NetworkManager:
         """Enhanced hosts file modification"""
         try:
             blocked_entries = []
-            
-            # FIXED: Add comprehensive blocking including Google and YouTube
-            comprehensive_blocked_sites = [
-                'google.com', 'www.google.com', 'google.co.in', 'www.google.co.in',
-                'youtube.com', 'www.youtube.com', 'youtu.be', 'm.youtube.com',
-                'facebook.com', 'www.facebook.com', 'fb.com', 'm.facebook.com',
-                'twitter.com', 'www.twitter.com', 'x.com', 'www.x.com',
-                'instagram.com', 'www.instagram.com',
-                'tiktok.com', 'www.tiktok.com',
-                'reddit.com', 'www.reddit.com',
-                'discord.com', 'www.discord.com',
-                'whatsapp.com', 'web.whatsapp.com',
-                'telegram.org', 'web.telegram.org'
-            ]
+            comprehensive_blocked_sites = list(self.blocked_sites)
             
             # Add blocked entries
             for site in comprehensive_blocked_sites:
@@ -241,10 +243,17 @@ class NetworkManager:
         except Exception as e:
             print(f"Error verifying hosts blocking: {e}")
 
+    def _on_blocked_sites_changed(self, key, value):
+        """Settings listener: rewrite the hosts section straight away while blocking is active"""
+        self.blocked_sites = value if value is not None else self.DEFAULT_BLOCKED_SITES.copy()
+        if self.is_blocked:
+            self._modify_hosts_file()
+            self._flush_dns_cache()
+
     def is_internet_blocked(self):
         """Check if internet is currently blocked"""
         return self.is_blocked
 
     def get_blocked_websites(self):
         """Get list of currently blocked websites"""
-        return Config.BLOCKED_WEBSITES
+        return list(self.blocked_sites)
@@ -0,0 +1,165 @@
+"""
+Default-deny process allowlist for Exam Shield
+With the process_mode setting at "allowlist", only what was running when
+exam mode started (the baseline snapshot) and what the process_allowlist
+setting lists may run; the monitor reports every other new process, and
+the blocklist (process_rules, suspicious_processes) still applies on top.
+process_allowlist entries are {"type": "path" | "hash" | "name", "value": ...}:
+
+    path   this executable file as it is now: the path and its SHA-256
+    hash   an executable with this SHA-256, wherever it is
+    name   a process whose executable cannot be read (another user's, or a
+           protected system process), by name
+
+Every identity is hashed once into a 16-byte key, so deciding a process
+costs a set lookup or two: an executable path that is not on the list is
+refused without reading the file, and a listed one is re-hashed only when
+its size or mtime changed (see ExecutableHashes). The executable path is
+read from a new process only when some identity is keyed on it. Processes
+with no executable image (kernel threads) are always allowed, as are
+programs Exam Shield starts itself. A new process is refused as soon as the
+monitor sees it: at exec with the netlink backend, at the next scan with the
+polled ones, which allowlist mode runs every
+Config.PROCESS_ALLOWLIST_SCAN_INTERVAL.
+
+The interpreter Exam Shield runs in is part of the baseline, so scripts
+run in it are stopped by command-line rules, not by the allowlist.
+"""
+
+import hashlib
+import os
+import time
+import psutil
+from process_rules import Rule, executable_hashes
+
+ENTRY_TYPES = ("path", "hash", "name")
+
+def identity(kind, value):
+    """Fixed-size key for one allowlisted identity"""
+    return hashlib.blake2b(f"{kind}\0{value}".encode("utf-8", "surrogateescape"), digest_size=16).digest()
+
+# In a baseline that holds path identities, so decisions need each new process's executable
+_EXE_KEYED = identity("baseline", "exe")
+
+def _path(exe):
+    # Compared like process_rules paths: case-insensitive, / and \ alike
+    return exe.replace("\\", "/").lower()
+
+class ProcessAllowlist:
+    def __init__(self, baseline=(), entries=(), blocked=None, hashes=None):
+        """baseline: identity keys from snapshot(); entries: the process_allowlist setting (invalid ones are
+        reported and skipped); blocked: ProcessRules that are refused even when allowlisted"""
+        self.hashes = executable_hashes if hashes is None else hashes
+        self.baseline = frozenset(baseline)
+        self.entries = list(entries or ())
+        self.blocked = blocked
+        self._hash_entries = False
+        self._path_entries = False
+        configured = set()
+        for entry in self.entries:
+            key = self._entry(entry)
+            if key is not None:
+                configured.update(key)
+        self._identities = self.baseline | configured
+        self._shield = os.getpid()
+        # What the monitor has to read from each new process, beyond its name: the executable only when some
+        # identity is keyed on it (without any, every process is decided by name)
+        self.needs_exe = bool(self._path_entries or self._hash_entries or _EXE_KEYED in self.baseline
+                              or (blocked is not None and blocked.needs_exe))
+        self.needs_cmdline = bool(blocked is not None and blocked.needs_cmdline)
+
+    def __len__(self):
+        return len(self._identities)
+
+    def _entry(self, entry):
+        if isinstance(entry, dict):
+            entry = Rule(entry.get("type"), entry.get("value"), entry.get("label"))
+        if entry.type not in ENTRY_TYPES or not isinstance(entry.value, str) or not entry.value:
+            print(f"Skipping invalid allowlist entry: {entry}")
+            return None
+        if entry.type == "name":
+            return [identity("name", entry.value.lower())]
+        if entry.type == "hash":
+            if len(entry.value) != 64 or any(c not in "0123456789abcdefABCDEF" for c in entry.value):
+                print(f"Skipping allowlist entry with a malformed SHA-256: {entry.value}")
+                return None
+            self._hash_entries = True
+            return [identity("hash", entry.value.lower())]
+        digest = self.hashes.get(entry.value)
+        if digest is None:
+            print(f"Skipping allowlist entry {entry.value!r}: the file cannot be read")
+            return None
+        self._path_entries = True
+        return [identity("path", _path(entry.value)), identity("exe", f"{_path(entry.value)}\0{digest}")]
+
+    @classmethod
+    def snapshot(cls, backend, hashes=None):
+        """Identity keys of every process running now, read through a process_backends backend"""
+        hashes = executable_hashes if hashes is None else hashes
+        keys = set()
+        for pid in backend.pids():
+            try:
+                name, exe, _ = backend.describe(pid, True, False)
+            except psutil.Error:
+                continue
+            if exe is None:
+                keys.add(identity("name", (name or "").lower()))
+            elif exe:
+                # An executable that cannot be read now (deleted by an upgrade, say) is keyed without a digest
+                keys.add(_EXE_KEYED)
+                keys.add(identity("path", _path(exe)))
+                keys.add(identity("exe", f"{_path(exe)}\0{hashes.get(exe) or ''}"))
+        return keys
+
+    @classmethod
+    def from_baseline(cls, backend, entries=(), blocked=None, hashes=None, logger=None):
+        start = time.perf_counter()
+        allowlist = cls(cls.snapshot(backend, hashes), entries, blocked, hashes)
+        details = (f"{len(allowlist.baseline)} identities from running processes, {len(allowlist.entries)} "
+                   f"configured entries, {(time.perf_counter() - start) * 1000:.0f} ms")
+        print(f"📋 Process allowlist baseline: {details}")
+        if logger:
+            try:
+                logger.log_activity("PROCESS_ALLOWLIST_BASELINE", details)
+            except Exception as e:
+                print(f"Process allowlist log error: {e}")
+        return allowlist
+
+    def with_blocked(self, blocked):
+        """The same allowlist with new blocklist rules"""
+        return ProcessAllowlist(self.baseline, self.entries, blocked, self.hashes)
+
+    def with_entries(self, entries):
+        """The same baseline with a new process_allowlist setting"""
+        return ProcessAllowlist(self.baseline, entries, self.blocked, self.hashes)
+
+    def allows(self, name, exe):
+        if exe == "":
+            return True
+        ids = self._identities
+        if exe is None:
+            return identity("name", (name or "").lower()) in ids
+        path = _path(exe)
+        if identity("path", path) not in ids and not self._hash_entries:
+            return False
+        digest = self.hashes.get(exe)
+        return (identity("exe", f"{path}\0{digest or ''}") in ids
+                or (digest is not None and identity("hash", digest) in ids))
+
+    def match(self, name, exe=None, cmdline=None):
+        """The rule a process breaks, as ProcessRules.match: a blocklist rule, or an "allowlist" rule when
+        it is not allowlisted; None if it may run"""
+        if self.blocked is not None:
+            rule = self.blocked.match(name, exe, cmdline)
+            if rule is not None:
+                return rule
+        if self.allows(name, exe):
+            return None
+        return Rule("allowlist", exe or name, "not on the allowlist")
+
+    def started_by_shield(self, process):
+        """Whether Exam Shield started process (netsh, ipconfig and the like), directly or through sudo"""
+        try:
+            return any(parent.pid == self._shield for parent in process.parents())
+        except psutil.Error:
+            return False
@@ -0,0 +1,252 @@
+"""
+Process event backends for Exam Shield
+ProcessMonitor asks a backend which PIDs to look at and what they are; the
+rules, retries and termination stay in the monitor, so every backend feeds
+the same rule engine and kill path.
+
+    psutil   portable PID-table diff (Windows and anywhere else psutil runs)
+    procfs   Linux PID-table diff reading /proc directly: one getdents pass
+             per scan, and open/read/close of stat (plus cmdline and a
+             readlink of exe when rules need them) per new process
+
+Both diffs compare the raw listing with the previous one first, so a scan
+of an unchanged table builds no sets; that keeps the short allowlist-mode
+interval (Config.PROCESS_ALLOWLIST_SCAN_INTERVAL) cheap.
+    netlink  Linux proc connector: the kernel pushes exec and comm-change
+             events, so a new program is seen within microseconds of exec
+             instead of at the next scan; needs root (CAP_NET_ADMIN)
+
+A backend has pids() (every running PID, and the new baseline for a diff),
+changes(timeout) (PIDs started or changed since the last call, waiting up to
+timeout for event-driven backends), describe(pid, exe, cmdline) returning
+(name, exe, cmdline) or raising psutil.NoSuchProcess / AccessDenied, and
+close(). exe is "" for a process without an executable image (a kernel
+thread) and None where it cannot be read.
+"""
+
+import errno
+import os
+import select
+import socket
+import struct
+import sys
+import psutil
+from config import Config
+
+BACKENDS = ("auto", "psutil", "procfs", "netlink")
+
+class PsutilBackend:
+    name = "psutil"
+    event_driven = False
+
+    def __init__(self):
+        self._known = frozenset()
+        self._listing = None
+
+    def pids(self):
+        self._listing = psutil.pids()
+        self._known = frozenset(self._listing)
+        return self._known
+
+    def changes(self, timeout=0):
+        listing = psutil.pids()
+        if listing == self._listing:
+            return frozenset()   # nothing started or exited: no sets to build
+        self._listing = listing
+        current = frozenset(listing)
+        new = current - self._known
+        self._known = current
+        return new
+
+    def describe(self, pid, exe=False, cmdline=False):
+        process = psutil.Process(pid)
+        with process.oneshot():
+            return (process.name(), _attribute(process.exe) if exe else None,
+                    _attribute(process.cmdline) if cmdline else None)
+
+    def close(self):
+        pass
+
+def _attribute(read):
+    """A psutil attribute, or None where it is denied (another user's executable path, say) or unreadable"""
+    try:
+        return read()
+    except (psutil.AccessDenied, psutil.ZombieProcess, OSError):
+        return None
+
+class ProcfsBackend:
+    name = "procfs"
+    event_driven = False
+
+    def __init__(self, procfs=None):
+        self.procfs = procfs or psutil.PROCFS_PATH
+        self._known = frozenset()
+        self._listing = None
+
+    def pids(self):
+        self._listing = os.listdir(self.procfs)
+        self._known = frozenset(map(int, filter(str.isdigit, self._listing)))
+        return self._known
+
+    def changes(self, timeout=0):
+        listing = os.listdir(self.procfs)
+        if listing == self._listing:
+            return frozenset()   # nothing started or exited: no sets to build
+        self._listing = listing
+        current = frozenset(map(int, filter(str.isdigit, listing)))
+        new = current - self._known
+        self._known = current
+        return new
+
+    def _read(self, pid, leaf, size):
+        try:
+            fd = os.open(f"{self.procfs}/{pid}/{leaf}", os.O_RDONLY)
+        except (FileNotFoundError, ProcessLookupError):
+            raise psutil.NoSuchProcess(pid) from None
+        except PermissionError:
+            raise psutil.AccessDenied(pid) from None
+        try:
+            data = os.read(fd, size)
+            if leaf == "cmdline":
+                # cmdline is served a page at a time; stat always fits the first read
+                while True:
+                    chunk = os.read(fd, size)
+                    if not chunk:
+                        break
+                    data += chunk
+            return data
+        except ProcessLookupError:
+            raise psutil.NoSuchProcess(pid) from None
+        finally:
+            os.close(fd)
+
+    def _cmdline(self, pid):
+        try:
+            data = self._read(pid, "cmdline", 65536)
+        except psutil.AccessDenied:
+            return None
+        return [arg.decode("utf-8", "surrogateescape") for arg in data.rstrip(b"\0").split(b"\0")] if data else []
+
+    def describe(self, pid, exe=False, cmdline=False):
+        stat = self._read(pid, "stat", 4096)
+        name = stat[stat.find(b"(") + 1:stat.rfind(b")")].decode("utf-8", "surrogateescape")
+        args = self._cmdline(pid) if cmdline or len(name) >= 15 else None
+        if len(name) >= 15 and args:
+            # comm is cut to 15 characters; psutil recovers the full name the same way
+            full = os.path.basename(args[0])
+            if full.startswith(name):
+                name = full
+        path = None
+        if exe:
+            try:
+                path = os.readlink(f"{self.procfs}/{pid}/exe")
+            except FileNotFoundError:
+                path = ""   # no executable image: a kernel thread (or a zombie), as psutil reports it
+            except OSError:
+                path = None
+        return name, path, args if cmdline else None
+
+    def close(self):
+        pass
+
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = CN_VAL_PROC = 1
+PROC_CN_MCAST_LISTEN, PROC_CN_MCAST_IGNORE = 1, 2
+PROC_EVENT_EXEC, PROC_EVENT_COMM = 0x00000002, 0x00000200
+NLMSG_HEADER = struct.Struct("=IHHII")
+CN_MSG_HEADER = struct.Struct("=IIIIHH")
+PROC_EVENT_HEADER = struct.Struct("=IIQ")
+PROC_EVENT_IDS = struct.Struct("=II")   # process_pid, process_tgid (exec and comm events)
+NLMSG_DONE = 3
+
+class NetlinkBackend(ProcfsBackend):
+    """Exec and comm events from the kernel; process details are read from /proc like ProcfsBackend"""
+    name = "netlink"
+    event_driven = True
+
+    def __init__(self, procfs=None):
+        super().__init__(procfs)
+        self.events = 0
+        self.overflows = 0
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+        try:
+            self._sock.bind((0, CN_IDX_PROC))
+            self._control(PROC_CN_MCAST_LISTEN)
+            self._sock.setblocking(False)
+        except OSError:
+            self._sock.close()
+            raise
+
+    def _control(self, op):
+        payload = struct.pack("=I", op)
+        header = CN_MSG_HEADER.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(payload), 0)
+        body = header + payload
+        self._sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body), NLMSG_DONE, 0, 0, 0) + body)
+
+    def pids(self):
+        # Events already queued are covered by the listing; dropping them avoids reporting those PIDs twice
+        while True:
+            try:
+                self._sock.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+        return super().pids()
+
+    def changes(self, timeout=0):
+        if not select.select([self._sock], [], [], timeout)[0]:
+            return ()
+        changed = set()
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # The kernel dropped events while we were busy; rescan to be sure nothing slipped by
+                self.overflows += 1
+                return self.pids()
+            self._parse(data, changed)
+        return changed
+
+    def _parse(self, data, changed):
+        offset = 0
+        while offset + NLMSG_HEADER.size <= len(data):
+            length = NLMSG_HEADER.unpack_from(data, offset)[0]
+            event = offset + NLMSG_HEADER.size + CN_MSG_HEADER.size
+            if length < NLMSG_HEADER.size or event + PROC_EVENT_HEADER.size + PROC_EVENT_IDS.size > len(data):
+                break
+            what = PROC_EVENT_HEADER.unpack_from(data, event)[0]
+            if what in (PROC_EVENT_EXEC, PROC_EVENT_COMM):
+                self.events += 1
+                changed.add(PROC_EVENT_IDS.unpack_from(data, event + PROC_EVENT_HEADER.size)[1])
+            offset += (length + 3) & ~3
+
+    def close(self):
+        if self._sock.fileno() >= 0:
+            try:
+                self._control(PROC_CN_MCAST_IGNORE)
+            except OSError:
+                pass
+            self._sock.close()
+
+def create_backend(name=None):
+    """Backend by name; "auto" picks netlink where it is allowed, then procfs, on Linux and psutil elsewhere"""
+    name = name or Config.PROCESS_MONITOR_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown process monitor backend: {name}")
+    linux = sys.platform.startswith("linux")
+    if name == "netlink" or (name == "auto" and linux):
+        try:
+            return NetlinkBackend()
+        except OSError as e:
+            if name == "netlink":
+                raise
+            print(f"Process events unavailable ({e}); scanning /proc instead")
+    if name == "procfs" or (name == "auto" and linux):
+        return ProcfsBackend()
+    return PsutilBackend()
@@ -0,0 +1,136 @@
+"""
+Incremental process monitor for Exam Shield
+Only processes that are new since the last scan are looked at: a backend
+(see process_backends) either diffs the PID table or, on Linux, is told by
+the kernel about each exec. New processes are checked against compiled
+ProcessRules, reading the executable path and command line only when some
+rule needs them. A scan of an unchanged process table therefore costs one
+PID listing, which is what makes a sub-200 ms interval cheaper than the old
+two-second full process_iter walk.
+
+With the table-diff backends a PID that exits and is reused between two
+scans looks unchanged and is not inspected; with a short interval that
+window is small, and the netlink backend does not have it. On Linux the
+same goes for a PID first seen between fork and exec, which is inspected
+as its parent's program; Windows creates processes with their image.
+"""
+
+import threading
+import time
+import psutil
+from config import Config
+from process_backends import create_backend
+
+class ProcessMonitor:
+    def __init__(self, rules, on_match, interval=None, retry_interval=None, backend=None, banned=None):
+        """on_match(process, name, rule) is called once for each new process matching rules (a
+        ProcessRules) or whose executable is in banned (a BannedExecutables); a falsy return (e.g. the
+        process could not be terminated) makes it be reported again after retry_interval. A stopped
+        monitor closes its backend and is not restarted."""
+        self.on_match = on_match
+        self.interval = Config.PROCESS_SCAN_INTERVAL if interval is None else interval
+        self.retry_interval = Config.PROCESS_RETRY_INTERVAL if retry_interval is None else retry_interval
+        self.backend = backend or create_backend()
+        self.banned = banned
+        self.scans = 0
+        self.inspected = 0
+        self.matched = 0
+        self.vanished = 0
+        self.denied = 0
+        self._rules = rules
+        self._rescan = True   # the first scan looks at everything already running
+        self._retry = {}      # pid -> monotonic time it is next reported
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def rules(self):
+        return self._rules
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_rules(self, rules):
+        """Swap in newly compiled rules; the next scan re-inspects every running process against them"""
+        with self._lock:
+            self._rules = rules
+            self._rescan = True
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ProcessMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=3.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.backend.close()
+
+    def scan(self, timeout=0):
+        """Inspect what the backend reports as new (waiting up to timeout for an event-driven one) plus
+        retries that are due; returns the number of processes inspected"""
+        with self._lock:
+            rules = self._rules
+            rescan, self._rescan = self._rescan, False
+        pids = self.backend.pids() if rescan else self.backend.changes(timeout)
+        now = time.monotonic()
+        due = [pid for pid, when in self._retry.items() if when <= now and pid not in pids] if self._retry else ()
+        for pid in pids:
+            self._inspect(pid, rules, now)
+        for pid in due:
+            self._inspect(pid, rules, now)
+        self.scans += 1
+        self.inspected += len(pids) + len(due)
+        return len(pids) + len(due)
+
+    def stats(self):
+        return {"backend": self.backend.name, "scans": self.scans, "inspected": self.inspected,
+                "matched": self.matched, "vanished": self.vanished, "denied": self.denied,
+                "retrying": len(self._retry)}
+
+    def _inspect(self, pid, rules, now):
+        self._retry.pop(pid, None)
+        try:
+            banned = self.banned if self.banned else None
+            name, exe, cmdline = self.backend.describe(pid, rules.needs_exe or banned is not None,
+                                                       rules.needs_cmdline)
+            rule = rules.match(name, exe, cmdline)
+            if rule is None and banned is not None:
+                rule = banned.match(exe)
+            if rule is None:
+                return
+            process = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            self.vanished += 1
+            return
+        except psutil.AccessDenied:
+            self.denied += 1
+            return
+        self.matched += 1
+        try:
+            handled = self.on_match(process, name, rule)
+        except Exception as e:
+            print(f"Process match handler error: {e}")
+            handled = False
+        if not handled:
+            self._retry[pid] = now + self.retry_interval
+
+    def _run(self):
+        print(f"🔍 Process monitoring active ({self.backend.name})")
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                # Event-driven backends block in scan until something happens; the others are polled
+                self.scan(self.interval if self.backend.event_driven else 0)
+            except Exception as e:
+                print(f"Process monitoring error: {e}")
+                if self._stop.wait(5):
+                    break
+            if not self.backend.event_driven:
+                self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
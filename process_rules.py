@@ -0,0 +1,331 @@
+"""
+Process rules for Exam Shield
+Rules come from the process_rules setting as a list of
+{"type": "name" | "path" | "cmdline" | "hash", "value": ..., "label": ...}
+and are compiled once per change into matchers that cost little more with
+ten thousand rules than with ten:
+
+    name     exact process name, one hash lookup
+    path     executable path or directory prefix, via a trie of path components
+    cmdline  regular expression searched in the joined command line; patterns
+             are indexed by the first three characters of a literal every
+             match must contain, so only candidates whose literal occurs in
+             the command line are tried; the few without one share a single
+             combined alternation, except those with groups (a \1 would
+             point at another pattern's group there), which are searched
+             one by one
+    hash     SHA-256 of the executable, so renaming a binary does not help;
+             each file is hashed once and cached by (path, size, mtime)
+
+Names and paths compare case-insensitively with / and \\ treated alike, as
+on Windows.
+"""
+
+import collections
+import hashlib
+import os
+import re
+import threading
+from config import Config
+
+RULE_TYPES = ("name", "path", "cmdline", "hash")
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+_ZERO_WIDTH = ("^", "\\A", "\\b", "\\B")
+_GRAM = 3
+
+Rule = collections.namedtuple("Rule", "type value label")
+
+def _path_parts(path):
+    return [part for part in path.replace("\\", "/").lower().split("/") if part]
+
+def _skip_class(pattern, i):
+    """Index just past the character class starting at pattern[i] == "[" """
+    i += 1
+    if pattern[i:i + 1] == "^":
+        i += 1
+    if pattern[i:i + 1] == "]":
+        i += 1
+    while i < len(pattern) and pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i + 1
+
+def _skip_group(pattern, i):
+    """Index just past the group starting at pattern[i] == "(" """
+    depth = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "[":
+            i = _skip_class(pattern, i)
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+def _skip_quantifier(pattern, i):
+    if pattern[i:i + 1] in ("?", "*", "+"):
+        i += 1
+    elif pattern[i:i + 1] == "{":
+        end = pattern.find("}", i)
+        i = end + 1 if end > 0 else i + 1
+    else:
+        return i
+    return i + 1 if pattern[i:i + 1] in ("?", "+") else i
+
+_OCTAL = "01234567"
+_GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+def scoped_flags(pattern):
+    """pattern with its leading global flags, as in (?i)evil, turned into a scoped group, (?i:evil), so it
+    can sit inside an alternation"""
+    flags = ""
+    match = _GLOBAL_FLAGS.match(pattern)
+    while match:
+        flags += match.group(1)
+        pattern = pattern[match.end():]
+        match = _GLOBAL_FLAGS.match(pattern)
+    # A verbose pattern may end in a # comment, which would swallow the closing parenthesis
+    end = "\n)" if "x" in flags else ")"
+    return f"(?{flags}:{pattern}{end}" if flags else f"(?:{pattern})"
+
+def _escape_end(pattern, i):
+    """Index just past the backslash escape starting at pattern[i] == "\\" """
+    c = pattern[i + 1:i + 2]
+    if c == "x":
+        return i + 4
+    if c == "u":
+        return i + 6
+    if c == "U":
+        return i + 10
+    if c == "N":
+        end = pattern.find("}", i)
+        return end + 1 if end > 0 else i + 2
+    if c == "0":
+        j = i + 2
+        while j < i + 4 and pattern[j:j + 1] and pattern[j] in _OCTAL:
+            j += 1
+        return j
+    if c.isdigit():
+        # Three octal digits are a character (\141); otherwise one or two digits are a group reference
+        if len(pattern) >= i + 4 and all(d in _OCTAL for d in pattern[i + 1:i + 4]):
+            return i + 4
+        return i + 3 if pattern[i + 2:i + 3].isdigit() else i + 2
+    return i + 2
+
+def required_literal(pattern):
+    """(text, at_start): the longest literal, lowercased, that every match of pattern contains and
+    whether matches begin with it; ("", False) when there is nothing to index on"""
+    if pattern.startswith("(?") and not pattern.startswith(("(?:", "(?P", "(?=", "(?!", "(?<")):
+        return "", False  # inline flags such as (?x) change what counts as a literal
+    runs = [("", False)]
+    run, run_at_start, consumed, i = "", False, False, 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "|":
+            return "", False
+        if c == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum() and pattern[i + 1].isascii():
+            literal, step = pattern[i + 1], 2
+        elif c not in "\\.^$*+?{}[]()|" and c.isascii():
+            literal, step = c, 1
+        else:
+            # Any other escape (\d, \x61, \141, \N{...}, a backreference) ends the run, digits and all
+            literal, step = None, _escape_end(pattern, i) - i if c == "\\" else 1
+        following = pattern[i + step:i + step + 1]
+        if literal is not None and following not in ("?", "*", "{"):
+            if not run:
+                run_at_start = not consumed
+            run += literal.translate(_ASCII_LOWER)
+            consumed = True
+            i += step
+            if following != "+":
+                continue
+            i = _skip_quantifier(pattern, i)
+        else:
+            if c == "[":
+                i = _skip_class(pattern, i)
+            elif c == "(":
+                i = _skip_group(pattern, i)
+            else:
+                i += step
+            # Zero-width anchors before the first literal still let it start every match
+            if pattern[i - step:i] not in _ZERO_WIDTH or c in "[(":
+                consumed = True
+            i = _skip_quantifier(pattern, i)
+        runs.append((run, run_at_start))
+        run = ""
+    runs.append((run, run_at_start))
+    return max(runs, key=lambda item: (len(item[0]), item[1]))
+
+class ExecutableHashes:
+    """SHA-256 of executables, cached by path and invalidated when the size or mtime changes"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or Config.PROCESS_HASH_CACHE
+        self.hashed = 0
+        self.hits = 0
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Hex digest of the file at path, or None if it cannot be read"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == key:
+                self._cache.move_to_end(path)
+                self.hits += 1
+                return cached[1]
+        digest = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        digest = digest.hexdigest()
+        with self._lock:
+            self.hashed += 1
+            self._cache[path] = (key, digest)
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return digest
+
+# Shared by every compiled rule set and the terminator, so each binary is hashed once
+executable_hashes = ExecutableHashes()
+
+class ProcessRules:
+    def __init__(self, rules=(), hashes=None):
+        """Compile rules (dicts or Rule tuples); invalid ones are reported and skipped"""
+        self.hashes = executable_hashes if hashes is None else hashes
+        self.rules = []
+        self._names = {}
+        self._paths = {}
+        self._hashes = {}
+        self._grams = {}     # first three characters of a required literal -> [(compiled, rule, at_start)]
+        self._general = []   # cmdline patterns without a usable literal
+        self._general_any = None
+        self._general_alone = []  # those with groups: combined, \1 would point at another pattern's group
+        for rule in rules:
+            rule = self._rule(rule)
+            if rule is None:
+                continue
+            if rule.type == "name":
+                self._names.setdefault(rule.value.lower(), rule)
+            elif rule.type == "path":
+                node = self._paths
+                for part in _path_parts(rule.value):
+                    node = node.setdefault(part, {})
+                node.setdefault(None, rule)
+            elif rule.type == "hash":
+                self._hashes.setdefault(rule.value.lower(), rule)
+            else:
+                try:
+                    compiled = re.compile(rule.value, re.IGNORECASE)
+                except (re.error, OverflowError, RecursionError) as e:
+                    print(f"Skipping process rule {rule.value!r}: {e}")
+                    continue
+                literal, at_start = required_literal(rule.value)
+                if len(literal) >= _GRAM:
+                    self._grams.setdefault(literal[:_GRAM], []).append((compiled, rule, at_start))
+                else:
+                    self._general.append((compiled, rule))
+                    if compiled.groups:
+                        self._general_alone.append((compiled, rule))
+            self.rules.append(rule)
+        if len(self._general) > len(self._general_alone):
+            # Only patterns without groups, so no backreference is renumbered; non-capturing on purpose too:
+            # re saves every group's marks per alternative tried, which makes a search with thousands of
+            # groups quadratic
+            try:
+                self._general_any = re.compile("|".join(scoped_flags(compiled.pattern)
+                                                        for compiled, _ in self._general if not compiled.groups),
+                                               re.IGNORECASE)
+            except (re.error, OverflowError, RecursionError) as e:
+                # Still correct without it, only slower: each pattern is then searched on its own
+                print(f"Process rule patterns could not be combined ({e}); searching them one by one")
+        # What the monitor has to read from each process, beyond its name
+        self.needs_exe = bool(self._paths or self._hashes)
+        self.needs_cmdline = bool(self._grams or self._general)
+
+    @classmethod
+    def from_settings(cls, rules, names=(), hashes=None):
+        """Rules from the process_rules setting plus plain names from suspicious_processes"""
+        return cls(list(rules or ()) + [Rule("name", name, None) for name in names or ()], hashes)
+
+    def __len__(self):
+        return len(self.rules)
+
+    @staticmethod
+    def _rule(rule):
+        if isinstance(rule, dict):
+            rule = Rule(rule.get("type"), rule.get("value"), rule.get("label"))
+        if rule.type not in RULE_TYPES or not isinstance(rule.value, str) or not rule.value:
+            print(f"Skipping invalid process rule: {rule}")
+            return None
+        if rule.type == "hash" and not re.fullmatch(r"[0-9a-fA-F]{64}", rule.value):
+            print(f"Skipping process rule with a malformed SHA-256: {rule.value}")
+            return None
+        return rule
+
+    def match(self, name, exe=None, cmdline=None):
+        """First matching rule for a process, cheapest matchers first; None if nothing matches"""
+        rule = self._names.get((name or "").lower())
+        if rule is not None:
+            return rule
+        if exe and self._paths:
+            node = self._paths
+            for part in _path_parts(exe):
+                node = node.get(part)
+                if node is None:
+                    break
+                if None in node:
+                    return node[None]
+        if cmdline and self.needs_cmdline:
+            rule = self._match_cmdline(" ".join(cmdline))
+            if rule is not None:
+                return rule
+        if exe and self._hashes:
+            digest = self.hashes.get(exe)
+            if digest is not None:
+                return self._hashes.get(digest)
+        return None
+
+    def _match_cmdline(self, text):
+        if self._grams:
+            lowered = text.translate(_ASCII_LOWER)
+            grams = self._grams
+            searched = set()
+            for pos in range(len(lowered) - _GRAM + 1):
+                candidates = grams.get(lowered[pos:pos + _GRAM])
+                if candidates:
+                    for compiled, rule, at_start in candidates:
+                        if at_start:
+                            if compiled.match(text, pos):
+                                return rule
+                        elif compiled not in searched:
+                            # The literal is somewhere inside the match; one search settles it
+                            searched.add(compiled)
+                            if compiled.search(text):
+                                return rule
+        if self._general:
+            if self._general_any is None or self._general_any.search(text):
+                candidates = self._general
+            else:
+                # None of the combined patterns matches, so the first match can only be one of the rest
+                candidates = self._general_alone
+            for compiled, rule in candidates:
+                if compiled.search(text):
+                    return rule
+        return None
@@ -0,0 +1,287 @@
+"""
+Process termination for Exam Shield
+Matched processes are handed to ProcessTerminator, which kills them on its
+own thread so the monitor keeps watching while it waits:
+
+- the whole tree goes: each process with all of its descendants
+- everything found in one pass is terminated together, then psutil.wait_procs
+  gives it the grace period and whatever is still alive is killed, so exit
+  is confirmed rather than assumed (zombies count as exited: a parent that
+  never collects them would otherwise hold up the whole batch)
+- kills are counted per parent; a launcher that keeps respawning a blocked
+  tool is killed too, unless it is one of Config.PROCESS_PROTECTED_PARENTS
+  or Exam Shield itself
+- the executable of a process killed by a name, path or hash rule is banned
+  by SHA-256 for a short while, so a renamed copy dies as soon as the monitor
+  sees it (command-line matches are not banned, nor name matches whose
+  executable has another name, like a script named after its shebang: that
+  would ban the interpreter running the script)
+
+Survivors (access denied, usually) are reported once and retried up to
+Config.PROCESS_KILL_ATTEMPTS times, the wait doubling from
+Config.PROCESS_RETRY_INTERVAL each time.
+"""
+
+import collections
+import os
+import queue
+import threading
+import time
+import psutil
+from config import Config
+from process_rules import Rule, executable_hashes
+
+def _stem(path):
+    name = os.path.basename(path.replace("\\", "/")).lower()
+    return name[:-4] if name.endswith(".exe") else name
+
+def _running(procs):
+    """Drop zombies: they have exited and only wait for their parent to collect them"""
+    running = []
+    for proc in procs:
+        try:
+            if proc.status() != psutil.STATUS_ZOMBIE:
+                running.append(proc)
+        except psutil.NoSuchProcess:
+            pass
+    return running
+
+class BannedExecutables:
+    """SHA-256 digests of recently killed executables, each expiring after ttl seconds"""
+
+    def __init__(self, hashes=None, ttl=None):
+        self.hashes = executable_hashes if hashes is None else hashes
+        self.ttl = Config.PROCESS_BAN_SECONDS if ttl is None else ttl
+        self._digests = {}   # digest -> (Rule, monotonic expiry)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        now = time.monotonic()
+        with self._lock:
+            for digest in [d for d, (_, expires) in self._digests.items() if expires <= now]:
+                del self._digests[digest]
+            return len(self._digests)
+
+    def add(self, exe, label):
+        digest = self.hashes.get(exe) if exe else None
+        if digest is None:
+            return None
+        with self._lock:
+            self._digests[digest] = (Rule("hash", digest, label), time.monotonic() + self.ttl)
+        return digest
+
+    def match(self, exe):
+        """The ban covering the executable at exe, or None"""
+        if not self._digests or not exe:
+            return None
+        digest = self.hashes.get(exe)
+        with self._lock:
+            entry = self._digests.get(digest)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._digests[digest]
+                return None
+            return entry[0]
+
+class ProcessTerminator:
+    def __init__(self, logger=None, timeout=None, retry_interval=None):
+        self.logger = logger
+        self.timeout = Config.PROCESS_KILL_TIMEOUT if timeout is None else timeout
+        self.retry_interval = Config.PROCESS_RETRY_INTERVAL if retry_interval is None else retry_interval
+        self.banned = BannedExecutables()
+        self.terminated = 0   # processes confirmed gone after terminate()
+        self.killed = 0       # processes that needed kill()
+        self.survived = 0     # processes still alive after kill()
+        self.batches = 0
+        self._offences = {}   # (parent pid, parent create time) -> deque of kill times
+        self._protected = self._own_ancestry()
+        self._queue = queue.Queue()
+        self._retry = []      # (monotonic due time, process, name, rule)
+        self._attempts = {}   # (pid, create time) -> kills it has survived
+        self._thread = threading.Thread(target=self._run, name="ProcessTerminator", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _own_ancestry():
+        """Exam Shield and the processes it was started from are never killed"""
+        try:
+            return {os.getpid()} | {parent.pid for parent in psutil.Process().parents()}
+        except psutil.Error:
+            return {os.getpid()}
+
+    def submit(self, process, name, rule):
+        """Queue a matched process for termination; returns True once it is queued"""
+        self._queue.put((process, name, rule))
+        return True
+
+    def stop(self, timeout=5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"batches": self.batches, "terminated": self.terminated, "killed": self.killed,
+                "survived": self.survived, "banned": len(self.banned), "retrying": len(self._retry)}
+
+    def _run(self):
+        while True:
+            wait = max(0.0, self._retry[0][0] - time.monotonic()) if self._retry else None
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            batch = [item] if item else []
+            stopping = False
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            now = time.monotonic()
+            while self._retry and self._retry[0][0] <= now:
+                batch.append(self._retry.pop(0)[1:])
+            if batch:
+                try:
+                    self.terminate(batch)
+                except Exception as e:
+                    print(f"Process termination error: {e}")
+            if stopping:
+                break
+
+    def terminate(self, batch):
+        """Kill the trees of every (process, name, rule) in batch together and confirm they exited;
+        returns the processes still alive"""
+        targets, roots, bans = {}, [], []
+        for process, name, rule in batch:
+            if process.pid in self._protected:
+                print(f"⚠️ Not terminating {name} (pid {process.pid}): Exam Shield runs inside it")
+                continue
+            # Read before the kill: a dead process has no parent, children or executable left to read
+            try:
+                parent = process.parent()
+                tree = [child for child in process.children(recursive=True) if child.pid not in self._protected]
+            except psutil.NoSuchProcess:
+                continue
+            except psutil.AccessDenied:
+                parent, tree = None, []
+            if rule.type in ("name", "path", "hash"):
+                try:
+                    exe = process.exe()
+                except psutil.Error:
+                    exe = None
+                # A name rule bans only the binary of that name, never the interpreter of a script
+                if exe and (rule.type != "name" or _stem(exe) == _stem(name or "")):
+                    bans.append((exe, name))
+            roots.append((process, name, rule, parent, len(tree), self._key(process)))
+            targets.setdefault(process.pid, process)
+            for child in tree:
+                targets.setdefault(child.pid, child)
+        if not targets:
+            return []
+        self.batches += 1
+        procs = list(targets.values())
+        for proc in procs:
+            try:
+                proc.terminate()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        # Hashing can take a moment for a large binary, so it waits until the signals are out
+        for exe, name in bans:
+            self.banned.add(exe, f"relaunch of {name}")
+        alive = self._wait(procs)
+        self.terminated += len(procs) - len(alive)
+        forced = {proc.pid for proc in alive}
+        if alive:
+            for proc in alive:
+                try:
+                    proc.kill()
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+            forced_count = len(alive)
+            alive = self._wait(alive)
+            self.killed += forced_count - len(alive)
+            self.survived += len(alive)
+        survivors = {proc.pid for proc in alive}
+        now = time.monotonic()
+        for process, name, rule, parent, children, key in roots:
+            if process.pid not in survivors:
+                self._attempts.pop(key, None)
+            self._report(process, name, rule, children, process.pid in forced, process.pid in survivors, now, key)
+            if process.pid not in survivors and parent is not None:
+                self._count_offence(parent, name, now)
+        return alive
+
+    def _wait(self, procs):
+        """psutil.wait_procs for up to timeout, in short slices so zombies (exited, but their parent has not
+        collected them) count as gone straight away; returns what is still running"""
+        deadline = time.monotonic() + self.timeout
+        alive = procs
+        while alive:
+            remaining = deadline - time.monotonic()
+            alive = _running(psutil.wait_procs(alive, timeout=max(0.0, min(0.05, remaining)))[1])
+            if remaining <= 0.05:
+                break
+        return alive
+
+    def _report(self, process, name, rule, children, forced, survived, now, key):
+        tree = f"{name} (pid {process.pid})" + (f" and {children} child processes" if children else "")
+        if survived:
+            attempts = self._attempts[key] = self._attempts.get(key, 0) + 1
+            limit = Config.PROCESS_KILL_ATTEMPTS
+            if attempts == 1:
+                print(f"❌ Could not terminate {tree}; retrying up to {limit} times")
+                self._log("SUSPICIOUS_PROCESS_SURVIVED", f"Could not terminate {tree}", blocked=False)
+            if attempts < limit:
+                self._retry.append((now + self.retry_interval * 2 ** (attempts - 1), process, name, rule))
+                self._retry.sort(key=lambda item: item[0])
+            elif attempts == limit:
+                print(f"❌ Giving up on {tree} after {limit} attempts")
+            return
+        how = "killed after ignoring terminate" if forced else "terminated"
+        print(f"🚫 Terminated suspicious process tree: {tree}")
+        self._log("PROCESS_TERMINATED", f"{tree} {how}", blocked=True)
+
+    @staticmethod
+    def _key(process):
+        try:
+            return process.pid, process.create_time()
+        except psutil.Error:
+            return process.pid, None
+
+    def _count_offence(self, parent, name, now):
+        """Count a kill against the parent; a parent that keeps relaunching blocked tools goes next"""
+        try:
+            key = (parent.pid, parent.create_time())
+            parent_name = parent.name()
+        except psutil.Error:
+            return
+        window = Config.PROCESS_REPEAT_WINDOW
+        for stale in [k for k, times in self._offences.items() if not times or times[-1] < now - window]:
+            del self._offences[stale]
+        kills = self._offences.setdefault(key, collections.deque())
+        kills.append(now)
+        while kills[0] < now - window:
+            kills.popleft()
+        if len(kills) < Config.PROCESS_REPEAT_LIMIT:
+            return
+        details = f"{parent_name} (pid {parent.pid}) launched {name} {len(kills)} times in {window:.0f}s"
+        kills.clear()
+        protected = {entry.lower() for entry in Config.PROCESS_PROTECTED_PARENTS}
+        if parent.pid in self._protected or parent.pid <= 1 or parent_name.lower() in protected:
+            self._log("SUSPICIOUS_PROCESS_PARENT", f"{details}; protected, left running", blocked=False)
+            return
+        self._log("SUSPICIOUS_PROCESS_PARENT", f"{details}; terminating it", blocked=True)
+        self.submit(parent, parent_name, Rule("parent", parent_name, f"relaunched {name}"))
+
+    def _log(self, action, details, blocked):
+        if self.logger:
+            try:
+                self.logger.log_activity(action, details, blocked=blocked)
+            except Exception as e:
+                print(f"Process termination log error: {e}")
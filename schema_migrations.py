@@ -0,0 +1,179 @@
+"""
+Schema migrations for Exam Shield
+The schema version is kept in PRAGMA user_version. Opening a current database
+costs that one pragma read; otherwise each pending migration runs in its own
+transaction together with the version bump. Migrations are idempotent, so
+databases created before versioning (user_version 0) simply run all of them.
+
+Partition indexes and search indexes touched by a migration are queued in
+log_partition_rebuilds and built one partition per transaction afterwards,
+so upgrading a large database does not hold the writer for minutes.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from config import Config
+
+def _core_tables(db, conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'admin',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS exam_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_name TEXT NOT NULL,
+            admin_id INTEGER,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            status TEXT DEFAULT 'inactive',
+            restrictions TEXT,
+            FOREIGN KEY (admin_id) REFERENCES users(id)
+        )
+    ''')
+    if conn.execute("SELECT 1 FROM users WHERE role = 'admin' LIMIT 1").fetchone() is None:
+        password_hash = hashlib.sha256(Config.DEFAULT_ADMIN_PASSWORD.encode()).hexdigest()
+        conn.execute("INSERT OR IGNORE INTO users (username, password_hash, role) VALUES (?, ?, 'admin')",
+                     (Config.DEFAULT_ADMIN_USERNAME, password_hash))
+        print("Default admin created successfully")
+
+def _day_partitions(db, conn):
+    db.partitions.create_catalog(conn)
+    db.partitions.migrate_legacy_table(conn)
+    db.partitions.refresh_view(conn)
+
+def _interned_partitions(db, conn):
+    if db.partitions.compact_partitions(conn):
+        db.partitions.refresh_view(conn)
+
+def _source_hosts(db, conn):
+    if "source_host" not in {row[1] for row in conn.execute("PRAGMA table_info(exam_sessions)")}:
+        conn.execute("ALTER TABLE exam_sessions ADD COLUMN source_host TEXT")
+    if db.partitions.add_host_ids(conn):
+        db.partitions.refresh_view(conn)
+
+def _rollups(db, conn):
+    db.rollups.setup(conn, db.partitions)
+
+def _merge_sources(db, conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS merge_sources (
+            source_host TEXT NOT NULL,
+            source_name TEXT NOT NULL,
+            last_source_id INTEGER NOT NULL DEFAULT 0,
+            rows INTEGER NOT NULL DEFAULT 0,
+            merged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source_host, source_name)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS exam_sessions_source "
+                 "ON exam_sessions (source_host, session_name, start_time)")
+
+def _session_tagging(db, conn):
+    if db.partitions.add_session_ids(conn):
+        db.partitions.refresh_view(conn)
+    db.sessions.setup(conn)
+
+def _event_counts(db, conn):
+    if db.partitions.add_event_counts(conn):
+        db.partitions.refresh_view(conn)
+
+def _event_classification(db, conn):
+    if db.partitions.add_classification(conn):
+        db.partitions.refresh_view(conn)
+    db.rollups.add_severity(conn)
+
+# (version, description, migrate(db, conn)); append only, never renumber
+MIGRATIONS = (
+    (1, "users, settings and exam sessions", _core_tables),
+    (2, "day-partitioned activity logs", _day_partitions),
+    (3, "interned partition layout", _interned_partitions),
+    (4, "source host columns", _source_hosts),
+    (5, "per-minute and per-hour rollups", _rollups),
+    (6, "workstation merge bookkeeping", _merge_sources),
+    (7, "exam session tagging and summaries", _session_tagging),
+    (8, "coalesced event counts", _event_counts),
+    (9, "stored severity, category and epoch", _event_classification),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+class SchemaMigrator:
+    def __init__(self, db):
+        self.db = db
+
+    def version(self):
+        with self.db.pool.writer() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self, progress=None):
+        """Apply every pending migration; returns the versions applied.
+
+        progress(version, description) is called before each one. A database newer than this
+        code is left alone.
+        """
+        applied = []
+        for version, description, func in MIGRATIONS:
+            with self.db.pool.writer() as conn:
+                # Take the write lock before re-checking, in case another process is migrating too
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    continue
+                if progress:
+                    progress(version, description)
+                try:
+                    func(self.db, conn)
+                except BaseException:
+                    self.db.partitions.invalidate()
+                    raise
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+            applied.append(version)
+        return applied
+
+    def build_indexes(self, stop=None, pause=0.05):
+        """Build queued partition indexes one partition per transaction; returns the tables built.
+
+        The writer lock is released for `pause` seconds between partitions so logging carries on.
+        """
+        built = []
+        while stop is None or not stop.is_set():
+            with self.db.pool.writer() as conn:
+                tables = self.db.partitions.rebuild_indexes(conn, limit=1)
+            if not tables:
+                break
+            built += tables
+            time.sleep(pause)
+        return built
+
+    def start_index_builds(self):
+        """Run build_indexes() on a background thread if anything is queued; returns the stop Event"""
+        with self.db.pool.writer() as conn:
+            if not self.db.partitions.pending_rebuilds(conn):
+                return None
+        stop = threading.Event()
+
+        def run():
+            try:
+                start = time.perf_counter()
+                built = self.build_indexes(stop)
+                if built:
+                    print(f"Rebuilt indexes of {len(built)} log partition(s) in {time.perf_counter() - start:.1f}s")
+            except sqlite3.Error as e:
+                print(f"Index build error: {e}")
+
+        threading.Thread(target=run, name="IndexBuilder", daemon=True).start()
+        return stop
@@ -3,26 +3,45 @@ Security Manager for Exam Shield - FINALIZE TOGGLES IN CLASS
 This update adds toggle_* methods directly into the SecurityManager class
 """
 import keyboard
-import threading
-import time
 import psutil
+import sys
 from config import Config
 from mouse_manager import MouseManager
 from network_manager import NetworkManager
+from process_allowlist import ProcessAllowlist
+from process_backends import create_backend
+from process_monitor import ProcessMonitor
+from process_rules import ProcessRules
+from process_terminator import ProcessTerminator
 from window_manager import WindowManager
 
 class SecurityManager:
+    DEFAULT_SUSPICIOUS_PROCESSES = (['taskmgr.exe', 'cmd.exe', 'powershell.exe', 'regedit.exe', 'msconfig.exe']
+                                    if sys.platform == 'win32' else
+                                    ['gnome-terminal-server', 'konsole', 'xterm', 'xfce4-terminal', 'gnome-system-monitor'])
+
     def __init__(self, db_manager):
         self.db_manager = db_manager
         self.is_exam_mode = False
-        self.blocked_keys = Config.BLOCKED_KEYS.copy()
-        self.monitoring_thread = None
+        self.blocked_keys = db_manager.get_setting('blocked_keys', Config.BLOCKED_KEYS.copy())
+        self.process_monitor = None
+        self.process_terminator = None
+        self.process_allowlist = None
         self.hooks_active = False
-        self.selective_blocking = Config.SELECTIVE_BLOCKING.copy()
+        self.selective_blocking = {**Config.SELECTIVE_BLOCKING, **db_manager.get_setting('selective_blocking', {})}
+        self.suspicious_processes = db_manager.get_setting('suspicious_processes', self.DEFAULT_SUSPICIOUS_PROCESSES.copy())
+        self.process_rules = db_manager.get_setting('process_rules', [])
+        self.process_allowlist_entries = db_manager.get_setting('process_allowlist', [])
+        db_manager.subscribe_setting(self._on_blocked_keys_changed, 'blocked_keys')
+        db_manager.subscribe_setting(self._on_selective_blocking_changed, 'selective_blocking')
+        db_manager.subscribe_setting(self._on_suspicious_processes_changed, 'suspicious_processes')
+        db_manager.subscribe_setting(self._on_process_rules_changed, 'process_rules')
+        db_manager.subscribe_setting(self._on_process_allowlist_changed, 'process_allowlist')
         self.mouse_manager = MouseManager(logger=db_manager)
         self.network_manager = NetworkManager(db_manager)
         self.window_manager = WindowManager(logger=db_manager)
         self.admin_panel = None
+        self.last_session_report = None
         print("✅ Security Manager initialized with all components")
     
     def set_admin_panel(self, admin_panel):
@@ -55,6 +74,8 @@ class SecurityManager:
         self.is_exam_mode = True
         if selective_options:
             self.selective_blocking.update(selective_options)
+        # Open the session first so everything the components log below is tagged with it
+        self.db_manager.start_exam_session(restrictions=self.selective_blocking)
         print(f"🔒 Starting selective exam mode with options: {selective_options}")
         if self.selective_blocking.get('keyboard', True):
             print("🔤 Activating keyboard blocking..."); self.setup_keyboard_hooks()
@@ -90,8 +111,43 @@ class SecurityManager:
         try: self.window_manager.stop_window_protection()
         except Exception as e: print(f"Error stopping window protection: {e}")
         self.db_manager.log_activity("EXAM_MODE_STOP", "All security restrictions deactivated")
+        self.last_session_report = self.db_manager.end_exam_session()
         print("🔓 Full exam mode deactivated - All restrictions removed")
 
+    def _on_blocked_keys_changed(self, key, value):
+        self.blocked_keys = value if value is not None else Config.BLOCKED_KEYS.copy()
+        if self.hooks_active:
+            # Re-register so removed combos stop being suppressed as well
+            self.remove_keyboard_hooks(); self.setup_keyboard_hooks()
+
+    def _on_selective_blocking_changed(self, key, value):
+        # Applies from the next start_exam_mode; running components are left as they are
+        self.selective_blocking = {**Config.SELECTIVE_BLOCKING, **(value or {})}
+
+    def _on_suspicious_processes_changed(self, key, value):
+        self.suspicious_processes = value if value is not None else self.DEFAULT_SUSPICIOUS_PROCESSES.copy()
+        self._reload_process_rules()
+
+    def _on_process_rules_changed(self, key, value):
+        self.process_rules = value or []
+        self._reload_process_rules()
+
+    def _on_process_allowlist_changed(self, key, value):
+        self.process_allowlist_entries = value or []
+        if self.process_allowlist:
+            # The baseline taken at start_exam_mode is kept; only the configured entries change
+            self.process_allowlist = self.process_allowlist.with_entries(self.process_allowlist_entries)
+        self._reload_process_rules()
+
+    def _compile_process_rules(self):
+        rules = ProcessRules.from_settings(self.process_rules, self.suspicious_processes)
+        return self.process_allowlist.with_blocked(rules) if self.process_allowlist else rules
+
+    def _reload_process_rules(self):
+        # Recompiled and swapped into the running monitor; lockdown carries on uninterrupted
+        if self.process_monitor:
+            self.process_monitor.set_rules(self._compile_process_rules())
+
     def setup_keyboard_hooks(self):
         try:
             for key_combo in self.blocked_keys:
@@ -119,39 +175,47 @@ class SecurityManager:
             except Exception as e: print(f"❌ Error showing admin panel: {e}")
 
     def start_process_monitoring(self):
-        if self.monitoring_thread and self.monitoring_thread.is_alive(): return
-        self.monitoring_thread = threading.Thread(target=self._monitor_processes, daemon=True); self.monitoring_thread.start(); print("✅ Process monitoring started")
+        if self.process_monitor and self.process_monitor.is_running: return
+        self.process_terminator = ProcessTerminator(logger=self.db_manager)
+        backend, interval = create_backend(), None
+        # Read at each start, like selective_blocking: allowlist mode seeds from what is running right now
+        if self.db_manager.get_setting('process_mode', Config.PROCESS_MODE) == 'allowlist':
+            self.process_allowlist = ProcessAllowlist.from_baseline(
+                backend, self.process_allowlist_entries, logger=self.db_manager)
+            # An unknown program is refused as it appears: event-driven backends see it at exec, the others
+            # are polled faster
+            if not backend.event_driven: interval = Config.PROCESS_ALLOWLIST_SCAN_INTERVAL
+        self.process_monitor = ProcessMonitor(self._compile_process_rules(), self._on_suspicious_process,
+                                              interval=interval, backend=backend,
+                                              banned=self.process_terminator.banned)
+        self.process_monitor.start(); print("✅ Process monitoring started")
 
     def stop_process_monitoring(self):
-        if self.monitoring_thread: self.monitoring_thread = None; print("✅ Process monitoring stopped")
+        if self.process_monitor:
+            self.process_monitor.stop(); self.process_monitor = None; print("✅ Process monitoring stopped")
+        if self.process_terminator:
+            self.process_terminator.stop(); self.process_terminator = None
+        self.process_allowlist = None
 
-    def _monitor_processes(self):
-        suspicious_processes = ['taskmgr.exe', 'cmd.exe', 'powershell.exe', 'regedit.exe', 'msconfig.exe']
-        print("🔍 Process monitoring active")
-        while self.is_exam_mode and self.monitoring_thread:
-            try:
-                for process in psutil.process_iter(['pid', 'name']):
-                    try:
-                        if process.info['name'].lower() in suspicious_processes:
-                            self.db_manager.log_activity("SUSPICIOUS_PROCESS", f"Detected: {process.info['name']}", blocked=True)
-                            try: process.terminate(); print(f"🚫 Terminated suspicious process: {process.info['name']}")
-                            except: pass
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        continue
-                time.sleep(2)
-            except Exception as e:
-                print(f"Process monitoring error: {e}"); time.sleep(5)
+    def _on_suspicious_process(self, process, name, rule):
+        if rule.type == "allowlist":
+            if self.process_allowlist and self.process_allowlist.started_by_shield(process):
+                return True
+            details = f"Not on the allowlist: {name} ({rule.value})"
+        else:
+            details = f"Detected: {name}" if rule.type == "name" else f"Detected: {name} ({rule.type} rule: {rule.label or rule.value})"
+        self.db_manager.log_activity("SUSPICIOUS_PROCESS", details, blocked=True)
+        # Killed with its children on the terminator's thread, which also confirms the exit and retries
+        return self.process_terminator.submit(process, name, rule)
 
     def add_blocked_key(self, key_combo):
+        # Persisted; _on_blocked_keys_changed applies it to the live hooks
         if key_combo not in self.blocked_keys:
-            self.blocked_keys.append(key_combo)
-            if self.hooks_active:
-                try: keyboard.add_hotkey(key_combo, self.block_key_action, args=(key_combo,), suppress=True); print(f"✅ Added blocked key: {key_combo}")
-                except Exception as e: print(f"❌ Error adding key {key_combo}: {e}")
+            self.db_manager.save_setting('blocked_keys', self.blocked_keys + [key_combo]); print(f"✅ Added blocked key: {key_combo}")
 
     def remove_blocked_key(self, key_combo):
         if key_combo in self.blocked_keys:
-            self.blocked_keys.remove(key_combo); print(f"✅ Removed blocked key: {key_combo}")
+            self.db_manager.save_setting('blocked_keys', [k for k in self.blocked_keys if k != key_combo]); print(f"✅ Removed blocked key: {key_combo}")
 
     def get_system_info(self):
         try:
@@ -0,0 +1,110 @@
+"""
+Settings cache for Exam Shield
+The settings table is read once into memory; reads are dictionary lookups,
+writes go through to SQLite and then update the cache and notify listeners.
+Values are stored as JSON so lists and dicts round-trip with their types.
+"""
+
+import copy
+import json
+import threading
+
+_MISSING = object()
+
+def encode_value(value):
+    return json.dumps(value, separators=(",", ":"), sort_keys=True)
+
+def decode_value(text):
+    """JSON-decode a stored value; text written before values were JSON comes back unchanged"""
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return text
+
+def _detached(value):
+    """Copy lists and dicts so callers cannot mutate the cached value in place"""
+    return copy.deepcopy(value) if isinstance(value, (list, dict)) else value
+
+class SettingsCache:
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.RLock()
+        self._values = None
+        self._listeners = {}
+
+    def _loaded(self):
+        """The key -> value dictionary, loading the table on first use (call with the lock held)"""
+        if self._values is None:
+            rows = self.pool.reader().execute("SELECT key, value FROM settings").fetchall()
+            self._values = {key: decode_value(value) for key, value in rows}
+        return self._values
+
+    def get(self, key, default=None):
+        with self._lock:
+            return _detached(self._loaded().get(key, default))
+
+    def all(self):
+        with self._lock:
+            return _detached(self._loaded())
+
+    def set(self, key, value):
+        """Write one setting through to the database"""
+        self.update({key: value})
+
+    def update(self, values):
+        """Write several settings in one transaction, then notify listeners of the ones that changed"""
+        with self._lock:
+            current = self._loaded()
+            with self.pool.writer() as conn:
+                conn.executemany("INSERT OR REPLACE INTO settings (key, value, updated_at) "
+                                 "VALUES (?, ?, CURRENT_TIMESTAMP)",
+                                 [(key, encode_value(value)) for key, value in values.items()])
+            changed = {key: _detached(value) for key, value in values.items()
+                       if current.get(key, _MISSING) != value}
+            current.update({key: _detached(value) for key, value in values.items()})
+        self._notify(changed)
+
+    def delete(self, key):
+        with self._lock:
+            current = self._loaded()
+            with self.pool.writer() as conn:
+                conn.execute("DELETE FROM settings WHERE key=?", (key,))
+            existed = current.pop(key, _MISSING) is not _MISSING
+        if existed:
+            self._notify({key: None})
+
+    def reload(self):
+        """Re-read the table (e.g. after another process wrote to it) and notify any changes"""
+        with self._lock:
+            previous = self._values or {}
+            self._values = None
+            current = self._loaded()
+            changed = {key: value for key, value in current.items() if previous.get(key, _MISSING) != value}
+            changed.update({key: None for key in previous if key not in current})
+        self._notify(changed)
+
+    def subscribe(self, callback, key=None):
+        """Call callback(key, value) after `key` (or any key, when None) changes.
+
+        Callbacks run on the thread that saved the setting; value is None for a deleted key.
+        """
+        with self._lock:
+            listeners = self._listeners.setdefault(key, [])
+            if callback not in listeners:
+                listeners.append(callback)
+
+    def unsubscribe(self, callback, key=None):
+        with self._lock:
+            listeners = self._listeners.get(key, [])
+            if callback in listeners:
+                listeners.remove(callback)
+
+    def _notify(self, changed):
+        for key, value in changed.items():
+            with self._lock:
+                listeners = self._listeners.get(key, []) + self._listeners.get(None, [])
+            for callback in listeners:
+                try:
+                    callback(key, value)
+                except Exception as e:
+                    print(f"Settings listener error ({key}): {e}")
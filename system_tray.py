@@ -241,9 +241,8 @@ class SystemTray:
             
             if result['confirmed'] and result['password']:
                 import hashlib
-                from database_manager import DatabaseManager
                 
-                db_manager = DatabaseManager()
+                db_manager = self.security_manager.db_manager
                 password_hash = hashlib.sha256(result['password'].encode()).hexdigest()
                 
                 if db_manager.verify_admin("admin", password_hash):
@@ -342,15 +341,16 @@ class SystemTray:
             
             if result['confirmed'] and result['password']:
                 import hashlib
-                from database_manager import DatabaseManager
                 
-                db_manager = DatabaseManager()
+                db_manager = self.security_manager.db_manager
                 password_hash = hashlib.sha256(result['password'].encode()).hexdigest()
                 
                 if db_manager.verify_admin("admin", password_hash):
                     self.show_notification("Exam Shield Premium", 
                                          "Security system is shutting down...")
                     self.stop()
+                    db_manager.log_activity("APPLICATION_EXIT", "Exam Shield Premium closed from system tray")
+                    db_manager.close()
                     import sys
                     sys.exit(0)
                 else:
@@ -56,9 +56,25 @@ class WindowManager:
             'examsoft.exe', 'respondus.exe', 'proctorio.exe',
             'exam_shield.exe', 'python.exe', 'pythonw.exe'
         ]
+
+        # Admin overrides from the settings table, kept current by the settings listeners
+        if self.logger and hasattr(self.logger, 'subscribe_setting'):
+            self._on_config_changed('window_protection', self.logger.get_setting('window_protection', {}))
+            self._on_protected_processes_changed('protected_processes', self.logger.get_setting('protected_processes'))
+            self.logger.subscribe_setting(self._on_config_changed, 'window_protection')
+            self.logger.subscribe_setting(self._on_protected_processes_changed, 'protected_processes')
         
         print("✅ Window Manager initialized with conservative settings")
 
+    def _on_config_changed(self, key, value):
+        """Settings listener: merge protection options; the monitor loop reads self.config each cycle"""
+        if value:
+            self.config.update({k: v for k, v in value.items() if k in self.config})
+
+    def _on_protected_processes_changed(self, key, value):
+        if value:
+            self.protected_processes = [name.lower() for name in value]
+
     def start_window_protection(self, config=None):
         """Start window protection with improved error handling"""
         if self.is_active: